@@ -0,0 +1,138 @@
+from pathlib import Path
+
+import numpy as np
+
+FILES = {
+    "centroids": "ann_centroids.npy",
+    "offsets": "ann_offsets.npy",
+    "ids": "ann_ids.npy",
+    "vectors": "ann_vectors.npy",
+}
+
+
+class IVFIndex:
+    """
+    Inverted-file index for approximate cosine top-K over unit-length rows.
+
+    Spherical k-means splits the catalog into `nlist` clusters; the rows are
+    stored grouped by cluster (`vectors`, with their catalog indices in
+    `ids` and cluster boundaries in `offsets`). A query scores the
+    centroids, then scans only the `nprobe` closest clusters: more probes
+    means better recall and slower queries, nprobe == nlist is exact.
+
+    Saved as .npy files next to embeddings.npy in a model bundle and loaded
+    with mmap_mode="r" like the AssocMatrix, so workers share one copy.
+    """
+
+    def __init__(self, centroids, offsets, ids, vectors, nprobe=16):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, vectors, nlist=None, iterations=10, sample_per_list=32, nprobe=16, seed=0):
+        """
+        Cluster unit-length `vectors` (e.g. SimilarityEngine.vectors). nlist
+        defaults to about 4 * sqrt(n); k-means trains on a sample of
+        sample_per_list rows per cluster, then every row is assigned.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n = len(vectors)
+        nlist = max(1, min(nlist or int(round(4 * np.sqrt(n))), n))
+        rng = np.random.default_rng(seed)
+
+        train = vectors[rng.choice(n, size=min(n, nlist * sample_per_list), replace=False)]
+        centroids = train[rng.choice(len(train), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = _assign(train, centroids)
+            counts = np.bincount(assign, minlength=nlist)
+            sums = np.stack(
+                [np.bincount(assign, weights=train[:, j], minlength=nlist) for j in range(train.shape[1])], axis=1
+            )
+            empty = counts == 0
+            # empty clusters restart from random training rows
+            sums[empty] = train[rng.choice(len(train), size=int(empty.sum()), replace=False)]
+            centroids = _normalize(sums).astype(np.float32)
+
+        assign = _assign(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+        return cls(centroids, offsets, order.astype(np.int64), vectors[order], nprobe=nprobe)
+
+    def save(self, directory):
+        directory = Path(directory)
+        for attr, name in FILES.items():
+            np.save(directory / name, getattr(self, attr))
+
+    @classmethod
+    def exists(cls, directory):
+        directory = Path(directory)
+        return all((directory / name).exists() for name in FILES.values())
+
+    @classmethod
+    def load(cls, directory, mmap=True, nprobe=16):
+        directory = Path(directory)
+        mode = "r" if mmap else None
+        arrays = {attr: np.load(directory / name, mmap_mode=mode) for attr, name in FILES.items()}
+        return cls(**arrays, nprobe=nprobe)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @property
+    def nbytes(self):
+        return int(sum(getattr(self, attr).nbytes for attr in FILES))
+
+    @property
+    def is_mmap(self):
+        return isinstance(self.vectors, np.memmap)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, k, nprobe=None, exclude=None):
+        """
+        (catalog indices, cosine scores) of the approximate top `k` rows for a
+        unit-length `query`, best first. `exclude` is an index or list of
+        indices to leave out (e.g. the query item itself).
+        """
+        query = np.asarray(query, dtype=np.float32)
+        nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+        centroid_scores = self.centroids @ query
+        if nprobe < self.nlist:
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(self.nlist)
+
+        spans = [(self.offsets[c], self.offsets[c + 1]) for c in probe.tolist()]
+        ids = np.concatenate([self.ids[lo:hi] for lo, hi in spans])
+        scores = np.concatenate([self.vectors[lo:hi] for lo, hi in spans]) @ query
+        if exclude is not None:
+            keep = ~np.isin(ids, exclude)
+            ids, scores = ids[keep], scores[keep]
+        return _top_k(ids, scores, k)
+
+
+def _normalize(matrix):
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def _assign(vectors, centroids, chunk=8192):
+    """Index of the most similar centroid for each row, a chunk of rows at a time."""
+    out = np.empty(len(vectors), dtype=np.int64)
+    for lo in range(0, len(vectors), chunk):
+        out[lo:lo + chunk] = np.argmax(vectors[lo:lo + chunk] @ centroids.T, axis=1)
+    return out
+
+
+def _top_k(ids, scores, k):
+    if k <= 0:
+        return ids[:0], scores[:0]
+    if k < len(scores):
+        part = np.argpartition(-scores, k - 1)[:k]
+        ids, scores = ids[part], scores[part]
+    order = np.argsort(-scores, kind="stable")
+    return ids[order], scores[order]
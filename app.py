@@ -1,11 +1,41 @@
+import json
 import os
-from flask import Flask, jsonify, render_template, request
-from recommend import suggest_for_item, recent_purchase_for_customer, list_customers
-import pandas as pd
-from pathlib import Path
+from flask import Flask, Response, jsonify, render_template, request, send_file
+from artifacts import ArtifactsUnavailable
+from config import Config
+from recommend import (
+    PROFILE_FIELDS, artifact_store, customer_profile, list_customers, recent_purchase_for_customer, suggest_batch,
+    suggest_for_item,
+)
+import metrics
+import profiling
+from insights_batch import InsightStore, insights_inputs
 from openai_service import openai_service
+from response_cache import ResponseCache, cached
 
 app = Flask(__name__)
+metrics.init_app(app)
+profiling.init_app(app)
+response_cache = ResponseCache()
+insight_store = InsightStore()
+
+def model_version():
+    return artifact_store().version
+
+# most cart items a single /api/suggest_batch call may ask about
+MAX_BATCH_ITEMS = 100
+# k and merged_k of /api/suggest_batch are clamped to 1..MAX_SUGGEST_K
+MAX_SUGGEST_K = 50
+# invoice limit of /api/customer_profile is clamped to 1..MAX_PROFILE_INVOICES
+MAX_PROFILE_INVOICES = 20
+
+@app.errorhandler(ArtifactsUnavailable)
+def artifacts_unavailable(e):
+    """Artifacts are built offline (bootstrap.py); until then, ask clients to retry."""
+    response = jsonify({"error": "Recommendation data is not ready yet", "ready": False, "missing": e.missing})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(Config.ARTIFACT_RETRY_AFTER)
+    return response
 
 @app.route("/")
 def index():
@@ -23,71 +53,137 @@ def api_recent_purchase():
     return jsonify({"customer_id": customer_id, "recent_item": item})
 
 @app.route("/api/suggest")
+@cached(response_cache, "suggest", model_version)
 def api_suggest():
     item = request.args.get("item")
     top_k = int(request.args.get("k", "5"))
     suggestions = suggest_for_item(item, top_k=top_k)
     return jsonify({"item": item, "suggestions": suggestions})
 
+@app.route("/api/suggest_batch", methods=["POST"])
+def api_suggest_batch():
+    """Per-item suggestions for a cart plus one merged, de-duplicated ranking."""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Expected a JSON object body"}), 400
+    items = body.get("items")
+    if not isinstance(items, list) or not items or not all(isinstance(i, str) for i in items):
+        return jsonify({"error": "items must be a non-empty list of item names"}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({"error": f"At most {MAX_BATCH_ITEMS} items per request"}), 400
+    try:
+        top_k = int(body.get("k", 5))
+        merged_k = int(body.get("merged_k", top_k))
+    except (TypeError, ValueError):
+        return jsonify({"error": "k and merged_k must be integers"}), 400
+    top_k = min(max(top_k, 1), MAX_SUGGEST_K)
+    merged_k = min(max(merged_k, 1), MAX_SUGGEST_K)
+    return jsonify(suggest_batch(items, top_k=top_k, merged_k=merged_k))
+
 @app.route("/api/customer_history")
 def api_customer_history():
     customer_id = request.args.get("customer_id")
-    data_dir = Path(__file__).parent / "data"
-    purchases = pd.read_csv(data_dir / "purchases.csv")
-    df = purchases[purchases["customer_id"] == customer_id].sort_values("date")
-    return jsonify(df.to_dict(orient="records"))
+    return jsonify(artifact_store().customer_repo.history(customer_id))
 
 @app.route("/api/catalog_main")
+@cached(response_cache, "catalog_main", model_version)
 def api_catalog_main():
-    from pathlib import Path
-    import json
-    data_dir = Path(__file__).parent / "data"
-    main_path = data_dir / "main_products.json"
-    if main_path.exists():
-        items = json.loads(main_path.read_text())
-    else:
-        # fallback: derive from products.csv if json doesn't exist
-        import pandas as pd
-        all_items = pd.read_csv(data_dir / "products.csv")["item"].tolist()
-        items = [x for x in all_items if "Warranty" not in x and "Filter" not in x and "Kit" not in x and "Plan" not in x and "Cover" not in x and "Bag" not in x and "Blade" not in x and "Hose" not in x and "Nozzle" not in x]
-    return jsonify(items)
+    return jsonify(artifact_store().main_products)
 
 @app.route("/api/customer_details")
 def api_customer_details():
     cid = request.args.get("customer_id")
-    from pathlib import Path
-    import pandas as pd
-    data_dir = Path(__file__).parent / "data"
-    df = pd.read_csv(data_dir / "customers.csv")
-    row = df[df["customer_id"] == cid]
-    if row.empty:
+    r = artifact_store().customer_repo.details(cid)
+    if r is None:
         return jsonify({})
-    r = row.iloc[0].to_dict()
     return jsonify({"customer_id": r["customer_id"], "name": r["name"], "address": r["address"], "phone": r["phone"], "email": r["email"]})
 
 @app.route("/api/customer_invoices")
 def api_customer_invoices():
     cid = request.args.get("customer_id")
     limit = int(request.args.get("limit", "2"))
-    from pathlib import Path
-    import pandas as pd
-    data_dir = Path(__file__).parent / "data"
-    inv = pd.read_csv(data_dir / "invoices.csv")
-    items = pd.read_csv(data_dir / "invoice_items.csv")
-    merged = inv[inv["customer_id"] == cid].sort_values("date", ascending=False).head(limit)
-    out = []
-    for _, r in merged.iterrows():
-        its = items[items["invoice_id"] == r["invoice_id"]]["item"].tolist()
-        out.append({"invoice_id": r["invoice_id"], "date": r["date"], "items": its, "total": r["total"]})
-    return jsonify(out)
+    return jsonify(artifact_store().customer_repo.recent_invoices(cid, limit=limit))
 
 @app.route("/api/additional_recs")
+@cached(response_cache, "additional_recs", model_version, cache_control="private")
 def api_additional_recs():
     cid = request.args.get("customer_id")
     from recommend import additional_recommendations
     recs = additional_recommendations(cid, top_k=8)
     return jsonify({"customer_id": cid, "suggestions": recs})
 
+@app.route("/api/customer_profile")
+@cached(response_cache, "customer_profile", model_version, cache_control="private")
+def api_customer_profile():
+    """
+    details, invoices, history and additional_recs for one customer in one
+    call; `fields` (comma-separated) limits the response to those parts.
+    """
+    cid = request.args.get("customer_id")
+    if not cid:
+        return jsonify({"error": "customer_id is required"}), 400
+    fields = [f for f in request.args.get("fields", ",".join(PROFILE_FIELDS)).split(",") if f]
+    unknown = sorted(set(fields) - set(PROFILE_FIELDS))
+    if unknown:
+        return jsonify({"error": f"Unknown fields {unknown}; expected any of {list(PROFILE_FIELDS)}"}), 400
+    try:
+        limit = int(request.args.get("limit", "2"))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    limit = min(max(limit, 1), MAX_PROFILE_INVOICES)
+    profile = customer_profile(cid, fields=fields, invoice_limit=limit)
+    if profile is None:
+        return jsonify({"error": "Customer not found"}), 404
+    return jsonify(profile)
+
+def _async_requested():
+    return request.args.get("async") in ("1", "true")
+
+def _llm_response(payload):
+    """
+    202 while an LLM job is still running (the client repeats the same
+    request to poll), 503 with Retry-After when the call was shed because
+    the service is busy, 504 when it timed out.
+    """
+    response = jsonify(payload)
+    if payload.get("status") == "pending":
+        response.status_code = 202
+        response.headers["Retry-After"] = "1"
+    elif payload.get("reason") == "busy":
+        response.status_code = 503
+        response.headers["Retry-After"] = str(Config.LLM_RETRY_AFTER)
+    elif payload.get("reason") == "timeout":
+        response.status_code = 504
+    return response
+
+def _insights_inputs(customer_id):
+    """(customer, history, recent invoices) for the insights prompt, or None if unknown."""
+    return insights_inputs(artifact_store().customer_repo, customer_id)
+
+def _stored_insights(customer_id, inputs):
+    """
+    (fingerprint, stored result). The result is the precomputed insight
+    when it was generated for this exact history, else None.
+    """
+    fingerprint = openai_service.insights_fingerprint(*inputs)
+    return fingerprint, insight_store.get(customer_id, fingerprint)
+
+def _sse(events, done_extra=None):
+    """
+    Relay (event, data) pairs from OpenAIService.stream_* as Server-Sent
+    Events; `done_extra` is merged into the final "done" payload.
+    """
+    def generate():
+        for event, data in events:
+            if event == "done" and done_extra:
+                data = {**done_extra, **data}
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.route("/api/customer_insights")
 def api_customer_insights():
     """Generate AI-powered customer insights."""
@@ -96,38 +192,26 @@ def api_customer_insights():
         return jsonify({"error": "customer_id is required"}), 400
     
     try:
-        # Get customer data
-        data_dir = Path(__file__).parent / "data"
-        customers_df = pd.read_csv(data_dir / "customers.csv")
-        customer_row = customers_df[customers_df["customer_id"] == customer_id]
-        
-        if customer_row.empty:
+        inputs = _insights_inputs(customer_id)
+        if inputs is None:
             return jsonify({"error": "Customer not found"}), 404
-            
-        customer_data = customer_row.iloc[0].to_dict()
-        
-        # Get purchase history
-        purchases_df = pd.read_csv(data_dir / "purchases.csv")
-        purchase_history = purchases_df[purchases_df["customer_id"] == customer_id].sort_values("date").to_dict(orient="records")
+        customer_data, purchase_history, recent_invoices = inputs
         
-        # Get recent invoices
-        invoices_df = pd.read_csv(data_dir / "invoices.csv")
-        items_df = pd.read_csv(data_dir / "invoice_items.csv")
-        recent_invoices_df = invoices_df[invoices_df["customer_id"] == customer_id].sort_values("date", ascending=False).head(2)
+        # Served from the nightly batch while the customer's history is unchanged
+        fingerprint, stored = _stored_insights(customer_id, inputs)
+        if stored is not None:
+            return jsonify({**stored, "precomputed": True})
         
-        recent_invoices = []
-        for _, inv in recent_invoices_df.iterrows():
-            items = items_df[items_df["invoice_id"] == inv["invoice_id"]]["item"].tolist()
-            recent_invoices.append({
-                "date": inv["date"],
-                "items": items,
-                "total": inv["total"]
-            })
-        
-        # Generate insights using OpenAI
-        insights = openai_service.generate_customer_insights(customer_data, purchase_history, recent_invoices)
-        return jsonify(insights)
+        # Generate insights using OpenAI; with async=1 answer 202 + job_id until it is ready
+        insights = openai_service.generate_customer_insights(
+            customer_data, purchase_history, recent_invoices, wait=not _async_requested()
+        )
+        if insights.get("success"):
+            insight_store.put(customer_id, fingerprint, insights)
+        return _llm_response(insights)
         
+    except ArtifactsUnavailable:
+        raise
     except Exception as e:
         return jsonify({"error": f"Failed to generate insights: {str(e)}"}), 500
 
@@ -140,44 +224,118 @@ def api_recommendation_explanation():
         return jsonify({"error": "At least one product is required"}), 400
     
     try:
-        # Get recommendations for the selected products
-        all_recommendations = []
-        for product in selected_products:
-            recs = suggest_for_item(product, top_k=3)
-            if recs:
-                all_recommendations.extend(recs)
-        
-        # Remove duplicates and sort by score
-        seen = set()
-        unique_recs = []
-        for rec in all_recommendations:
-            if rec['item'] not in seen:
-                seen.add(rec['item'])
-                unique_recs.append(rec)
+        # Basket-level ranking across the selected products
+        top_recs = suggest_batch(selected_products, top_k=3, merged_k=5)["merged"]
         
-        unique_recs.sort(key=lambda x: x.get('score', 0), reverse=True)
-        top_recs = unique_recs[:5]
+        # Generate explanation using OpenAI; with async=1 answer 202 + job_id until it is ready
+        explanation = openai_service.generate_product_recommendations_explanation(
+            selected_products, top_recs, wait=not _async_requested()
+        )
         
-        # Generate explanation using OpenAI
-        explanation = openai_service.generate_product_recommendations_explanation(selected_products, top_recs)
-        
-        return jsonify({
+        return _llm_response({
             "selected_products": selected_products,
             "recommendations": top_recs,
             **explanation
         })
         
+    except ArtifactsUnavailable:
+        raise
     except Exception as e:
         return jsonify({"error": f"Failed to generate explanation: {str(e)}"}), 500
 
+@app.route("/api/customer_insights/stream")
+def api_customer_insights_stream():
+    """Customer insights as Server-Sent Events: "token" events, then "done" or "error"."""
+    customer_id = request.args.get("customer_id")
+    if not customer_id:
+        return jsonify({"error": "customer_id is required"}), 400
+    inputs = _insights_inputs(customer_id)
+    if inputs is None:
+        return jsonify({"error": "Customer not found"}), 404
+    fingerprint, stored = _stored_insights(customer_id, inputs)
+    if stored is not None:
+        return _sse(iter([("token", {"text": stored["insights"]}), ("done", {**stored, "precomputed": True})]))
+
+    def events():
+        for event, data in openai_service.stream_customer_insights(*inputs):
+            if event == "done" and data.get("success"):
+                insight_store.put(customer_id, fingerprint, data)
+            yield event, data
+    return _sse(events())
+
+@app.route("/api/recommendation_explanation/stream")
+def api_recommendation_explanation_stream():
+    """Recommendation explanation as Server-Sent Events; "done" also carries the recommendations."""
+    selected_products = request.args.getlist("products")
+    if not selected_products:
+        return jsonify({"error": "At least one product is required"}), 400
+    top_recs = suggest_batch(selected_products, top_k=3, merged_k=5)["merged"]
+    return _sse(
+        openai_service.stream_product_recommendations_explanation(selected_products, top_recs),
+        done_extra={"selected_products": selected_products, "recommendations": top_recs},
+    )
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Request and stage histograms, artifact and LLM counters in the Prometheus text format."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route("/api/admin/profiles")
+def api_admin_profiles():
+    """Stored request profiles, newest first (needs the profiling token)."""
+    if not profiling.authorized(request):
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(profiling.list_profiles())
+
+@app.route("/api/admin/profiles/<profile_id>")
+def api_admin_profile(profile_id):
+    """
+    One stored profile: the raw file (pstats dump or collapsed stacks), or
+    format=text for a cProfile's top functions.
+    """
+    if not profiling.authorized(request):
+        return jsonify({"error": "Not found"}), 404
+    path = profiling.find_profile(profile_id)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    if request.args.get("format") == "text" and path.suffix == ".prof":
+        return Response(profiling.pstats_text(path, sort=request.args.get("sort", "cumulative")), mimetype="text/plain")
+    return send_file(path, as_attachment=True, download_name=path.name)
+
+@app.route("/api/ready")
+def api_ready():
+    """Readiness probe: 200 once artifacts are loaded, 503 with Retry-After until then."""
+    store = artifact_store()
+    return jsonify({"ready": True, "backend": store.backend.describe(), "model_version": store.version})
+
+@app.route("/api/artifacts")
+def api_artifacts():
+    """Report where artifacts were loaded from and their in-memory size."""
+    store = artifact_store()
+    return jsonify({
+        "backend": store.backend.describe(),
+        "model_version": store.version,
+        "load_seconds": round(store.load_seconds, 3),
+        "memory_bytes": store.memory_footprint(),
+    })
+
+@app.route("/api/cache_stats")
+def api_cache_stats():
+    """Response cache hit/miss counters per route."""
+    return jsonify(response_cache.stats())
+
 @app.route("/api/openai_status")
 def api_openai_status():
     """Check if OpenAI service is available."""
     return jsonify({
         "available": openai_service.is_available(),
-        "model": openai_service.model if openai_service.is_available() else None
+        "model": openai_service.model if openai_service.is_available() else None,
+        **openai_service.report()
     })
 
 if __name__ == "__main__":
+    # the dev server builds missing artifacts up front; production runs bootstrap.py
+    from recommend import ensure_artifacts
+    ensure_artifacts()
     port = int(os.getenv("PORT", "5000"))
     app.run(host="0.0.0.0", port=port, debug=True)
\ No newline at end of file
@@ -0,0 +1,317 @@
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from assoc_matrix import AssocMatrix
+from config import Config
+from metrics import ARTIFACT_LOADS, STAGE_SECONDS
+from similarity import SimilarityEngine
+from storage import get_backend
+
+
+_DATA_ATTRS = (
+    "_item_to_index",
+    "_index_to_item",
+    "_complements",
+    "_main_products",
+    "_main_product_set",
+    "_prices",
+    "_rooms",
+    "_products",
+    "_customer_repo",
+)
+
+
+class ArtifactsUnavailable(RuntimeError):
+    """Storage has no data or no trained model yet; run `python bootstrap.py`."""
+
+    def __init__(self, backend, missing):
+        super().__init__(f"{backend.describe()} is missing {' and '.join(missing)}; run `python bootstrap.py`")
+        self.missing = missing
+
+
+class ArtifactStore:
+    """
+    Everything the recommenders and API routes read from storage, loaded
+    once and held in memory for the lifetime of the worker process.
+
+    Catalog and customer data come from the storage backend; assoc rules and
+    embeddings come from its live model version. Passing `base` reuses an
+    existing store's data and only loads the new model.
+    """
+
+    def __init__(self, backend, version=None, base=None):
+        self.backend = backend
+        started = time.perf_counter()
+
+        self.model_stamp = backend.model_stamp()
+        self.version = version or backend.model_version()
+
+        if base is None:
+            self._load_data()
+        else:
+            for attr in _DATA_ATTRS:
+                setattr(self, attr, getattr(base, attr))
+        self._load_model()
+
+        self.load_seconds = time.perf_counter() - started
+
+    def _load_data(self):
+        catalog = self.backend.load_catalog()
+        self._item_to_index = catalog["item_to_index"]
+        self._index_to_item = catalog["index_to_item"]
+        self._complements = catalog["complements"]
+        self._main_products = catalog["main_products"]
+        self._main_product_set = frozenset(self._main_products)
+        self._prices = catalog["prices"]
+        self._rooms = catalog["rooms"]
+        self._products = catalog["products"]
+        self._customer_repo = self.backend.customer_repository()
+
+    def _load_model(self):
+        model = self.backend.load_model(self.version)
+        self._assoc_rules = model["assoc_rules"]
+        self._embeddings = model["embeddings"]
+        self._suggest_index = model["suggest_index"]
+        normalized = model["normalized_embeddings"]
+        if normalized is not None and normalized.dtype == np.dtype(Config.SIMILARITY_DTYPE):
+            self._similarity = SimilarityEngine.from_normalized(normalized)
+        else:
+            self._similarity = SimilarityEngine(self._embeddings, dtype=Config.SIMILARITY_DTYPE)
+        self._ann_index = model.get("ann_index")
+        self._similarity.index = self._ann_index
+
+    # ---- catalog ----
+    @property
+    def item_to_index(self) -> dict:
+        return self._item_to_index
+
+    @property
+    def index_to_item(self) -> dict:
+        return self._index_to_item
+
+    @property
+    def complements(self) -> dict:
+        return self._complements
+
+    @property
+    def main_products(self) -> list:
+        """Main products in catalog order (what the UI lists)."""
+        return self._main_products
+
+    @property
+    def main_product_set(self) -> frozenset:
+        return self._main_product_set
+
+    @property
+    def prices(self) -> dict:
+        return self._prices
+
+    @property
+    def rooms(self) -> dict:
+        return self._rooms
+
+    @property
+    def products(self) -> pd.DataFrame:
+        return self._products
+
+    # ---- model ----
+    @property
+    def assoc_rules(self):
+        """Nested rules dict, or an AssocMatrix with the same read interface."""
+        return self._assoc_rules
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self._embeddings
+
+    @property
+    def similarity(self) -> SimilarityEngine:
+        """Cosine-similarity engine over the pre-normalized embeddings."""
+        return self._similarity
+
+    @property
+    def ann_index(self):
+        """
+        ann_index.IVFIndex over the normalized embeddings (also attached as
+        similarity.index), or None when the model has none.
+        """
+        return self._ann_index
+
+    @property
+    def suggest_index(self):
+        """
+        {"top_n": int, "items": {item: [ranked suggestions]}} built at training
+        time, or None for bundles that predate it.
+        """
+        return self._suggest_index
+
+    # ---- transactional tables ----
+    @property
+    def customer_repo(self):
+        """Indexed per-customer lookups; prefer this over scanning the tables."""
+        return self._customer_repo
+
+    @property
+    def customers(self) -> pd.DataFrame:
+        return self._customer_repo.customers
+
+    @property
+    def purchases(self) -> pd.DataFrame:
+        return self._customer_repo.purchases
+
+    @property
+    def invoices(self) -> pd.DataFrame:
+        return self._customer_repo.invoices
+
+    @property
+    def invoice_items(self) -> pd.DataFrame:
+        return self._customer_repo.invoice_items
+
+    def memory_footprint(self):
+        """
+        Approximate per-worker size of each artifact in bytes, plus a total.
+        DataFrames are measured deeply (object columns included). Memory-mapped
+        arrays are shared through the page cache, so they are reported under
+        "shared_mmap" and left out of the per-worker total.
+        """
+        shared = 0
+        private = {}
+        for name, arr in (
+            ("embeddings", self._embeddings),
+            ("similarity", self._similarity.vectors),
+        ):
+            if isinstance(arr, np.memmap):
+                shared += int(arr.nbytes)
+            else:
+                private[name] = int(arr.nbytes)
+        if isinstance(self._assoc_rules, AssocMatrix):
+            if self._assoc_rules.is_mmap:
+                shared += self._assoc_rules.nbytes
+            else:
+                private["assoc_rules"] = self._assoc_rules.nbytes
+            private["assoc_items"] = _deep_sizeof(self._assoc_rules.item_to_index) + _deep_sizeof(self._assoc_rules.items)
+        else:
+            private["assoc_rules"] = _deep_sizeof(self._assoc_rules)
+        if self._ann_index is not None:
+            if self._ann_index.is_mmap:
+                shared += self._ann_index.nbytes
+            else:
+                private["ann_index"] = self._ann_index.nbytes
+
+        sizes = {
+            "item_to_index": _deep_sizeof(self._item_to_index),
+            "index_to_item": _deep_sizeof(self._index_to_item),
+            **private,
+            "suggest_index": _deep_sizeof(self._suggest_index),
+            "complements": _deep_sizeof(self._complements),
+            "main_products": _deep_sizeof(self._main_products),
+            "prices": _deep_sizeof(self._prices),
+            "rooms": _deep_sizeof(self._rooms),
+        }
+        sizes["customer_repo"] = self._customer_repo.memory_usage()
+        sizes["products"] = int(self._products.memory_usage(deep=True).sum())
+        sizes["total"] = sum(sizes.values())
+        sizes["shared_mmap"] = shared
+        return sizes
+
+
+def _deep_sizeof(obj, _seen=None):
+    """sys.getsizeof that follows dict/list/set/tuple containers."""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, _seen) + _deep_sizeof(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(v, _seen) for v in obj)
+    return size
+
+
+# ---- process-wide singleton ----
+_store = None
+_store_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_last_check = 0.0
+
+
+def get_store():
+    """
+    Return the process-wide ArtifactStore, loading it on first use.
+    Artifacts must already exist in storage (see bootstrap.py); until they
+    do, this raises ArtifactsUnavailable instead of creating them.
+
+    At most every ARTIFACT_RELOAD_SECONDS the backend's model stamp (the
+    CURRENT pointer's mtime for files) is compared with the loaded one; when
+    it moved, the new model is loaded and swapped in. Callers hold on to the
+    store they were handed, so in-flight requests finish on the model they
+    started with.
+    """
+    global _store
+    store = _store
+    if store is None:
+        with _store_lock:
+            if _store is None:
+                backend = get_backend()
+                missing = [name for name, ok in (("data", backend.has_data()), ("model", backend.has_model())) if not ok]
+                if missing:
+                    raise ArtifactsUnavailable(backend, missing)
+                _store = ArtifactStore(backend)
+                ARTIFACT_LOADS.inc(kind="full")
+                STAGE_SECONDS.observe(_store.load_seconds, stage="artifacts.load")
+                print(
+                    f"[artifacts] Loaded {_store.backend.describe()} (model {_store.version}) "
+                    f"in {_store.load_seconds:.2f}s "
+                    f"({_store.memory_footprint()['total'] / 1e6:.1f} MB)"
+                )
+            return _store
+    return _maybe_reload(store)
+
+
+def _maybe_reload(store):
+    global _store, _last_check
+    interval = Config.ARTIFACT_RELOAD_SECONDS
+    now = time.monotonic()
+    if interval < 0 or now - _last_check < interval:
+        return store
+    # One thread does the reload; everyone else keeps serving the current store.
+    if not _reload_lock.acquire(blocking=False):
+        return store
+    try:
+        _last_check = now
+        backend = store.backend
+        stamp = backend.model_stamp()
+        if stamp == store.model_stamp:
+            return store
+        version = backend.model_version()
+        if version == store.version:
+            store.model_stamp = stamp
+            return store
+        try:
+            fresh = ArtifactStore(backend, version=version, base=store)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            ARTIFACT_LOADS.inc(kind="failed")
+            print(f"[artifacts] Failed to load model {version}, keeping {store.version}: {e}")
+            return store
+        with _store_lock:
+            _store = fresh
+        ARTIFACT_LOADS.inc(kind="reload")
+        STAGE_SECONDS.observe(fresh.load_seconds, stage="artifacts.reload")
+        print(f"[artifacts] Swapped model {store.version} -> {fresh.version} in {fresh.load_seconds:.2f}s")
+        return fresh
+    finally:
+        _reload_lock.release()
+
+
+def reset_store():
+    """Drop the cached store so the next get_store() reloads from disk."""
+    global _store
+    with _store_lock:
+        _store = None
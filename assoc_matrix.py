@@ -0,0 +1,180 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+FILES = {
+    "indptr": "assoc_indptr.npy",
+    "indices": "assoc_indices.npy",
+    "support": "assoc_support.npy",
+    "confidence": "assoc_confidence.npy",
+}
+ITEMS_FILE = "assoc_items.json"
+
+
+class AssocMatrix:
+    """
+    Association rules as a CSR matrix: row `src` holds the rules src -> dst,
+    sorted by dst index, with parallel support/confidence columns.
+
+    Loaded with mmap_mode="r", the arrays live in the page cache and are
+    shared by every worker process instead of being parsed into millions of
+    small dicts per worker. Reads behave like the nested rules dict
+    (`rules.get(a, {}).get(b, {})`, `a in rules`, `rules[a].items()`), so the
+    recommenders work with either.
+    """
+
+    def __init__(self, items, indptr, indices, support, confidence):
+        self.items = items
+        self.item_to_index = {item: i for i, item in enumerate(items)}
+        self.indptr = indptr
+        self.indices = indices
+        self.support = support
+        self.confidence = confidence
+
+    @classmethod
+    def from_rules(cls, rules, item_to_index):
+        """Build from the nested {src: {dst: {"support", "confidence"}}} dict."""
+        items = [None] * len(item_to_index)
+        for item, i in item_to_index.items():
+            items[i] = item
+        lookup = dict(item_to_index)
+        # rules may mention items outside the catalog; give them trailing ids
+        for src, row in rules.items():
+            for name in (src, *row):
+                if name not in lookup:
+                    lookup[name] = len(items)
+                    items.append(name)
+
+        n = len(items)
+        counts = np.zeros(n + 1, dtype=np.int64)
+        src_idx, dst_idx, support, confidence = [], [], [], []
+        for src, row in rules.items():
+            s = lookup[src]
+            for dst, stats in row.items():
+                src_idx.append(s)
+                dst_idx.append(lookup[dst])
+                support.append(float(stats.get("support", 0.0)))
+                confidence.append(float(stats.get("confidence", 0.0)))
+
+        src_idx = np.asarray(src_idx, dtype=np.int64)
+        dst_idx = np.asarray(dst_idx, dtype=np.int32)
+        order = np.lexsort((dst_idx, src_idx))
+        np.add.at(counts, src_idx + 1, 1)
+        return cls(
+            items,
+            np.cumsum(counts),
+            dst_idx[order],
+            np.asarray(support, dtype=np.float64)[order],
+            np.asarray(confidence, dtype=np.float64)[order],
+        )
+
+    def save(self, directory):
+        directory = Path(directory)
+        for attr, name in FILES.items():
+            np.save(directory / name, getattr(self, attr))
+        (directory / ITEMS_FILE).write_text(json.dumps(self.items))
+
+    @classmethod
+    def exists(cls, directory):
+        directory = Path(directory)
+        return all((directory / name).exists() for name in (*FILES.values(), ITEMS_FILE))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = Path(directory)
+        mode = "r" if mmap else None
+        arrays = {attr: np.load(directory / name, mmap_mode=mode) for attr, name in FILES.items()}
+        items = json.loads((directory / ITEMS_FILE).read_text())
+        return cls(items, **arrays)
+
+    @property
+    def nbytes(self):
+        return int(sum(getattr(self, attr).nbytes for attr in FILES))
+
+    @property
+    def is_mmap(self):
+        return isinstance(self.indices, np.memmap)
+
+    def __len__(self):
+        return int(np.count_nonzero(np.diff(self.indptr)))
+
+    def __contains__(self, src):
+        i = self.item_to_index.get(src)
+        return i is not None and self.indptr[i + 1] > self.indptr[i]
+
+    def __getitem__(self, src):
+        row = self.get(src)
+        if row is None:
+            raise KeyError(src)
+        return row
+
+    def get(self, src, default=None):
+        """Rules for `src` as an AssocRow, or `default` if it has none."""
+        i = self.item_to_index.get(src)
+        if i is None:
+            return default
+        lo, hi = int(self.indptr[i]), int(self.indptr[i + 1])
+        if lo == hi:
+            return default
+        return AssocRow(self, lo, hi)
+
+    def to_dict(self):
+        out = {}
+        for i, src in enumerate(self.items):
+            lo, hi = int(self.indptr[i]), int(self.indptr[i + 1])
+            if lo < hi:
+                out[src] = dict(AssocRow(self, lo, hi).items())
+        return out
+
+
+class AssocRow:
+    """Read-only view of one source item's rules, keyed by dst item name."""
+
+    def __init__(self, matrix, lo, hi):
+        self._m = matrix
+        self._lo = lo
+        self._hi = hi
+
+    def _pos(self, dst):
+        j = self._m.item_to_index.get(dst)
+        if j is None:
+            return None
+        row = self._m.indices[self._lo:self._hi]
+        k = int(np.searchsorted(row, j))
+        if k < len(row) and row[k] == j:
+            return self._lo + k
+        return None
+
+    def _stats(self, pos):
+        return {"support": float(self._m.support[pos]), "confidence": float(self._m.confidence[pos])}
+
+    def __len__(self):
+        return self._hi - self._lo
+
+    def __contains__(self, dst):
+        return self._pos(dst) is not None
+
+    def __getitem__(self, dst):
+        pos = self._pos(dst)
+        if pos is None:
+            raise KeyError(dst)
+        return self._stats(pos)
+
+    def get(self, dst, default=None):
+        pos = self._pos(dst)
+        return default if pos is None else self._stats(pos)
+
+    def keys(self):
+        items = self._m.items
+        return [items[j] for j in self._m.indices[self._lo:self._hi]]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        items = self._m.items
+        sup = self._m.support[self._lo:self._hi]
+        conf = self._m.confidence[self._lo:self._hi]
+        for j, s, c in zip(self._m.indices[self._lo:self._hi].tolist(), sup.tolist(), conf.tolist()):
+            yield items[j], {"support": s, "confidence": c}
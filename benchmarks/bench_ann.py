@@ -0,0 +1,77 @@
+"""
+Exact top-K (SimilarityEngine.nearest over the whole matrix) vs the IVF
+index at several nprobe settings: per-query latency and recall@K, on
+clustered random embeddings as the catalog grows.
+
+    python benchmarks/bench_ann.py --sizes 20000 100000 --nprobe 4 8 16 32
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ann_index import IVFIndex  # noqa: E402
+from similarity import SimilarityEngine  # noqa: E402
+
+
+def clustered_embeddings(n, dim, clusters, rng):
+    """Items scattered around `clusters` product-family centres, like trained embeddings."""
+    centres = rng.normal(size=(clusters, dim))
+    return (centres[rng.integers(clusters, size=n)] + 0.5 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def run_queries(fn, queries):
+    """(results, per-query seconds) over every query."""
+    results, seconds = [], []
+    for q in queries:
+        started = time.perf_counter()
+        results.append(fn(q))
+        seconds.append(time.perf_counter() - started)
+    return results, np.array(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--dim", type=int, default=16)
+    parser.add_argument("--clusters", type=int, default=200, help="product families in the synthetic catalog")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default about 4*sqrt(items))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'items':>8} {'search':>12} {'p50 ms':>8} {'p99 ms':>8} {'recall@' + str(args.k):>10} {'speedup':>8}")
+    for n in args.sizes:
+        engine = SimilarityEngine(clustered_embeddings(n, args.dim, args.clusters, rng), dtype="float32")
+        queries = rng.choice(n, size=min(args.queries, n), replace=False).tolist()
+
+        started = time.perf_counter()
+        index = IVFIndex.build(engine.vectors, nlist=args.nlist)
+        build_s = time.perf_counter() - started
+        print(f"{n:>8} built {index.nlist} lists in {build_s:.2f}s ({index.nbytes / 1e6:.1f} MB)")
+
+        exact, exact_s = run_queries(lambda q: engine.nearest(q, args.k, exact=True)[0], queries)
+        exact_p50 = np.median(exact_s)
+        print(f"{n:>8} {'exact':>12} {exact_p50 * 1e3:>8.3f} {np.percentile(exact_s, 99) * 1e3:>8.3f} "
+              f"{1.0:>10.3f} {1.0:>7.1f}x")
+
+        engine.index = index
+        for nprobe in args.nprobe:
+            if nprobe > index.nlist:
+                continue
+            approx, approx_s = run_queries(lambda q: engine.nearest(q, args.k, nprobe=nprobe)[0], queries)
+            recall = np.mean([len(np.intersect1d(a, e)) / max(len(e), 1) for a, e in zip(approx, exact)])
+            p50 = np.median(approx_s)
+            print(f"{n:>8} {'nprobe=' + str(nprobe):>12} {p50 * 1e3:>8.3f} {np.percentile(approx_s, 99) * 1e3:>8.3f} "
+                  f"{recall:>10.3f} {exact_p50 / max(p50, 1e-9):>7.1f}x")
+        engine.index = None
+
+
+if __name__ == "__main__":
+    main()
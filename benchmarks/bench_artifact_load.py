@@ -0,0 +1,119 @@
+"""
+Cold-start time and per-worker memory for assoc rules stored as JSON vs the
+memory-mapped CSR format, on synthetic rules for a large catalog.
+
+    python benchmarks/bench_artifact_load.py --items 20000 --rules-per-item 50
+
+Each format is loaded in a fresh subprocess (like a new gunicorn worker).
+RSS counts pages the process touched; "private" is what the worker does not
+share with others (from /proc/self/smaps_rollup, Linux only).
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import textwrap
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from assoc_matrix import FILES, ITEMS_FILE, AssocMatrix  # noqa: E402
+
+WORKER = textwrap.dedent(
+    """
+    import json, resource, sys, time
+    sys.path.insert(0, {root!r})
+    from assoc_matrix import AssocMatrix
+
+    def mem():
+        out = {{"maxrss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}
+        try:
+            for line in open("/proc/self/smaps_rollup"):
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Private_Clean", "Private_Dirty", "Shared_Clean"):
+                    out[key] = int(rest.split()[0]) / 1024
+        except OSError:
+            pass
+        return out
+
+    before = mem()
+    started = time.perf_counter()
+    if {fmt!r} == "json":
+        with open({path!r} + "/assoc_rules.json") as f:
+            rules = json.load(f)
+    else:
+        rules = AssocMatrix.load({path!r}, mmap=True)
+    load_s = time.perf_counter() - started
+
+    items = {probe!r}
+    started = time.perf_counter()
+    hits = 0
+    for a, b in zip(items, items[1:] + items[:1]):
+        hits += bool(rules.get(a, {{}}).get(b, {{}}))
+    lookup_s = time.perf_counter() - started
+
+    after = mem()
+    print(json.dumps({{"load_s": load_s, "lookup_us": lookup_s / len(items) * 1e6, "before": before, "after": after}}))
+    """
+)
+
+
+def synth_rules(n_items, per_item, seed=0):
+    rng = np.random.default_rng(seed)
+    items = [f"SKU-{i:07d}" for i in range(n_items)]
+    rules = {}
+    for i, src in enumerate(items):
+        dsts = rng.choice(n_items, size=per_item, replace=False)
+        sup = rng.random(per_item) * 0.1
+        conf = rng.random(per_item)
+        rules[src] = {
+            items[j]: {"support": float(s), "confidence": float(c)}
+            for j, s, c in zip(dsts, sup, conf)
+            if j != i
+        }
+    return items, rules
+
+
+def run_worker(fmt, path, probe):
+    code = WORKER.format(root=str(ROOT), fmt=fmt, path=str(path), probe=probe)
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+    return json.loads(out.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--rules-per-item", type=int, default=50)
+    parser.add_argument("--probes", type=int, default=2000)
+    args = parser.parse_args()
+
+    items, rules = synth_rules(args.items, args.rules_per_item)
+    probe = items[: args.probes]
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        (tmp / "assoc_rules.json").write_text(json.dumps(rules))
+        AssocMatrix.from_rules(rules, {item: i for i, item in enumerate(items)}).save(tmp)
+        json_mb = (tmp / "assoc_rules.json").stat().st_size / 1e6
+        csr_mb = sum((tmp / name).stat().st_size for name in (*FILES.values(), ITEMS_FILE)) / 1e6
+        n_rules = sum(len(r) for r in rules.values())
+        del rules
+
+        print(f"{n_rules:,} rules over {args.items:,} items; json {json_mb:.1f} MB, columnar {csr_mb:.1f} MB")
+        print(f"{'format':>8} {'load s':>8} {'lookup us':>10} {'rss +MB':>8} {'private +MB':>12}")
+        for fmt in ("json", "mmap"):
+            r = run_worker(fmt, tmp, probe)
+            before, after = r["before"], r["after"]
+            rss = after.get("Rss", after["maxrss_mb"]) - before.get("Rss", before["maxrss_mb"])
+            private = (
+                after.get("Private_Clean", 0) + after.get("Private_Dirty", 0)
+                - before.get("Private_Clean", 0) - before.get("Private_Dirty", 0)
+            )
+            print(f"{fmt:>8} {r['load_s']:>8.3f} {r['lookup_us']:>10.2f} {rss:>8.1f} {private:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
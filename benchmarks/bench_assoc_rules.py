@@ -0,0 +1,78 @@
+"""
+Check that the sparse miner in model_train.build_association_rules produces
+exactly the rules of the original per-basket pair loop, then time both.
+
+    python benchmarks/bench_assoc_rules.py --scale 1 10 100
+
+Scale 1 uses the baskets from the data directory as they are. Larger scales
+add resampled copies of those baskets, so the item distribution stays the same.
+"""
+import argparse
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import model_train  # noqa: E402
+
+
+def legacy_association_rules(baskets, min_support=0.015, min_conf=0.08):
+    """The original pure-Python miner, kept as the reference."""
+    item_counts = defaultdict(int)
+    pair_counts = defaultdict(int)
+    total_baskets = len(baskets)
+
+    for basket in baskets:
+        for i, a in enumerate(basket):
+            item_counts[a] += 1
+            for b in basket[i + 1:]:
+                key = tuple(sorted([a, b]))
+                pair_counts[key] += 1
+
+    rules = defaultdict(dict)
+    for (a, b), cnt in pair_counts.items():
+        support = cnt / total_baskets
+        if support < min_support:
+            continue
+        conf_ab = cnt / item_counts[a]
+        conf_ba = cnt / item_counts[b]
+        if conf_ab >= min_conf:
+            rules[a][b] = {"support": support, "confidence": conf_ab}
+        if conf_ba >= min_conf:
+            rules[b][a] = {"support": support, "confidence": conf_ba}
+    return dict(rules)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10, 100])
+    args = parser.parse_args()
+
+    purchases, invoices, invoice_items, *_ = model_train.load_data()
+    base = model_train.baskets_by_order(purchases, invoices, invoice_items)
+    rng = np.random.default_rng(0)
+
+    print(f"{'baskets':>10} {'rules':>7} {'equal':>6} {'legacy s':>9} {'sparse s':>9}")
+    for scale in args.scale:
+        baskets = base if scale == 1 else [base[i] for i in rng.integers(0, len(base), len(base) * scale)]
+
+        started = time.perf_counter()
+        expected = legacy_association_rules(baskets)
+        legacy_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        got = model_train.build_association_rules(baskets)
+        sparse_s = time.perf_counter() - started
+
+        equal = got == expected
+        print(f"{len(baskets):>10,} {sum(map(len, got.values())):>7} {str(equal):>6} {legacy_s:>9.3f} {sparse_s:>9.3f}")
+        if not equal:
+            sys.exit("sparse miner disagrees with the reference implementation")
+
+
+if __name__ == "__main__":
+    main()
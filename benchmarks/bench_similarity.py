@@ -0,0 +1,82 @@
+"""
+Per-pair cosine loop (what recommend.py used to do) vs SimilarityEngine,
+on random embeddings as the catalog grows.
+
+    python benchmarks/bench_similarity.py --sizes 82 1000 10000 100000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from similarity import SimilarityEngine  # noqa: E402
+
+
+def loop_one_to_many(embeddings, src_idx, idxs):
+    src_vec = embeddings[src_idx]
+    out = []
+    for i in idxs:
+        c_vec = embeddings[i]
+        denom = (np.linalg.norm(src_vec) * np.linalg.norm(c_vec)) + 1e-8
+        out.append(float(np.dot(src_vec, c_vec) / denom))
+    return out
+
+
+def loop_many_to_many(embeddings, left, right):
+    return [loop_one_to_many(embeddings, r, left) for r in right]
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[82, 1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=16)
+    parser.add_argument("--bought", type=int, default=8, help="items in the customer's recent invoices")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dtype", default="float32", choices=["float64", "float32", "float16"])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'items':>8} {'query':>14} {'loop ms':>10} {'engine ms':>10} {'speedup':>8}")
+    for n in args.sizes:
+        embeddings = rng.normal(size=(n, args.dim)).astype(np.float32)
+        engine = SimilarityEngine(embeddings, dtype=args.dtype)
+        all_idx = np.arange(n)
+        mains = all_idx[: max(1, n // 4)]
+        bought = rng.choice(n, size=min(args.bought, n), replace=False)
+
+        cases = [
+            (
+                "one-to-all",
+                lambda: loop_one_to_many(embeddings, 0, all_idx),
+                lambda: engine.one_to_many(0, all_idx),
+            ),
+            (
+                "mains x bought",
+                lambda: loop_many_to_many(embeddings, mains, bought),
+                lambda: engine.many_to_many(mains, bought),
+            ),
+        ]
+        for name, loop_fn, engine_fn in cases:
+            loop_s = timed(loop_fn, 1 if n >= 10000 else args.repeat)
+            engine_s = timed(engine_fn, args.repeat)
+            print(
+                f"{n:>8} {name:>14} {loop_s * 1e3:>10.2f} {engine_s * 1e3:>10.3f} "
+                f"{loop_s / max(engine_s, 1e-9):>7.0f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Per-basket Python loop (what make_training_pairs used to do) vs the batched
+positive_pairs + popularity-sampled negatives, on random baskets.
+
+    python benchmarks/bench_training_pairs.py --baskets 10000 100000 1000000
+
+The loop is only timed up to --loop-max baskets; past that it is
+extrapolated linearly (it is O(baskets) with a large constant).
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from model_train import NegativeSampler, positive_pairs, with_negatives  # noqa: E402
+
+
+def loop_pairs(baskets, item_to_index, max_pairs_per_basket=20):
+    pairs = []
+    for b in baskets:
+        idxs = [item_to_index[x] for x in b if x in item_to_index]
+        if len(idxs) < 2:
+            continue
+        added = 0
+        for i in range(len(idxs)):
+            for j in range(i+1, len(idxs)):
+                pairs.append((idxs[i], idxs[j], 1.0))
+                pairs.append((idxs[j], idxs[i], 1.0))
+                added += 2
+                if added >= max_pairs_per_basket:
+                    break
+            if added >= max_pairs_per_basket:
+                break
+        for pos in idxs[: min(2, len(idxs))]:
+            neg = np.random.choice(list(item_to_index.values()))
+            if neg not in idxs:
+                pairs.append((pos, neg, 0.0))
+    np.random.shuffle(pairs)
+    arr = np.array(pairs)
+    return arr[:, :2].astype(np.int32), arr[:, 2].astype(np.float32)
+
+
+def synth_baskets(n_baskets, n_items, rng):
+    sizes = rng.integers(1, 9, size=n_baskets)
+    indptr = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    # popularity skew, then de-duplicate and sort within each basket
+    raw = np.minimum(rng.zipf(1.3, size=int(indptr[-1])) - 1, n_items - 1)
+    basket = np.repeat(np.arange(n_baskets), sizes)
+    combined = np.unique(basket * n_items + raw)
+    sizes = np.bincount(combined // n_items, minlength=n_baskets)
+    return np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64), (combined % n_items).astype(np.int32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--baskets", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--neg-ratio", type=float, default=1.0)
+    parser.add_argument("--loop-max", type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    item_to_index = {i: i for i in range(args.items)}
+    print(f"{'baskets':>9} {'pairs':>11} {'loop s':>10} {'batched s':>10} {'speedup':>8}")
+    for n in args.baskets:
+        indptr, indices = synth_baskets(n, args.items, rng)
+
+        started = time.perf_counter()
+        positives = positive_pairs(indptr, indices, max_pairs_per_basket=20)
+        sampler = NegativeSampler(np.bincount(indices, minlength=args.items))
+        pairs, _ = with_negatives(positives, sampler, args.neg_ratio)
+        batched_s = time.perf_counter() - started
+
+        m = min(n, args.loop_max)
+        baskets = [indices[indptr[k]:indptr[k + 1]].tolist() for k in range(m)]
+        started = time.perf_counter()
+        loop_pairs(baskets, item_to_index)
+        loop_s = (time.perf_counter() - started) * n / m
+        mark = "~" if m < n else " "
+        print(f"{n:>9} {len(pairs):>11,} {mark}{loop_s:>9.2f} {batched_s:>10.3f} {loop_s / batched_s:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
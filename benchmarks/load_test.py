@@ -0,0 +1,388 @@
+"""
+Throughput and p50/p95/p99 latency of every API route under concurrent
+load, driven in-process through the Flask test client and/or over HTTP
+against a locally launched gunicorn.
+
+    python benchmarks/load_test.py --customers 150 20000 --concurrency 1 8 32
+    python benchmarks/load_test.py --target gunicorn --workers 4 --threads 4
+    python benchmarks/load_test.py --routes suggest additional_recs --requests 2000
+    python benchmarks/load_test.py --cache off warm
+
+Each data scale is generated with data_generation (fixed seed and end
+date) and trained once under --work-dir, then reused by later runs. The
+OpenAI service is the built-in fake client (OPENAI_CLIENT=fake) with
+--llm-latency seconds per call, so the LLM routes are measured without
+network access.
+
+Cache state is an explicit dimension (--cache): "off" disables the
+response and LLM caches so every request does the real work; "warm" turns
+them on and replays each level's requests once before measuring, so the
+numbers are cache hits. Each concurrency level runs in a fresh process
+(and a fresh gunicorn) with empty caches and an empty insight store, and
+draws its own request sequence (seed + concurrency), so levels measure
+concurrency and not whatever an earlier level left cached. Results go to a JSON file (default
+benchmarks/results/load_test-<commit>-<time>.json) so runs can be compared
+across commits.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlencode
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# name -> (method, path, params); params draws query args / JSON body from the sample pool
+ROUTES = {
+    "customers": ("GET", "/api/customers", lambda s, r: {}),
+    "catalog_main": ("GET", "/api/catalog_main", lambda s, r: {}),
+    "recent_purchase": ("GET", "/api/recent_purchase", lambda s, r: {"customer_id": s.customer(r)}),
+    "suggest": ("GET", "/api/suggest", lambda s, r: {"item": s.product(r), "k": 5}),
+    "suggest_batch": ("POST", "/api/suggest_batch", lambda s, r: {"items": s.products(r, 3), "k": 5}),
+    "customer_details": ("GET", "/api/customer_details", lambda s, r: {"customer_id": s.customer(r)}),
+    "customer_history": ("GET", "/api/customer_history", lambda s, r: {"customer_id": s.customer(r)}),
+    "customer_invoices": ("GET", "/api/customer_invoices", lambda s, r: {"customer_id": s.customer(r)}),
+    "additional_recs": ("GET", "/api/additional_recs", lambda s, r: {"customer_id": s.customer(r)}),
+    "customer_profile": ("GET", "/api/customer_profile", lambda s, r: {"customer_id": s.customer(r)}),
+    "customer_insights": ("GET", "/api/customer_insights", lambda s, r: {"customer_id": s.customer(r)}),
+    "recommendation_explanation": (
+        "GET", "/api/recommendation_explanation", lambda s, r: {"products": s.products(r, 2)},
+    ),
+    "ready": ("GET", "/api/ready", lambda s, r: {}),
+}
+
+
+class Sample:
+    """Customer ids and main products of one generated dataset, to draw request parameters from."""
+
+    def __init__(self, data_dir):
+        import pandas as pd
+        self.customers = pd.read_csv(Path(data_dir) / "customers.csv", usecols=["customer_id"])["customer_id"].tolist()
+        self.mains = json.loads((Path(data_dir) / "main_products.json").read_text())
+
+    def customer(self, rng):
+        return self.customers[rng.integers(len(self.customers))]
+
+    def product(self, rng):
+        return self.mains[rng.integers(len(self.mains))]
+
+    def products(self, rng, n):
+        return [self.mains[i] for i in rng.choice(len(self.mains), size=min(n, len(self.mains)), replace=False)]
+
+
+def build_request(name, sample, rng):
+    method, path, params = ROUTES[name]
+    args = params(sample, rng)
+    if method == "POST":
+        return method, path, json.dumps(args).encode()
+    return method, f"{path}?{urlencode(args, doseq=True)}" if args else path, None
+
+
+def summarize(latencies, statuses, elapsed):
+    ms = np.asarray(latencies) * 1000
+    codes = {}
+    for code in statuses:
+        codes[str(code)] = codes.get(str(code), 0) + 1
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(ms),
+        "errors": sum(1 for code in statuses if code >= 400),
+        "status": codes,
+        "throughput_rps": round(len(ms) / elapsed, 1) if elapsed else None,
+        "mean_ms": round(float(ms.mean()), 3) if len(ms) else None,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(ms.max()), 3) if len(ms) else None,
+    }
+
+
+def drive(send, name, sample, n_requests, concurrency, warmup, seed, prime=False):
+    """
+    Fire n_requests at one route from `concurrency` threads; `send` returns
+    the status code. `prime` sends every planned request once beforehand,
+    so the measured ones find the caches warm.
+    """
+    rng = np.random.default_rng(seed)
+    planned = [build_request(name, sample, rng) for _ in range(warmup + n_requests)]
+    if prime:
+        with ThreadPoolExecutor(max_workers=max(concurrency, 8)) as pool:
+            list(pool.map(lambda request: send(*request), planned))
+    else:
+        for request in planned[:warmup]:
+            send(*request)
+
+    latencies, statuses = [], []
+    lock = threading.Lock()
+    queue = iter(planned[warmup:])
+
+    def worker():
+        while True:
+            with lock:
+                request = next(queue, None)
+            if request is None:
+                return
+            started = time.perf_counter()
+            status = send(*request)
+            took = time.perf_counter() - started
+            with lock:
+                latencies.append(took)
+                statuses.append(status)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return summarize(latencies, statuses, time.perf_counter() - started)
+
+
+def inprocess_sender():
+    """send() through Flask test clients (one per thread), importing the app under the current env."""
+    sys.path.insert(0, str(ROOT))
+    from app import app
+
+    local = threading.local()
+
+    def send(method, path, body):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        if method == "POST":
+            response = client.post(path, data=body, content_type="application/json")
+        else:
+            response = client.get(path)
+        response.get_data()
+        return response.status_code
+
+    return send
+
+
+def http_sender(host, port):
+    """send() over keep-alive HTTP connections (one per thread)."""
+    local = threading.local()
+
+    def send(method, path, body):
+        for attempt in range(2):
+            conn = getattr(local, "conn", None)
+            if conn is None:
+                conn = local.conn = http.client.HTTPConnection(host, port, timeout=60)
+            try:
+                headers = {"Content-Type": "application/json"} if body else {}
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                local.conn = None
+                if attempt:
+                    return 599
+        return 599
+
+    return send
+
+
+def run_plan(plan):
+    """Child process: every (route, concurrency) pair of one target, data scale and cache state."""
+    if plan["target"] == "inprocess":
+        send = inprocess_sender()
+    else:
+        send = http_sender("127.0.0.1", plan["port"])
+    sample = Sample(plan["data_dir"])
+    results = {}
+    for concurrency in plan["concurrency"]:
+        results[str(concurrency)] = {
+            name: drive(
+                send, name, sample, plan["requests"], concurrency, plan["warmup"], plan["seed"] + concurrency,
+                prime=plan["cache"] == "warm",
+            )
+            for name in plan["routes"]
+        }
+    return results
+
+
+def prepare(work_dir, customers, seed):
+    """Generate and train a dataset of `customers` customers once; later runs reuse it."""
+    data_dir = Path(work_dir) / f"customers-{customers}-seed-{seed}"
+    env = {**os.environ, "DATA_DIR": str(data_dir), "STORAGE_BACKEND": "files"}
+    if not (data_dir / "customers.csv").exists():
+        print(f"[load_test] generating {customers:,} customers in {data_dir}")
+        subprocess.run(
+            [sys.executable, str(ROOT / "data_generation.py"), "--data-dir", str(data_dir),
+             "--customers", str(customers), "--seed", str(seed), "--end-date", "2025-01-01"],
+            check=True, cwd=ROOT,
+        )
+    # no-op when the model is already trained
+    subprocess.run([sys.executable, str(ROOT / "bootstrap.py")], check=True, cwd=ROOT, env=env)
+    return data_dir
+
+
+def server_env(data_dir, state_dir, args, cache):
+    """Environment for one run; the LLM cache and insight store start empty in `state_dir`."""
+    off = cache == "off"
+    return {
+        **os.environ,
+        "DATA_DIR": str(data_dir),
+        "STORAGE_BACKEND": "files",
+        "OPENAI_CLIENT": "fake",
+        "OPENAI_FAKE_LATENCY": str(args.llm_latency),
+        "LLM_CACHE_PATH": str(Path(state_dir) / "llm_cache.db"),
+        "LLM_CACHE_TTL": "0" if off else os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600)),
+        "INSIGHTS_STORE_PATH": str(Path(state_dir) / "insights.db"),
+        "RESPONSE_CACHE_TTL": "0" if off else os.environ.get("RESPONSE_CACHE_TTL", "300"),
+        "RESPONSE_CACHE_SHARED": "",
+    }
+
+
+def run_child(plan, env):
+    out = subprocess.run(
+        [sys.executable, __file__, "--run-plan", json.dumps(plan)],
+        check=True, cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_gunicorn(plan, env, args):
+    """Launch gunicorn on a free port, wait for /api/ready, run the plan against it, stop it."""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app", "--bind", f"127.0.0.1:{port}",
+         "--workers", str(args.workers), "--threads", str(args.threads), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    try:
+        deadline = time.monotonic() + 120
+        while http_sender("127.0.0.1", port)("GET", "/api/ready", None) != 200:
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("gunicorn did not become ready")
+            time.sleep(0.5)
+        return run_child({**plan, "port": port}, env)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(target, customers, cache, results):
+    print(f"\n{target}, {customers:,} customers, cache {cache}")
+    print(f"{'route':<28} {'conc':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for concurrency, routes in results.items():
+        for name, r in routes.items():
+            print(
+                f"{name:<28} {concurrency:>5} {r['throughput_rps']:>9} {r['p50_ms']:>9.2f} "
+                f"{r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['errors']:>7}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", choices=["inprocess", "gunicorn", "both"], default="inprocess")
+    parser.add_argument("--customers", type=int, nargs="+", default=[150, 20000], help="data scales")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per route and level")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--routes", nargs="+", choices=sorted(ROUTES), default=None)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake LLM call")
+    parser.add_argument("--cache", nargs="+", choices=["off", "warm"], default=["off"],
+                        help="cache states to measure: off (caches disabled) and/or warm (primed before measuring)")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--work-dir", default=None, help="where datasets are kept (default: a temp dir)")
+    parser.add_argument("--output", default=None, help="JSON results path")
+    parser.add_argument("--run-plan", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_plan:
+        print(json.dumps(run_plan(json.loads(args.run_plan))))
+        return 0
+
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix="load_test-"))
+    targets = ["inprocess", "gunicorn"] if args.target == "both" else [args.target]
+    if "gunicorn" in targets:
+        try:
+            import gunicorn  # noqa: F401
+        except ImportError:
+            print("[load_test] gunicorn is not installed; skipping the gunicorn target")
+            targets.remove("gunicorn")
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k != "run_plan"},
+        },
+        "runs": [],
+    }
+    for customers in args.customers:
+        data_dir = prepare(work_dir, customers, args.seed)
+        with open(data_dir / "purchases.csv") as f:
+            purchase_rows = sum(1 for _ in f) - 1
+        for target in targets:
+            for cache in args.cache:
+                results = {}
+                for concurrency in args.concurrency:
+                    plan = {
+                        "target": target,
+                        "data_dir": str(data_dir),
+                        "routes": args.routes or list(ROUTES),
+                        "concurrency": [concurrency],
+                        "requests": args.requests,
+                        "warmup": args.warmup,
+                        "seed": args.seed,
+                        "cache": cache,
+                    }
+                    with tempfile.TemporaryDirectory(prefix=f"state-{cache}-", dir=work_dir) as state_dir:
+                        env = server_env(data_dir, state_dir, args, cache)
+                        results.update(
+                            run_gunicorn(plan, env, args) if target == "gunicorn" else run_child(plan, env)
+                        )
+                print_table(target, customers, cache, results)
+                report["runs"].append({
+                    "target": target,
+                    "customers": customers,
+                    "purchase_rows": purchase_rows,
+                    "cache": cache,
+                    **({"workers": args.workers, "threads": args.threads} if target == "gunicorn" else {}),
+                    "results": results,
+                })
+
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    output = Path(args.output or ROOT / "benchmarks" / "results" / f"load_test-{commit or 'nogit'}-{stamp}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\n[load_test] results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
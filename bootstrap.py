@@ -0,0 +1,65 @@
+"""
+Prepare data and model artifacts outside the web workers, so no request
+ever generates data or trains.
+
+    python bootstrap.py            # generate data / train only what is missing
+    python bootstrap.py train      # full retrain, publish a new model version
+    python bootstrap.py update     # fold in transactions appended since the last run
+
+Run it in the release phase (or before gunicorn starts, on hosts where
+workers don't share a disk with the release step). Until artifacts exist,
+the API answers 503 with Retry-After and /api/ready reports not ready.
+"""
+import argparse
+import sys
+import time
+
+from config import Config
+from storage import FileBackend, SQLiteBackend, get_backend, migrate_files_to_sqlite
+
+
+def bootstrap(train_missing=True):
+    """
+    Create whatever the configured backend is missing: synthetic data for
+    the file backend (or a migration of it into SQLite), then a model.
+    Does nothing when both already exist.
+    """
+    backend = get_backend()
+
+    if not backend.has_data():
+        files = backend if isinstance(backend, FileBackend) else FileBackend(Config.DATA_DIR)
+        if not files.has_data():
+            import data_generation
+            print(f"[bootstrap] Generating synthetic data in {files.data_dir}…")
+            data_generation.main(files.data_dir)
+        if isinstance(backend, SQLiteBackend):
+            print(f"[bootstrap] Migrating {files.data_dir} -> {backend.db_path}…")
+            migrate_files_to_sqlite(files.data_dir, backend.db_path)
+
+    if train_missing and not backend.has_model():
+        import model_train
+        print("[bootstrap] Training model artifacts…")
+        model_train.main()
+    return backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare data and model artifacts before serving")
+    parser.add_argument("command", nargs="?", default="bootstrap", choices=["bootstrap", "train", "update"])
+    parser.add_argument("--chunksize", type=int, default=None, help="CSV rows per training chunk")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    backend = bootstrap(train_missing=args.command == "bootstrap")
+    if args.command in ("train", "update"):
+        import model_train
+        getattr(model_train, "main" if args.command == "train" else "update")(args.chunksize)
+    print(
+        f"[bootstrap] {backend.describe()} ready (model {backend.model_version()}) "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
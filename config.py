@@ -1,4 +1,5 @@
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 # Load environment variables from .env file if it exists (for local development)
@@ -11,6 +12,72 @@ class Config:
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     OPENAI_ORG_ID = os.getenv('OPENAI_ORG_ID')
     OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+    # 'openai', or 'fake' for canned offline replies (no API key needed)
+    OPENAI_CLIENT = os.getenv('OPENAI_CLIENT', 'openai')
+    OPENAI_FAKE_LATENCY = float(os.getenv('OPENAI_FAKE_LATENCY', '0.5'))
+    OPENAI_FAKE_TOKEN_DELAY = float(os.getenv('OPENAI_FAKE_TOKEN_DELAY', '0.03'))
+    # LLM calls: concurrent upstream calls, queued calls before rejecting, per-call timeout
+    # (seconds) and how long finished results wait for a polling client
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '4'))
+    LLM_MAX_PENDING = int(os.getenv('LLM_MAX_PENDING', '32'))
+    LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '20'))
+    LLM_JOB_TTL = float(os.getenv('LLM_JOB_TTL', '300'))
+    # Retry-After (seconds) sent with the 503 when LLM calls are being shed
+    LLM_RETRY_AFTER = int(os.getenv('LLM_RETRY_AFTER', '2'))
+
+    # Data / artifact location
+    DATA_DIR = Path(os.getenv('DATA_DIR', Path(__file__).parent / 'data'))
+    # Where recommend.py / app.py read data from: 'files' (DATA_DIR) or 'sqlite'
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'files')
+    SQLITE_PATH = Path(os.getenv('SQLITE_PATH', DATA_DIR / 'crosssell.db'))
+    # How often workers stat the model bundle pointer for a new version (-1 disables)
+    ARTIFACT_RELOAD_SECONDS = float(os.getenv('ARTIFACT_RELOAD_SECONDS', '5'))
+    # Retry-After (seconds) on 503s served while artifacts are still being built
+    ARTIFACT_RETRY_AFTER = int(os.getenv('ARTIFACT_RETRY_AFTER', '30'))
+    # Memory-map columnar model files so all workers share one page-cache copy
+    ARTIFACT_MMAP = os.getenv('ARTIFACT_MMAP', '1') not in ('0', 'false', 'False')
+    # Training: rows per CSV chunk when streaming baskets, cap on sampled training pairs
+    TRAIN_CHUNKSIZE = int(os.getenv('TRAIN_CHUNKSIZE', '500000'))
+    TRAIN_MAX_PAIRS = int(os.getenv('TRAIN_MAX_PAIRS', '5000000'))
+    # Popularity-sampled negatives per positive training pair
+    TRAIN_NEG_RATIO = float(os.getenv('TRAIN_NEG_RATIO', '1.0'))
+    # Embedding trainer: 'numpy' (no extra dependencies) or 'tensorflow' (needs requirements-tf.txt)
+    EMBEDDING_TRAINER = os.getenv('EMBEDDING_TRAINER', 'numpy')
+    # Response cache for the recommendation routes: TTL seconds (0 disables), in-process
+    # LRU bounds, optional shared tier ('disk' or a redis:// URL) and browser max-age
+    RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '300'))
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '4096'))
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+    RESPONSE_CACHE_SHARED = os.getenv('RESPONSE_CACHE_SHARED', '')
+    RESPONSE_CACHE_PATH = Path(os.getenv('RESPONSE_CACHE_PATH', str(DATA_DIR / 'response_cache.db')))
+    RESPONSE_CACHE_MAX_AGE = int(os.getenv('RESPONSE_CACHE_MAX_AGE', '60'))
+    # Persistent LLM response cache keyed by prompt fingerprint (TTL 0 disables)
+    LLM_CACHE_PATH = Path(os.getenv('LLM_CACHE_PATH', str(DATA_DIR / 'llm_cache.db')))
+    LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600)))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '20000'))
+    # Precomputed customer insights (insights_batch.py): store, parallel calls, calls per minute
+    INSIGHTS_STORE_PATH = Path(os.getenv('INSIGHTS_STORE_PATH', str(DATA_DIR / 'insights.db')))
+    INSIGHTS_BATCH_CONCURRENCY = int(os.getenv('INSIGHTS_BATCH_CONCURRENCY', '4'))
+    INSIGHTS_BATCH_RPM = float(os.getenv('INSIGHTS_BATCH_RPM', '60'))
+    # Request/stage histograms and counters served at /metrics (0 turns recording off)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') not in ('0', 'false', 'False')
+    # Request profiling: admin token for on-demand profiles (unset disables them and the admin
+    # routes), fraction of live traffic profiled continuously, and where profiles are kept
+    PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    PROFILE_SAMPLE_MODE = os.getenv('PROFILE_SAMPLE_MODE', 'sampling')
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005'))
+    PROFILE_DIR = Path(os.getenv('PROFILE_DIR', str(DATA_DIR / 'profiles')))
+    PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '200'))
+    # Storage dtype for normalized embeddings: float64, float32 or float16 (compact)
+    SIMILARITY_DTYPE = os.getenv('SIMILARITY_DTYPE', 'float32')
+    # Approximate nearest-neighbour index over the embeddings, built by training for catalogs of at
+    # least ANN_MIN_ITEMS items: clusters (0 = about 4*sqrt(items)) and clusters scanned per query
+    ANN_MIN_ITEMS = int(os.getenv('ANN_MIN_ITEMS', '20000'))
+    ANN_NLIST = int(os.getenv('ANN_NLIST', '0'))
+    ANN_NPROBE = int(os.getenv('ANN_NPROBE', '16'))
+    # Nearest embedding neighbours added to each item's suggestion candidates (0 = rules and complements only)
+    EMBEDDING_CANDIDATES = int(os.getenv('EMBEDDING_CANDIDATES', '0'))
     
     @classmethod
     def validate_openai_config(cls):
@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+
+
+class _KeyIndex:
+    """
+    Row positions of a DataFrame ordered by `sort_cols`, with the first sort
+    column kept as a sorted key array. Looking a key up is two binary
+    searches and returns the key's row positions already in sort order.
+    """
+
+    def __init__(self, frame, sort_cols, ascending=True):
+        key_col = sort_cols[0]
+        ordered = frame.reset_index(drop=True).sort_values(sort_cols, ascending=ascending, kind="stable")
+        self.order = ordered.index.to_numpy()
+        self.keys = ordered[key_col].to_numpy()
+
+    def rows(self, key):
+        if key is None or len(self.keys) == 0:
+            return self.order[:0]
+        try:
+            lo = np.searchsorted(self.keys, key, side="left")
+            hi = np.searchsorted(self.keys, key, side="right")
+        except TypeError:
+            # key of a different type than the column can't match anything
+            return self.order[:0]
+        return self.order[lo:hi]
+
+
+class CustomerRepository:
+    """
+    Customer-facing lookups over the customers/purchases/invoices tables.
+    Each table is indexed once by customer_id (and invoice_items by
+    invoice_id), so a lookup costs O(log n + result size) instead of a
+    full-frame boolean mask.
+    """
+
+    def __init__(self, customers, purchases, invoices, invoice_items):
+        self.customers = customers.reset_index(drop=True)
+        self.purchases = purchases.reset_index(drop=True)
+        self.invoices = invoices.reset_index(drop=True)
+        self.invoice_items = invoice_items.reset_index(drop=True)
+
+        self._customer_idx = _KeyIndex(self.customers, ["customer_id"])
+        # history oldest -> newest, invoices newest -> oldest
+        self._purchase_idx = _KeyIndex(self.purchases, ["customer_id", "date"])
+        self._invoice_idx = _KeyIndex(self.invoices, ["customer_id", "date"], ascending=[True, False])
+        self._item_idx = _KeyIndex(self.invoice_items, ["invoice_id"])
+
+    def list_customers(self):
+        """(ids, names) in file order."""
+        return self.customers["customer_id"].tolist(), self.customers["name"].tolist()
+
+    def details(self, customer_id):
+        """Customer row as a dict, or None if unknown."""
+        rows = self._customer_idx.rows(customer_id)
+        if len(rows) == 0:
+            return None
+        return self.customers.take(rows[:1]).to_dict(orient="records")[0]
+
+    def history(self, customer_id):
+        """All purchases for the customer, oldest first."""
+        return self.purchases.take(self._purchase_idx.rows(customer_id)).to_dict(orient="records")
+
+    def recent_purchase(self, customer_id):
+        rows = self._purchase_idx.rows(customer_id)
+        if len(rows) == 0:
+            return None
+        return self.purchases["item"].iat[rows[-1]]
+
+    def invoice_item_names(self, invoice_id):
+        return self.invoice_items["item"].take(self._item_idx.rows(invoice_id)).tolist()
+
+    def recent_invoices(self, customer_id, limit=2):
+        """Most recent invoices first, each with its line items."""
+        rows = self._invoice_idx.rows(customer_id)[: max(limit, 0)]
+        out = []
+        for inv in self.invoices.take(rows).to_dict(orient="records"):
+            out.append({
+                "invoice_id": inv["invoice_id"],
+                "date": inv["date"],
+                "items": self.invoice_item_names(inv["invoice_id"]),
+                "total": inv["total"],
+            })
+        return out
+
+    def memory_usage(self):
+        frames = (self.customers, self.purchases, self.invoices, self.invoice_items)
+        indexes = (self._customer_idx, self._purchase_idx, self._invoice_idx, self._item_idx)
+        return int(
+            sum(f.memory_usage(deep=True).sum() for f in frames)
+            + sum(i.order.nbytes + i.keys.nbytes for i in indexes)
+        )
+
+
+class SQLiteCustomerRepository:
+    """
+    Same lookups as CustomerRepository, answered by indexed queries against
+    the SQLite backend instead of tables held in memory. `connect` returns
+    the calling thread's connection.
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+
+    def _rows(self, sql, params=()):
+        return [dict(r) for r in self._connect().execute(sql, params)]
+
+    def _frame(self, table):
+        return pd.read_sql_query(f"SELECT * FROM {table} ORDER BY rowid", self._connect())
+
+    # full tables, for offline callers only: each access reads the whole table
+    @property
+    def customers(self):
+        return self._frame("customers")
+
+    @property
+    def purchases(self):
+        return self._frame("purchases")
+
+    @property
+    def invoices(self):
+        return self._frame("invoices")
+
+    @property
+    def invoice_items(self):
+        return self._frame("invoice_items")
+
+    def list_customers(self):
+        rows = self._connect().execute("SELECT customer_id, name FROM customers ORDER BY rowid").fetchall()
+        return [r[0] for r in rows], [r[1] for r in rows]
+
+    def details(self, customer_id):
+        rows = self._rows("SELECT * FROM customers WHERE customer_id = ?", (customer_id,))
+        return rows[0] if rows else None
+
+    def history(self, customer_id):
+        return self._rows(
+            "SELECT customer_id, date, item FROM purchases WHERE customer_id = ? ORDER BY date, rowid",
+            (customer_id,),
+        )
+
+    def recent_purchase(self, customer_id):
+        row = self._connect().execute(
+            "SELECT item FROM purchases WHERE customer_id = ? ORDER BY date DESC, rowid DESC LIMIT 1",
+            (customer_id,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def invoice_item_names(self, invoice_id):
+        rows = self._connect().execute(
+            "SELECT item FROM invoice_items WHERE invoice_id = ? ORDER BY rowid", (invoice_id,)
+        )
+        return [r[0] for r in rows]
+
+    def recent_invoices(self, customer_id, limit=2):
+        invoices = self._rows(
+            "SELECT invoice_id, date, total FROM invoices WHERE customer_id = ? "
+            "ORDER BY date DESC, rowid LIMIT ?",
+            (customer_id, max(limit, 0)),
+        )
+        return [
+            {
+                "invoice_id": inv["invoice_id"],
+                "date": inv["date"],
+                "items": self.invoice_item_names(inv["invoice_id"]),
+                "total": inv["total"],
+            }
+            for inv in invoices
+        ]
+
+    def memory_usage(self):
+        # rows live in SQLite's page cache, not in the Python heap
+        return 0
@@ -1,10 +1,12 @@
+import argparse
 import json
-import random
+import time
+import numpy as np
 import pandas as pd
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import date, timedelta
 
-random.seed(7)
+from config import Config
 
 def get_products():
     products = [
@@ -44,118 +46,222 @@ def get_products():
     all_items = sorted(set(products + [c for v in complements.values() for c in v]))
     return products, complements, all_items
 
-def make_customers(n_customers=150):
-    first_names = ["Olivia","Liam","Emma","Noah","Ava","Sophia","Elijah","Isabella","Lucas","Mia",
-                   "Mason","Charlotte","Ethan","Amelia","James","Harper","Benjamin","Evelyn","Henry","Abigail"]
-    last_names  = ["Smith","Johnson","Williams","Brown","Jones","Garcia","Miller","Davis","Rodriguez","Martinez",
-                   "Hernandez","Lopez","Gonzalez","Wilson","Anderson","Thomas","Taylor","Moore","Jackson","Martin"]
-    streets     = ["Oak","Maple","Pine","Cedar","Elm","Willow","Birch","Walnut","Chestnut","Spruce"]
-    cities      = ["Cleveland","Akron","Parma","Mentor","Medina","Strongsville","Lakewood","Euclid","Lorain","Brunswick"]
-    states      = ["OH"]
-    zips        = ["44101","44102","44103","44104","44105","44106","44107","44108","44109","44110"]
-
-    rows = []
-    for i in range(1, n_customers+1):
-        name = f"{random.choice(first_names)} {random.choice(last_names)}"
-        addr = f"{random.randint(100,9999)} {random.choice(streets)} St"
-        city = random.choice(cities)
-        state = random.choice(states)
-        zipc = random.choice(zips)
-        phone = f"({random.randint(216,440)}) {random.randint(200,999)}-{random.randint(1000,9999)}"
-        email = f"{name.lower().replace(' ', '.')}@example.com"
-        rows.append({
-            "customer_id": f"C{i:04d}",
-            "name": name,
-            "address": f"{addr}, {city}, {state} {zipc}",
-            "phone": phone,
-            "email": email
-        })
-    return pd.DataFrame(rows)
-
-def biased_choice(base_items, anchor=None, complements=None):
-    if anchor is None or complements is None:
-        return random.choice(base_items)
-    choices = base_items[:]
-    weights = []
-    for item in choices:
-        w = 1.0
-        if anchor in complements and item in complements[anchor]:
-            w = 4.0
-        if item == anchor:
-            w = 0.2
-        weights.append(w)
-    total = sum(weights)
-    pick = random.uniform(0, total)
-    cum = 0
-    for item, w in zip(choices, weights):
-        cum += w
-        if pick <= cum:
-            return item
-    return random.choice(base_items)
-
-def make_purchases(customers_df, products, complements, all_items, days=120):
-    rows = []
-    start_date = datetime.today() - timedelta(days=days)
-    for _, row in customers_df.iterrows():
-        customer_id = row["customer_id"]
-        num_orders = random.randint(2, 7)
-        order_dates = sorted([start_date + timedelta(days=random.randint(0, days)) for _ in range(num_orders)])
-        for dt in order_dates:
-            # main item
-            main_item = random.choice(products)
-            rows.append({
-                "customer_id": customer_id,
-                "date": dt.strftime("%Y-%m-%d"),
-                "item": main_item
-            })
-            # possible complements (1-3 items)
-            k = random.randint(0, 3)
-            for _ in range(k):
-                comp = biased_choice(all_items, anchor=main_item, complements=complements)
-                rows.append({
-                    "customer_id": customer_id,
-                    "date": dt.strftime("%Y-%m-%d"),
-                    "item": comp
-                })
-            # occasional service contract
-            if random.random() < 0.25:
-                rows.append({
-                    "customer_id": customer_id,
-                    "date": dt.strftime("%Y-%m-%d"),
-                    "item": "Maintenance Plan"
-                })
-    purchases = pd.DataFrame(rows).sort_values(["customer_id", "date"])
-    return purchases
-
-def make_invoices(customers_df, products, complements, prices, days_back=120):
-    """Two prior invoices per customer; each invoice: 1-3 mains + their complements."""
-    invoices = []
-    inv_items = []
-    start = datetime.today() - timedelta(days=days_back)
-    for _, row in customers_df.iterrows():
-        cid = row["customer_id"]
-        for n in range(2):  # two invoices
-            dt = start + timedelta(days=random.randint(0, days_back-7*(1-n)))
-            # choose mains (bias to 1-2 mains)
-            mains = random.sample(products, k=random.choice([1,1,2]))
-            items = set(mains)
-            # add complements
-            for m in mains:
-                for _ in range(random.choice([1,2,2,3])):
-                    comp_choices = complements.get(m, [])
-                    if comp_choices:
-                        items.add(random.choice(comp_choices))
-            # maybe add plan
-            if random.random() < 0.35:
-                items.add("Maintenance Plan")
-
-            # total from prices
-            total = sum(prices.get(i, 29) for i in items)
-            inv_id = f"INV-{cid}-{n+1}"
-            invoices.append({"invoice_id": inv_id, "customer_id": cid, "date": dt.strftime("%Y-%m-%d"), "total": round(total, 2)})
-            for it in items:
-                inv_items.append({"invoice_id": inv_id, "item": it})
-    return pd.DataFrame(invoices), pd.DataFrame(inv_items)
+# Customers generated (and written) per chunk. Each chunk draws from its own
+# stream seeded with (seed, chunk number), so output is reproducible and
+# memory stays bounded however many customers are requested.
+CUSTOMERS_PER_CHUNK = 50_000
+MAINTENANCE_PLAN = "Maintenance Plan"
+
+FIRST_NAMES = ["Olivia","Liam","Emma","Noah","Ava","Sophia","Elijah","Isabella","Lucas","Mia",
+               "Mason","Charlotte","Ethan","Amelia","James","Harper","Benjamin","Evelyn","Henry","Abigail"]
+LAST_NAMES  = ["Smith","Johnson","Williams","Brown","Jones","Garcia","Miller","Davis","Rodriguez","Martinez",
+               "Hernandez","Lopez","Gonzalez","Wilson","Anderson","Thomas","Taylor","Moore","Jackson","Martin"]
+STREETS     = ["Oak","Maple","Pine","Cedar","Elm","Willow","Birch","Walnut","Chestnut","Spruce"]
+CITIES      = ["Cleveland","Akron","Parma","Mentor","Medina","Strongsville","Lakewood","Euclid","Lorain","Brunswick"]
+STATES      = ["OH"]
+ZIPS        = ["44101","44102","44103","44104","44105","44106","44107","44108","44109","44110"]
+
+
+def _pick(options, n, rng):
+    return np.asarray(options, dtype=object)[rng.integers(0, len(options), size=n)]
+
+
+def _digits(low, high, n, rng):
+    return pd.Series(rng.integers(low, high + 1, size=n)).astype(str)
+
+
+def scale_catalog(products, complements, prices, rooms, catalog_size, rng):
+    """
+    Grow the catalog to `catalog_size` main products by adding model
+    variants of the base ones ("Refrigerator Model 0003"): same room and
+    add-ons, price jittered by 0.6-1.6x.
+    """
+    if not catalog_size or catalog_size <= len(products):
+        return products, complements, prices, rooms
+    extra = catalog_size - len(products)
+    width = max(4, len(str(extra)))
+    bases = rng.integers(0, len(products), size=extra).tolist()
+    factors = rng.uniform(0.6, 1.6, size=extra).tolist()
+    base_products = products
+    products, complements, prices, rooms = list(products), dict(complements), dict(prices), dict(rooms)
+    for k, (b, factor) in enumerate(zip(bases, factors), 1):
+        base = base_products[b]
+        name = f"{base} Model {k:0{width}d}"
+        products.append(name)
+        complements[name] = complements[base]
+        prices[name] = int(round(prices.get(base, 29) * factor))
+        if base in rooms:
+            rooms[name] = rooms[base]
+    return products, complements, prices, rooms
+
+
+class ComplementSampler:
+    """
+    Weighted add-on picks for many anchors (main products) at once. Every
+    candidate weighs 1, the anchor's complements 4 and the anchor itself
+    0.2. Each anchor gets a cumulative weight table over its few special
+    items plus one "rest" bucket, and all draws are located with a single
+    searchsorted; a "rest" draw is uniform over the other items.
+    """
+
+    def __init__(self, anchors, complements, candidates):
+        pos = {item: i for i, item in enumerate(candidates)}
+        self.n_candidates = n = len(candidates)
+        self.width = width = max(len(complements.get(a, [])) for a in anchors) + 1
+        # special candidate indices per anchor, ascending, padded with n (larger than any index)
+        self.special = np.full((len(anchors), width), n, dtype=np.int64)
+        weights = np.zeros((len(anchors), width + 1))
+        for row, anchor in enumerate(anchors):
+            entries = {pos[c]: 4.0 for c in complements.get(anchor, []) if c in pos}
+            if anchor in pos:
+                entries[pos[anchor]] = 0.2
+            idx = sorted(entries)
+            self.special[row, :len(idx)] = idx
+            weights[row, :len(idx)] = [entries[i] for i in idx]
+            weights[row, width] = n - len(idx)
+        self.n_special = (self.special < n).sum(axis=1)
+        cum = np.cumsum(weights, axis=1)
+        # row r's table normalized into (r, r + 1], so one sorted array serves every anchor
+        self.keys = (cum / cum[:, -1:] + np.arange(len(anchors))[:, None]).ravel()
+
+    def sample(self, anchors, rng):
+        """One candidate index per entry of `anchors` (anchor row numbers)."""
+        anchors = np.asarray(anchors, dtype=np.int64)
+        if len(anchors) == 0:
+            return anchors
+        bucket = np.searchsorted(self.keys, anchors + rng.random(len(anchors)), side="right")
+        bucket -= anchors * (self.width + 1)
+        special = self.special[anchors]
+        # uniform over candidates that aren't special for this anchor: draw a rank,
+        # then step over the (sorted) special indices at or below it
+        rest = (rng.random(len(anchors)) * (self.n_candidates - self.n_special[anchors])).astype(np.int64)
+        for j in range(self.width):
+            rest += special[:, j] <= rest
+        picked = special[np.arange(len(anchors)), np.minimum(bucket, self.width - 1)]
+        return np.where(bucket < self.width, picked, rest)
+
+
+def make_customers(customer_numbers, rng, id_width=4):
+    """Customer rows for the given 1-based customer numbers."""
+    n = len(customer_numbers)
+    ids = "C" + pd.Series(customer_numbers).astype(str).str.zfill(id_width)
+    names = pd.Series(_pick(FIRST_NAMES, n, rng)) + " " + pd.Series(_pick(LAST_NAMES, n, rng))
+    address = (
+        _digits(100, 9999, n, rng) + " " + pd.Series(_pick(STREETS, n, rng)) + " St, "
+        + pd.Series(_pick(CITIES, n, rng)) + ", " + pd.Series(_pick(STATES, n, rng)) + " "
+        + pd.Series(_pick(ZIPS, n, rng))
+    )
+    phone = "(" + _digits(216, 440, n, rng) + ") " + _digits(200, 999, n, rng) + "-" + _digits(1000, 9999, n, rng)
+    email = names.str.lower().str.replace(" ", ".", regex=False) + "@example.com"
+    return pd.DataFrame({"customer_id": ids, "name": names, "address": address, "phone": phone, "email": email})
+
+
+def make_purchases(n_customers, catalog, rng, orders=(2, 7), days=120):
+    """
+    Session baskets for `n_customers` customers (row numbers into the
+    chunk): each order is a main product, 0-3 biased add-ons and sometimes
+    a maintenance plan. Returns (customer row, day offset, item index)
+    arrays, grouped by customer and oldest order first.
+    """
+    n_orders = rng.integers(orders[0], orders[1] + 1, size=n_customers)
+    order_customer = np.repeat(np.arange(n_customers), n_orders)
+    order_day = rng.integers(0, days + 1, size=len(order_customer))
+    order_day = order_day[np.lexsort((order_day, order_customer))]
+    n = len(order_customer)
+
+    mains = rng.integers(0, len(catalog.products), size=n)
+    comp_order = np.repeat(np.arange(n), rng.integers(0, 4, size=n))
+    comps = catalog.candidate_items[catalog.sampler.sample(mains[comp_order], rng)]
+    plan_order = np.flatnonzero(rng.random(n) < 0.25)
+
+    # rows per order: main, add-ons, plan (a stable sort on the order keeps that layout)
+    row_order = np.concatenate([np.arange(n), comp_order, plan_order])
+    items = np.concatenate([catalog.product_items[mains], comps, np.full(len(plan_order), catalog.plan_item)])
+    keep = np.argsort(row_order, kind="stable")
+    row_order = row_order[keep]
+    return order_customer[row_order], order_day[row_order], items[keep]
+
+
+def make_invoices(n_customers, catalog, rng, days_back=120):
+    """
+    Two prior invoices per customer; each invoice: 1-2 mains, 1-3 of each
+    main's complements and sometimes a plan (items de-duplicated). Returns
+    (customer row, invoice number, day offset, total) per invoice and
+    (invoice row, item index) per line item.
+    """
+    n = 2 * n_customers
+    customer = np.repeat(np.arange(n_customers), 2)
+    number = np.tile([1, 2], n_customers)
+    day = rng.integers(0, days_back - 7 * (2 - number) + 1)
+
+    n_products = len(catalog.products)
+    first = rng.integers(0, n_products, size=n)
+    second = (first + rng.integers(1, max(n_products, 2), size=n)) % n_products
+    two = rng.random(n) < 1 / 3
+    main_invoice = np.concatenate([np.arange(n), np.flatnonzero(two)])
+    main_product = np.concatenate([first, second[two]])
+
+    comp_rows = np.repeat(np.arange(len(main_invoice)), rng.choice([1, 2, 2, 3], size=len(main_invoice)))
+    comp_product = main_product[comp_rows]
+    n_comps = catalog.comp_len[comp_product]
+    pick = (rng.random(len(comp_rows)) * n_comps).astype(np.int64)
+    has = n_comps > 0
+    comp_items = catalog.comp_table[comp_product[has], pick[has]]
+
+    plan_invoice = np.flatnonzero(rng.random(n) < 0.35)
+    line_invoice = np.concatenate([main_invoice, main_invoice[comp_rows[has]], plan_invoice])
+    line_item = np.concatenate([
+        catalog.product_items[main_product], comp_items, np.full(len(plan_invoice), catalog.plan_item)
+    ])
+    n_items = len(catalog.items)
+    lines = np.unique(line_invoice.astype(np.int64) * n_items + line_item)
+    line_invoice, line_item = lines // n_items, lines % n_items
+
+    total = np.round(np.bincount(line_invoice, weights=catalog.prices[line_item], minlength=n), 2)
+    if np.array_equal(total, np.floor(total)):
+        total = total.astype(np.int64)
+    return (customer, number, day, total), (line_invoice, line_item)
+
+
+def append_csv(path, frame, header):
+    """
+    Write `frame` to a CSV (starting the file when `header`) by joining its
+    values as plain strings, several times faster than DataFrame.to_csv.
+    Only for values that never need quoting: ids, dates, numbers, plain
+    item names.
+    """
+    columns = [frame[c].to_numpy() for c in frame.columns]
+    lines = columns[0] if columns[0].dtype == object else columns[0].astype(str).astype(object)
+    for values in columns[1:]:
+        lines = lines + "," + (values if values.dtype == object else values.astype(str).astype(object))
+    with open(path, "w" if header else "a", newline="") as f:
+        if header:
+            f.write(",".join(frame.columns) + "\n")
+        if len(lines):
+            f.write("\n".join(lines.tolist()) + "\n")
+
+
+class Catalog:
+    """Products, add-ons and prices in index form for the vectorized generators."""
+
+    def __init__(self, products, complements, all_items, prices):
+        self.products = products
+        self.items = np.asarray(sorted(set(all_items + [MAINTENANCE_PLAN])), dtype=object)
+        index = {item: i for i, item in enumerate(self.items)}
+        self.product_items = np.array([index[p] for p in products], dtype=np.int64)
+        self.candidate_items = np.array([index[c] for c in all_items], dtype=np.int64)
+        self.plan_item = index[MAINTENANCE_PLAN]
+        self.plain_names = not any(ch in item for item in self.items for ch in ',"\r\n')
+        self.prices = np.array([prices.get(i, 29) for i in self.items], dtype=np.float64)
+        self.sampler = ComplementSampler(products, complements, all_items)
+        width = max(len(complements.get(p, [])) for p in products)
+        self.comp_table = np.zeros((len(products), max(width, 1)), dtype=np.int64)
+        self.comp_len = np.zeros(len(products), dtype=np.int64)
+        for row, p in enumerate(products):
+            comps = [index[c] for c in complements.get(p, [])]
+            self.comp_table[row, :len(comps)] = comps
+            self.comp_len[row] = len(comps)
+
 
 def write_catalog(all_items, data_dir):
     pd.DataFrame({"item": all_items}).to_csv(data_dir / "products.csv", index=False)
@@ -218,35 +324,101 @@ def write_prices_rooms(prices, rooms, data_dir):
     (data_dir / "prices.json").write_text(json.dumps(prices))
     (data_dir / "rooms.json").write_text(json.dumps(rooms))
 
-def main():
-    base = Path(__file__).parent
-    data_dir = base / "data"
+def generate(data_dir=None, customers=150, orders=(2, 7), catalog_size=None, days=120, seed=7, end_date=None):
+    """
+    Write the synthetic dataset: `customers` customers with `orders`
+    (min, max) session orders each over the last `days` days, and a catalog
+    of `catalog_size` main products (default: the 25 base ones). Rows are
+    written CUSTOMERS_PER_CHUNK customers at a time, so memory does not grow
+    with the customer count. The same seed and parameters give the same
+    data (dates are relative to `end_date`, default today).
+    """
+    data_dir = Path(data_dir) if data_dir else Config.DATA_DIR
     data_dir.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
 
     products, complements, all_items = get_products()
     prices = get_price_map()
     rooms  = get_room_map()
+    products, complements, prices, rooms = scale_catalog(
+        products, complements, prices, rooms, catalog_size, np.random.default_rng([seed, 0])
+    )
+    catalog = Catalog(products, complements, sorted(set(all_items + products)), prices)
+
+    # day offsets -> date strings, oldest (end - days) first
+    end = end_date or date.today()
+    dates = np.array([(end - timedelta(days=days - d)).strftime("%Y-%m-%d") for d in range(days + 1)])
+    id_width = max(4, len(str(customers)))
 
-    customers_df = make_customers(150)
-    # Purchases (session baskets)
-    purchases_df = make_purchases(customers_df, products, complements, all_items, days=120)
-    # Invoices (historical, 2 per customer)
-    invoices_df, invoice_items_df = make_invoices(customers_df, products, complements, prices)
+    outputs = ("customers.csv", "purchases.csv", "invoices.csv", "invoice_items.csv")
+    n_purchases = 0
+    for chunk, first in enumerate(range(1, customers + 1, CUSTOMERS_PER_CHUNK), 1):
+        rng = np.random.default_rng([seed, chunk])
+        numbers = np.arange(first, min(first + CUSTOMERS_PER_CHUNK, customers + 1))
+        customers_df = make_customers(numbers, rng, id_width)
+        ids = customers_df["customer_id"].to_numpy()
 
-    customers_df.to_csv(data_dir / "customers.csv", index=False)
-    purchases_df.to_csv(data_dir / "purchases.csv", index=False)
-    invoices_df.to_csv(data_dir / "invoices.csv", index=False)
-    invoice_items_df.to_csv(data_dir / "invoice_items.csv", index=False)
+        # Purchases (session baskets)
+        customer, day, item = make_purchases(len(numbers), catalog, rng, orders=orders, days=days)
+        purchases_df = pd.DataFrame(
+            {"customer_id": ids[customer], "date": dates[day], "item": catalog.items[item]}
+        )
+        # Invoices (historical, 2 per customer)
+        (inv_customer, number, inv_day, total), (line_invoice, line_item) = make_invoices(
+            len(numbers), catalog, rng, days_back=days
+        )
+        invoice_ids = "INV-" + pd.Series(ids[inv_customer]) + "-" + pd.Series(number).astype(str)
+        invoices_df = pd.DataFrame({
+            "invoice_id": invoice_ids, "customer_id": ids[inv_customer], "date": dates[inv_day],
+            "total": total,
+        })
+        invoice_items_df = pd.DataFrame(
+            {"invoice_id": invoice_ids.to_numpy()[line_invoice], "item": catalog.items[line_item]}
+        )
+
+        header = chunk == 1
+        customers_df.to_csv(data_dir / "customers.csv", index=False, mode="w" if header else "a", header=header)
+        for name, frame in zip(outputs[1:], (purchases_df, invoices_df, invoice_items_df)):
+            if catalog.plain_names:
+                append_csv(data_dir / name, frame, header)
+            else:
+                frame.to_csv(data_dir / name, index=False, mode="w" if header else "a", header=header)
+        n_purchases += len(purchases_df)
 
-    write_catalog(sorted(set(all_items + ["Maintenance Plan"])), data_dir)
+    write_catalog(list(catalog.items), data_dir)
     write_main_products(products, data_dir)        # from earlier step
     write_complements(complements, data_dir)       # from earlier step
     write_prices_rooms(prices, rooms, data_dir)
+    save_mapping(list(catalog.items), data_dir)
+
+    print(
+        f"Synthetic data created under {data_dir} ({customers:,} customers, {n_purchases:,} purchase rows, "
+        f"{len(products)} main products) in {time.perf_counter() - started:.1f}s"
+    )
+
 
-    all_map_items = sorted(set(all_items + ["Maintenance Plan"]))
-    save_mapping(all_map_items, data_dir)
+def main(data_dir=None):
+    generate(data_dir)
 
-    print("Synthetic data created under ./data (customers, purchases, invoices, prices, rooms)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate synthetic customers, purchases and invoices")
+    parser.add_argument("--data-dir", default=None)
+    parser.add_argument("--customers", type=int, default=150)
+    parser.add_argument("--min-orders", type=int, default=2, help="session orders per customer, lower bound")
+    parser.add_argument("--max-orders", type=int, default=7, help="session orders per customer, upper bound")
+    parser.add_argument("--catalog-size", type=int, default=None, help="main products (default: the 25 base ones)")
+    parser.add_argument("--days", type=int, default=120, help="history window in days")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--end-date", type=date.fromisoformat, default=None, help="YYYY-MM-DD (default: today)")
+    args = parser.parse_args()
+    if args.customers < 1:
+        parser.error("--customers must be at least 1")
+    if args.days < 7:
+        parser.error("--days must be at least 7 (invoices are spread a week apart)")
+    if not 0 <= args.min_orders <= args.max_orders:
+        parser.error("--min-orders must be between 0 and --max-orders")
+    generate(
+        args.data_dir, customers=args.customers, orders=(args.min_orders, args.max_orders),
+        catalog_size=args.catalog_size, days=args.days, seed=args.seed, end_date=args.end_date,
+    )
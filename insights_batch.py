@@ -0,0 +1,226 @@
+"""
+Precompute customer insights offline so /api/customer_insights can answer
+from storage instead of calling the LLM on a page view.
+
+    python insights_batch.py                  # every customer whose insight is stale
+    python insights_batch.py --changed-only   # only customers with purchases since the last run
+    python insights_batch.py --force          # regenerate everything
+
+Each stored insight carries the fingerprint of the request it answered
+(OpenAIService.insights_fingerprint: the customer's recent history and
+invoices as the prompt renders them, plus the model). The endpoint serves
+the stored insight while the fingerprint still matches and regenerates
+only when it changes. Calls run on a small pool behind a token-bucket rate
+limiter (INSIGHTS_BATCH_CONCURRENCY, INSIGHTS_BATCH_RPM). Meant to run
+nightly, e.g. from cron or a scheduled job after `bootstrap.py update`.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from config import Config
+from recommend import DETAIL_KEYS
+from storage import sqlite_connection
+
+# what a stored insight keeps: the completion itself, not per-response fields such as
+# cached/precomputed or an async poll's status/job_id
+STORED_FIELDS = ("success", "insights", "model_used")
+
+
+class InsightStore:
+    """Latest successful insight per customer, with the fingerprint it was generated for."""
+
+    def __init__(self, path=None):
+        self.path = Path(path or Config.INSIGHTS_STORE_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS insights ("
+            " customer_id TEXT PRIMARY KEY, fingerprint TEXT, result TEXT, created REAL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _connect(self):
+        return sqlite_connection(self._local, self.path)
+
+    def get(self, customer_id, fingerprint):
+        """The stored result if it was generated for `fingerprint`, else None."""
+        row = self._connect().execute(
+            "SELECT result FROM insights WHERE customer_id = ? AND fingerprint = ?", (customer_id, fingerprint)
+        ).fetchone()
+        return {k: v for k, v in json.loads(row[0]).items() if k in STORED_FIELDS} if row else None
+
+    def fingerprints(self):
+        """{customer_id: fingerprint} for every stored insight."""
+        return dict(self._connect().execute("SELECT customer_id, fingerprint FROM insights"))
+
+    def put(self, customer_id, fingerprint, result):
+        result = {k: v for k, v in result.items() if k in STORED_FIELDS}
+        self._connect().execute(
+            "INSERT OR REPLACE INTO insights VALUES (?, ?, ?, ?)",
+            (customer_id, fingerprint, json.dumps(result), time.time()),
+        )
+
+    def watermark(self):
+        """Latest purchase/invoice date seen by the last completed run, or None."""
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'watermark'").fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, value):
+        self._connect().execute("INSERT OR REPLACE INTO meta VALUES ('watermark', ?)", (value,))
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM insights").fetchone()[0]
+
+
+class RateLimiter:
+    """Token bucket: `rate` calls per second on average, bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call may start."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def customers_with_activity_since(repo, watermark):
+    """Customer ids with a purchase or invoice dated after `watermark`."""
+    ids = set()
+    for frame in (repo.purchases, repo.invoices):
+        dates = frame["date"].astype(str)
+        ids.update(frame.loc[dates > watermark, "customer_id"].tolist())
+    return ids
+
+
+def latest_activity(repo):
+    """Newest purchase or invoice date, as the watermark for the next run."""
+    dates = pd.concat([repo.purchases["date"], repo.invoices["date"]]).astype(str)
+    return dates.max() if len(dates) else None
+
+
+def insights_inputs(repo, customer_id, invoice_limit=2):
+    """(customer, history, recent invoices) for the insights prompt, or None if unknown."""
+    row = repo.details(customer_id)
+    if row is None:
+        return None
+    recent_invoices = [
+        {"date": inv["date"], "items": inv["items"], "total": inv["total"]}
+        for inv in repo.recent_invoices(customer_id, limit=invoice_limit)
+    ]
+    return {k: row[k] for k in DETAIL_KEYS}, repo.history(customer_id), recent_invoices
+
+
+def run_batch(service=None, store=None, changed_only=False, force=False, limit=None,
+              concurrency=None, rpm=None):
+    """
+    Generate and store insights for every customer whose fingerprint is
+    missing or stale (all of them with `force`). Returns a counts dict.
+    """
+    from artifacts import get_store
+    from openai_service import openai_service
+
+    service = service or openai_service
+    store = store or InsightStore()
+    concurrency = concurrency or Config.INSIGHTS_BATCH_CONCURRENCY
+    rpm = Config.INSIGHTS_BATCH_RPM if rpm is None else rpm
+    if not service.is_available():
+        raise RuntimeError("OpenAI service not available; set OPENAI_API_KEY or OPENAI_CLIENT=fake")
+
+    repo = get_store().customer_repo
+    started = time.perf_counter()
+    customer_ids, _ = repo.list_customers()
+    watermark = store.watermark()
+    if changed_only and watermark is not None and not force:
+        active = customers_with_activity_since(repo, watermark)
+        stored = store.fingerprints()
+        customer_ids = [c for c in customer_ids if c in active or c not in stored]
+    next_watermark = latest_activity(repo)
+
+    # fingerprints are cheap (in-memory lookups); only stale ones go upstream
+    stored = store.fingerprints()
+    todo = []
+    for customer_id in customer_ids:
+        inputs = insights_inputs(repo, customer_id)
+        if inputs is None:
+            continue
+        fingerprint = service.insights_fingerprint(*inputs)
+        if force or stored.get(customer_id) != fingerprint:
+            todo.append((customer_id, fingerprint, inputs))
+    counts = {
+        "customers": len(customer_ids), "up_to_date": len(customer_ids) - len(todo), "generated": 0, "failed": 0,
+    }
+    if limit is not None:
+        todo = todo[:limit]
+    print(f"[insights] {len(todo)} of {len(customer_ids)} customers need new insights")
+
+    limiter = RateLimiter(rpm / 60.0, burst=concurrency)
+
+    def generate(customer_id, fingerprint, inputs):
+        limiter.acquire()
+        result = service.generate_customer_insights(*inputs)
+        if result.get("success"):
+            store.put(customer_id, fingerprint, result)
+            return True
+        print(f"[insights] {customer_id}: {result.get('error')}")
+        return False
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="insights") as pool:
+        futures = [pool.submit(generate, *task) for task in todo]
+        for done, future in enumerate(as_completed(futures), 1):
+            counts["generated" if future.result() else "failed"] += 1
+            if done % 50 == 0:
+                print(f"[insights] {done}/{len(todo)} done")
+
+    # only advance the watermark when nothing was left behind
+    if next_watermark is not None and counts["failed"] == 0 and limit is None:
+        store.set_watermark(next_watermark)
+    counts["seconds"] = round(time.perf_counter() - started, 1)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute customer insights")
+    parser.add_argument("--changed-only", action="store_true",
+                        help="only customers with purchases or invoices since the last run")
+    parser.add_argument("--force", action="store_true", help="regenerate even when the fingerprint matches")
+    parser.add_argument("--limit", type=int, default=None, help="at most this many customers")
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--rpm", type=float, default=None, help="LLM calls per minute (0 = unlimited)")
+    args = parser.parse_args()
+
+    counts = run_batch(
+        changed_only=args.changed_only, force=args.force, limit=args.limit,
+        concurrency=args.concurrency, rpm=args.rpm,
+    )
+    print(
+        f"[insights] {counts['generated']} generated, {counts['failed']} failed, "
+        f"{counts['up_to_date']} up to date in {counts['seconds']}s"
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
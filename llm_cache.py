@@ -0,0 +1,148 @@
+"""
+Persistent cache of LLM responses, content-addressed by
+openai_service.prompt_fingerprint (model + system message + prompt).
+
+One SQLite file (WAL) shared by every worker and by the batch jobs. Entries
+expire after LLM_CACHE_TTL seconds; past LLM_CACHE_MAX_ENTRIES the least
+recently used ones are evicted. Only successful completions are stored.
+
+The cache is best-effort: a SQLite error (e.g. a locked database) is
+logged and treated as a miss or a skipped write. Hits never write; their
+last_used times are collected in memory and flushed with the next set(),
+which is the only place eviction runs.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+from config import Config
+from storage import sqlite_connection
+
+
+class LLMCache:
+    PRUNE_EVERY = 100
+    MAX_PENDING_TOUCHES = 10_000
+
+    def __init__(self, path=None, ttl=None, max_entries=None):
+        self.path = Path(path or Config.LLM_CACHE_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = Config.LLM_CACHE_TTL if ttl is None else ttl
+        self.max_entries = max_entries or Config.LLM_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self._writes = 0
+        # key -> last hit time, written to last_used by the next set()
+        self._touched = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, last_used REAL)"
+        )
+        self._connect().execute("CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses (last_used)")
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _connect(self):
+        return sqlite_connection(self._local, self.path)
+
+    def get(self, key):
+        """The stored result dict, or None if absent or expired."""
+        now = time.time()
+        try:
+            row = self._connect().execute(
+                "SELECT response FROM responses WHERE key = ? AND created >= ?", (key, now - self.ttl)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._failed("read", e)
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if len(self._touched) < self.MAX_PENDING_TOUCHES:
+                self._touched[key] = now
+        return json.loads(row[0])
+
+    def set(self, key, model, result):
+        now = time.time()
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._writes += 1
+            prune = self._writes % self.PRUNE_EVERY == 0
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, model, json.dumps(result), now, now)
+            )
+            if touched:
+                conn.executemany(
+                    "UPDATE responses SET last_used = ? WHERE key = ?", ((t, k) for k, t in touched.items())
+                )
+            if prune:
+                self.prune()
+        except sqlite3.Error as e:
+            self._failed("write", e)
+
+    def _failed(self, what, e):
+        with self._lock:
+            self.errors += 1
+        print(f"[llm-cache] {what} failed, carrying on without the cache: {e}")
+
+    def prune(self):
+        """Drop expired entries, then the least recently used beyond max_entries."""
+        conn = self._connect()
+        expired = conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)).rowcount
+        over = conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        with self._lock:
+            self.evictions += max(expired, 0) + max(over, 0)
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        try:
+            entries = len(self)
+        except sqlite3.Error:
+            entries = None
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class LatencyWindow:
+    """Recent latencies (seconds) of one kind of call, summarised in ms."""
+
+    def __init__(self, size=1000):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def summary(self):
+        samples = np.array(self._samples)
+        if len(samples) == 0:
+            return {"count": 0}
+        p50, p95 = np.percentile(samples * 1000, [50, 95])
+        return {"count": len(samples), "p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2)}
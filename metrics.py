@@ -0,0 +1,219 @@
+"""
+In-process metrics, exposed in the Prometheus text format at /metrics.
+
+Counters and histograms keep plain dicts keyed by label values behind one
+lock, so recording one observation costs around a microsecond and the
+instrumentation stays on in production; METRICS_ENABLED=0 turns every
+record call into a no-op. Each gunicorn worker keeps its own registry, so a
+scrape reports the worker that answered it.
+
+    with stage("train.count"):        # time a block
+        ...
+
+    @timed("recommend.suggest_for_item")   # time every call
+    def suggest_for_item(...):
+"""
+import bisect
+import functools
+import threading
+import time
+
+from config import Config
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 120.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not Config.METRICS_ENABLED:
+            return
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, "") for n in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}_total{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not Config.METRICS_ENABLED:
+            return
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][slot] += 1
+            series[1] += value
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels.get(n, "") for n in self.labelnames))
+        return sum(series[0]) if series else 0
+
+    def sums(self):
+        """{label values: sum of observations}."""
+        with self._lock:
+            return {key: total for key, (_, total) in self._series.items()}
+
+    def samples(self):
+        with self._lock:
+            snapshot = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        for key, (counts, total) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {repr(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            name = f"{metric.name}_total" if metric.kind == "counter" else metric.name
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Time to produce a response, per Flask route.", ("route", "method", "status"),
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "stage_duration_seconds", "Time spent in named stages of serving, training and LLM calls.", ("stage",),
+))
+ARTIFACT_LOADS = REGISTRY.register(Counter(
+    "artifact_loads", "Artifact store loads: full (data and model), reload (new model) or failed.", ("kind",),
+))
+LLM_CALLS = REGISTRY.register(Counter(
+    "llm_calls", "LLM requests by kind and outcome (success, error, cache_hit, coalesced, rejected, timeout).",
+    ("kind", "outcome"),
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens", "Tokens reported by upstream completions (prompt/completion).", ("kind", "type"),
+))
+
+
+class stage:
+    """Context manager timing a block into stage_duration_seconds{stage=name}."""
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.started, stage=self.name)
+        return False
+
+
+def timed(name):
+    """Decorator: time every call of the function as stage `name`."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+        return wrapper
+
+    return decorator
+
+
+def stage_summary(prefix=""):
+    """
+    "name 1.2s, name 0.3s" over the stages starting with `prefix`, for
+    offline jobs (training) that have no /metrics to scrape.
+    """
+    totals = [(key[0], total) for key, total in STAGE_SECONDS.sums().items() if key[0].startswith(prefix)]
+    return ", ".join(f"{name[len(prefix):]} {total:.2f}s" for name, total in totals)
+
+
+def render():
+    return REGISTRY.render()
+
+
+def init_app(app):
+    """Record http_request_duration_seconds for every request the app serves."""
+    from flask import g, request
+
+    if not Config.METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_duration(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            rule = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, route=rule, method=request.method, status=response.status_code
+            )
+        return response
@@ -1,13 +1,22 @@
+import argparse
+import io
 import json
+import os
 import numpy as np
 import pandas as pd
 from pathlib import Path
-from collections import defaultdict
-import tensorflow as tf
+
+from ann_index import IVFIndex
+from config import Config
+from metrics import stage, stage_summary
+from similarity import SimilarityEngine
+from storage import get_backend
+
+# co-occurrence counts and the per-file read watermark, for incremental updates
+COUNTS_FILE = "rule_counts.npz"
 
 def ensure_data_exists():
-    base = Path(__file__).parent
-    data_dir = base / "data"
+    data_dir = Config.DATA_DIR
     needed = ["customers.csv", "purchases.csv", "products.csv", "item_to_index.json", "index_to_item.json"]
     missing = [f for f in needed if not (data_dir / f).exists()]
     if missing:
@@ -17,9 +26,9 @@ def ensure_data_exists():
         data_generation.main()
     return data_dir
 
-# goal: build (1) simple association rules, (2) tiny TF embeddings
+# goal: build (1) simple association rules, (2) tiny item embeddings
 def load_data():
-    data_dir = Path(__file__).parent / "data"
+    data_dir = Config.DATA_DIR
     purchases = pd.read_csv(data_dir / "purchases.csv")
     invoices = pd.read_csv(data_dir / "invoices.csv")
     invoice_items = pd.read_csv(data_dir / "invoice_items.csv")
@@ -41,30 +50,270 @@ def baskets_by_order(purchases, invoices, invoice_items):
         baskets.append(sorted(list(set(grp["item"].tolist()))))
     return baskets
 
-def build_association_rules(baskets, min_support=0.015, min_conf=0.08):
-    item_counts = defaultdict(int)
-    pair_counts = defaultdict(int)
-    total_baskets = len(baskets)
+def load_catalog(data_dir):
+    """Item index maps and complements, without reading any transactions."""
+    with open(data_dir / "item_to_index.json", "r") as f:
+        item_to_index = json.load(f)
+    with open(data_dir / "index_to_item.json", "r") as f:
+        index_to_item = {int(k): v for k, v in json.load(f).items()}
+    with open(data_dir / "complements.json", "r") as f:
+        complements = json.load(f)
+    return complements, item_to_index, index_to_item
+
+
+def iter_basket_chunks(data_dir, item_to_index, chunksize=None, watermark=None, hold_partial=False):
+    """
+    Stream integer-encoded baskets as CSR batches (indptr, indices), reading
+    purchases.csv and invoice_items.csv `chunksize` rows at a time. Yields
+    the same baskets as baskets_by_order (each a sorted set of item ids)
+    while holding at most one chunk in memory.
+
+    A basket's rows must be contiguous in the file, which is how
+    data_generation writes them: purchases sorted by (customer_id, date),
+    invoice items grouped by invoice_id.
+
+    `watermark` maps file name -> {"rows", "offset"}: the data rows already
+    consumed and the byte offset just past them. Reading resumes with a
+    seek() to the offset, so an update only parses the appended rows. Once a
+    file has been read to the end its entry is advanced to cover it.
+    Watermarks saved as a plain row count are converted on their next read.
+
+    A last line without its newline is read like any other row unless
+    `hold_partial` is set (as update() does, since the file may still be
+    being appended to); then it is left for the next run.
+    """
+    chunksize = chunksize or Config.TRAIN_CHUNKSIZE
+    watermark = {} if watermark is None else watermark
+    for name, keys in (("purchases.csv", ["customer_id", "date"]), ("invoice_items.csv", ["invoice_id"])):
+        yield from _iter_grouped_baskets(
+            data_dir / name, keys, item_to_index, chunksize, watermark, name, hold_partial
+        )
+
+
+class _ByteRange(io.RawIOBase):
+    """Read-only view of bytes [start, end) of a file, for read_csv."""
+
+    def __init__(self, f, start, end):
+        f.seek(start)
+        self._f = f
+        self._left = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._f.readinto(memoryview(buffer)[: min(len(buffer), self._left)])
+        self._left -= n
+        return n
+
+
+def _complete_end(f):
+    """Byte offset just past the last newline, so a row still being appended is left alone."""
+    end = f.seek(0, os.SEEK_END)
+    while end > 0:
+        f.seek(max(end - 65536, 0))
+        block = f.read(end - f.tell())
+        newline = block.rfind(b"\n")
+        if newline >= 0:
+            return end - len(block) + newline + 1
+        end -= len(block)
+    return 0
+
+
+def _iter_grouped_baskets(path, keys, item_to_index, chunksize, watermark, name, hold_partial):
+    num_items = len(item_to_index)
+    carry = None
+    with open(path, "rb") as f:
+        header = f.readline().decode().rstrip("\r\n").split(",")
+        state = watermark.get(name, {"rows": 0, "offset": f.tell()})
+        if isinstance(state, int):
+            # row-count watermark from before offsets were stored: find its offset once
+            for _ in range(state):
+                f.readline()
+            state = {"rows": state, "offset": f.tell()}
+        size = f.seek(0, os.SEEK_END)
+        end = _complete_end(f) if hold_partial else size
+        if end < size:
+            print(f"[train] {name}: holding back {size - end} bytes after the last newline until the next run")
+        rows = state["rows"]
+        if end <= state["offset"]:
+            watermark[name] = state
+            return
+        reader = pd.read_csv(
+            io.BufferedReader(_ByteRange(f, state["offset"], end)), header=None, names=header,
+            usecols=keys + ["item"], dtype=str, chunksize=chunksize,
+        )
+        for chunk in reader:
+            rows += len(chunk)
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+            # the last group may continue in the next chunk; hold it back
+            key_values = chunk[keys].to_numpy()
+            last = len(chunk) - 1
+            while last > 0 and (key_values[last - 1] == key_values[-1]).all():
+                last -= 1
+            carry = chunk.iloc[last:]
+            if last > 0:
+                yield _encode_grouped(chunk.iloc[:last], keys, item_to_index, num_items)
+    watermark[name] = {"rows": rows, "offset": end}
+    if carry is not None and len(carry):
+        yield _encode_grouped(carry, keys, item_to_index, num_items)
+
 
+def _encode_grouped(frame, keys, item_to_index, num_items):
+    values = frame[keys].to_numpy()
+    starts = np.ones(len(frame), dtype=bool)
+    starts[1:] = (values[1:] != values[:-1]).any(axis=1)
+    group = np.cumsum(starts) - 1
+    n_baskets = int(group[-1]) + 1 if len(group) else 0
+
+    item_ids = frame["item"].map(item_to_index).to_numpy()
+    known = ~pd.isna(item_ids)
+    # one sort de-duplicates and orders items within each basket
+    combined = np.unique(group[known].astype(np.int64) * num_items + item_ids[known].astype(np.int64))
+    sizes = np.bincount(combined // num_items, minlength=n_baskets)
+    indptr = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    return indptr, (combined % num_items).astype(np.int32)
+
+
+def encode_baskets(baskets, item_to_index):
+    """
+    Flatten baskets of item names into CSR arrays (indptr, indices) of item
+    ids. Baskets are expected to hold distinct items, as baskets_by_order
+    produces; names missing from item_to_index are dropped.
+    """
+    indptr = [0]
+    indices = []
     for basket in baskets:
-        for i, a in enumerate(basket):
-            item_counts[a] += 1
-            for b in basket[i+1:]:
-                key = tuple(sorted([a, b]))
-                pair_counts[key] += 1
-
-    rules = defaultdict(dict)
-    for (a, b), cnt in pair_counts.items():
-        support = cnt / total_baskets
-        if support < min_support:
-            continue
-        conf_ab = cnt / item_counts[a]
-        conf_ba = cnt / item_counts[b]
-        if conf_ab >= min_conf:
-            rules[a][b] = {"support": support, "confidence": conf_ab}
-        if conf_ba >= min_conf:
-            rules[b][a] = {"support": support, "confidence": conf_ba}
+        indices.extend(item_to_index[i] for i in basket if i in item_to_index)
+        indptr.append(len(indices))
+    return np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int32)
+
+
+def count_cooccurrences(indptr, indices, num_items):
+    """
+    Item and pair counts from one sparse product. X is the baskets x items
+    incidence matrix; diag(X.T @ X) is each item's basket count and its
+    strict upper triangle holds the count of every co-occurring pair.
+    Returns (item_counts, pair_counts) with pair_counts an upper-triangular
+    scipy COO matrix.
+    """
+    from scipy import sparse
+
+    data = np.ones(len(indices), dtype=np.int64)
+    X = sparse.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, num_items))
+    item_counts = np.asarray(X.sum(axis=0)).ravel()
+    pair_counts = sparse.triu(X.T @ X, k=1).tocoo()
+    return item_counts, pair_counts
+
+
+class CooccurrenceCounter:
+    """
+    Running item/pair counts over batches of integer-encoded baskets, so
+    rules can be mined from a stream. Memory is bounded by the number of
+    distinct co-occurring pairs, not by the number of baskets.
+    """
+
+    def __init__(self, num_items):
+        from scipy import sparse
+
+        self.num_items = num_items
+        self.total_baskets = 0
+        self.item_counts = np.zeros(num_items, dtype=np.int64)
+        self.pair_counts = sparse.csr_matrix((num_items, num_items), dtype=np.int64)
+
+    def add(self, indptr, indices):
+        item_counts, pair_counts = count_cooccurrences(indptr, indices, self.num_items)
+        self.total_baskets += len(indptr) - 1
+        self.item_counts += item_counts
+        self.pair_counts = self.pair_counts + pair_counts.tocsr()
+
+    def resize(self, num_items):
+        """Make room for items added to the catalog since the counts were saved."""
+        if num_items <= self.num_items:
+            return
+        self.item_counts = np.concatenate([self.item_counts, np.zeros(num_items - self.num_items, dtype=np.int64)])
+        self.pair_counts.resize((num_items, num_items))
+        self.num_items = num_items
+
+    def rules(self, index_to_item, min_support=0.015, min_conf=0.08):
+        if self.total_baskets == 0:
+            return {}
+        return rules_from_counts(
+            self.item_counts, self.pair_counts.tocoo(), self.total_baskets, index_to_item, min_support, min_conf
+        )
+
+    def save(self, path, watermark):
+        """Write the counts and the row watermark they cover, atomically."""
+        pairs = self.pair_counts.tocsr()
+        tmp = path.with_name(f".{path.name}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                num_items=self.num_items,
+                total_baskets=self.total_baskets,
+                item_counts=self.item_counts,
+                pair_indptr=pairs.indptr,
+                pair_indices=pairs.indices,
+                pair_data=pairs.data,
+                watermark=json.dumps(watermark),
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """(counter, watermark) as written by save()."""
+        from scipy import sparse
+
+        with np.load(path) as state:
+            counter = cls(int(state["num_items"]))
+            counter.total_baskets = int(state["total_baskets"])
+            counter.item_counts = state["item_counts"].astype(np.int64)
+            counter.pair_counts = sparse.csr_matrix(
+                (state["pair_data"], state["pair_indices"], state["pair_indptr"]),
+                shape=(counter.num_items, counter.num_items),
+            )
+            watermark = json.loads(str(state["watermark"]))
+        return counter, watermark
+
+
+def rules_from_counts(item_counts, pair_counts, total_baskets, index_to_item, min_support=0.015, min_conf=0.08):
+    """Apply the support/confidence thresholds to pair counts as array ops."""
+    a, b, cnt = pair_counts.row, pair_counts.col, pair_counts.data
+    support = cnt / total_baskets
+    keep = support >= min_support
+    a, b, cnt, support = a[keep], b[keep], cnt[keep], support[keep]
+    conf_ab = cnt / item_counts[a]
+    conf_ba = cnt / item_counts[b]
+
+    rules = {}
+    for src, dst, sup, conf in _thresholded(a, b, support, conf_ab, min_conf):
+        rules.setdefault(index_to_item[src], {})[index_to_item[dst]] = {"support": sup, "confidence": conf}
+    for src, dst, sup, conf in _thresholded(b, a, support, conf_ba, min_conf):
+        rules.setdefault(index_to_item[src], {})[index_to_item[dst]] = {"support": sup, "confidence": conf}
     return rules
+
+
+def _thresholded(src, dst, support, conf, min_conf):
+    ok = conf >= min_conf
+    return zip(src[ok].tolist(), dst[ok].tolist(), support[ok].tolist(), conf[ok].tolist())
+
+
+def build_association_rules(baskets, min_support=0.015, min_conf=0.08):
+    """
+    Pairwise rules a -> b with support = count(a, b) / baskets and
+    confidence = count(a, b) / count(a), mined with a sparse incidence
+    matrix instead of per-basket pair loops.
+    """
+    baskets = list(baskets)
+    vocab = sorted({item for basket in baskets for item in basket})
+    item_to_index = {item: i for i, item in enumerate(vocab)}
+    indptr, indices = encode_baskets(baskets, item_to_index)
+    item_counts, pair_counts = count_cooccurrences(indptr, indices, len(vocab))
+    return rules_from_counts(item_counts, pair_counts, len(baskets), vocab, min_support, min_conf)
+
 def apply_defaults_for_complements(rules, complements, min_conf_default=0.25, min_sup_default=0.05):
     for a, comp_list in complements.items():
         rules.setdefault(a, {})
@@ -77,33 +326,217 @@ def apply_defaults_for_complements(rules, complements, min_conf_default=0.25, mi
                 rules[a][b]["confidence"] = max(rules[a][b].get("confidence", 0.0), min_conf_default)
     return rules
 
-def make_training_pairs(baskets, item_to_index, max_pairs_per_basket=20):
-    pairs = []
-    for basket in baskets:
-        idxs = [item_to_index[i] for i in basket if i in item_to_index]
-        if len(idxs) < 2:
-            continue
-        # positive pairs (undirected)
-        added = 0
-        for i in range(len(idxs)):
-            for j in range(i+1, len(idxs)):
-                pairs.append((idxs[i], idxs[j], 1.0))
-                pairs.append((idxs[j], idxs[i], 1.0))
-                added += 2
-                if added >= max_pairs_per_basket:
-                    break
-            if added >= max_pairs_per_basket:
-                break
-        # a few random negatives
-        all_ids = list(item_to_index.values())
-        for pos in idxs[: min(2, len(idxs))]:
-            neg = np.random.choice(all_ids)
-            if neg not in idxs:
-                pairs.append((pos, neg, 0.0))
-    np.random.shuffle(pairs)
-    return np.array(pairs, dtype=np.int32), np.array([p[2] for p in pairs], dtype=np.float32)
-
-def train_embeddings(num_items, pairs, labels, embedding_dim=16, epochs=5, batch_size=256):
+def make_training_pairs(baskets, item_to_index, max_pairs_per_basket=20, neg_ratio=None, seed=None):
+    """
+    Shuffled int32 (left, right) pairs and float32 labels for a list of
+    baskets: positives from positive_pairs, negatives drawn by popularity.
+    """
+    rng = np.random.default_rng(seed)
+    indptr, indices = encode_baskets(baskets, item_to_index)
+    positives = positive_pairs(indptr, indices, max_pairs_per_basket)
+    sampler = NegativeSampler(np.bincount(indices, minlength=len(item_to_index)), seed=rng)
+    pairs, labels = with_negatives(positives, sampler, Config.TRAIN_NEG_RATIO if neg_ratio is None else neg_ratio)
+    order = rng.permutation(len(labels))
+    return pairs[order], labels[order]
+
+
+def positive_pairs(indptr, indices, max_pairs_per_basket=20):
+    """
+    Co-purchase pairs for one CSR batch of baskets, in both directions, as an
+    int32 (N, 2) array. Each basket contributes its first (i, j), i < j, item
+    pairs in row-major order, up to max_pairs_per_basket rows; the pair
+    positions are computed for all baskets at once.
+    """
+    sizes = np.diff(indptr).astype(np.int64)
+    keep = np.minimum(sizes * (sizes - 1) // 2, (max_pairs_per_basket + 1) // 2)
+    total = int(keep.sum())
+    if total == 0:
+        return np.zeros((0, 2), dtype=np.int32)
+    basket = np.repeat(np.arange(len(sizes)), keep)
+    # k-th pair of a basket of size n -> (i, j) in the upper triangle
+    k = np.arange(total) - np.repeat(np.cumsum(keep) - keep, keep)
+    n = sizes[basket]
+    i = n - 2 - np.floor(np.sqrt(-8 * k + 4 * n * (n - 1) - 7) / 2 - 0.5).astype(np.int64)
+    j = k + i + 1 - n * (n - 1) // 2 + (n - i) * (n - i - 1) // 2
+    start = indptr[:-1][basket]
+    left, right = indices[start + i], indices[start + j]
+    return np.concatenate([np.stack([left, right], axis=1), np.stack([right, left], axis=1)]).astype(np.int32)
+
+
+class NegativeSampler:
+    """
+    Draws item ids with probability proportional to count ** power (the
+    unigram^0.75 distribution from word2vec), so popular items are
+    seen as negatives more often but do not swamp the rare ones. Like
+    word2vec it samples from a precomputed quantile table, which is one
+    random gather per draw instead of a binary search.
+    """
+
+    TABLE_SIZE = 1 << 20
+
+    def __init__(self, item_counts, power=0.75, seed=None):
+        weights = np.asarray(item_counts, dtype=np.float64) ** power
+        if weights.sum() == 0:
+            weights = np.ones_like(weights)
+        cdf = np.cumsum(weights)
+        cdf /= cdf[-1]
+        quantiles = (np.arange(self.TABLE_SIZE) + 0.5) / self.TABLE_SIZE
+        self.table = np.searchsorted(cdf, quantiles, side="right").astype(np.int32)
+        self.rng = np.random.default_rng(seed)
+
+    def sample(self, n):
+        return self.table[self.rng.integers(0, self.TABLE_SIZE, size=n)]
+
+
+def with_negatives(positives, sampler, neg_ratio=1.0):
+    """
+    Append about neg_ratio negatives per positive: a random positive's left
+    item paired with a sampled item, dropping samples that hit either side
+    of that positive. Returns (pairs, labels), positives first.
+    """
+    n_neg = int(round(len(positives) * neg_ratio))
+    if n_neg == 0 or len(positives) == 0:
+        return positives, np.ones(len(positives), dtype=np.float32)
+    anchors = positives[sampler.rng.integers(0, len(positives), size=n_neg)]
+    negs = sampler.sample(n_neg)
+    ok = (negs != anchors[:, 0]) & (negs != anchors[:, 1])
+    negatives = np.stack([anchors[ok, 0], negs[ok]], axis=1)
+    labels = np.concatenate([np.ones(len(positives), dtype=np.float32), np.zeros(len(negatives), dtype=np.float32)])
+    return np.concatenate([positives, negatives]).astype(np.int32), labels
+
+
+def iter_pair_batches(pairs, labels, batch_size=256, sampler=None, neg_ratio=0.0, seed=None):
+    """
+    One epoch of shuffled (pairs, labels) batches. With a sampler, fresh
+    negatives are drawn per batch (about neg_ratio per row), so the full
+    set of negatives never exists in memory and differs every epoch.
+    """
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(labels))
+    for lo in range(0, len(order), batch_size):
+        take = order[lo:lo + batch_size]
+        batch_pairs, batch_labels = pairs[take], labels[take]
+        if sampler is not None and neg_ratio > 0:
+            batch_pairs, batch_labels = with_negatives(batch_pairs, sampler, neg_ratio)
+            batch_labels[: len(take)] = labels[take]
+            mix = rng.permutation(len(batch_labels))
+            batch_pairs, batch_labels = batch_pairs[mix], batch_labels[mix]
+        yield batch_pairs, batch_labels
+
+
+def pair_dataset(pairs, labels, batch_size=256, sampler=None, neg_ratio=0.0):
+    """iter_pair_batches as a tf.data.Dataset of ((left, right), labels); re-sampled each epoch."""
+    import tensorflow as tf
+
+    def generate():
+        for batch_pairs, batch_labels in iter_pair_batches(pairs, labels, batch_size, sampler, neg_ratio):
+            yield (batch_pairs[:, 0], batch_pairs[:, 1]), batch_labels
+
+    return tf.data.Dataset.from_generator(
+        generate,
+        output_signature=(
+            (tf.TensorSpec(shape=(None,), dtype=tf.int32), tf.TensorSpec(shape=(None,), dtype=tf.int32)),
+            tf.TensorSpec(shape=(None,), dtype=tf.float32),
+        ),
+    ).prefetch(tf.data.AUTOTUNE)
+
+
+class PairReservoir:
+    """
+    Uniform sample of at most `capacity` training pairs from a stream
+    (reservoir sampling, applied a batch at a time), so embedding training
+    data stays bounded however long the transaction history is.
+    """
+
+    def __init__(self, capacity, seed=None):
+        self.capacity = capacity
+        self.seen = 0
+        self.pairs = np.zeros((capacity, 2), dtype=np.int32)
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, pairs):
+        n = len(pairs)
+        if n == 0:
+            return
+        # fill any free slots first
+        free = min(max(self.capacity - self.seen, 0), n)
+        if free:
+            self.pairs[self.seen:self.seen + free] = pairs[:free]
+        # the i-th later element replaces a random slot with prob capacity / (seen + i + 1)
+        if free < n:
+            positions = self.seen + np.arange(free, n)
+            slots = (self._rng.random(n - free) * (positions + 1)).astype(np.int64)
+            take = slots < self.capacity
+            self.pairs[slots[take]] = pairs[free:][take]
+        self.seen += n
+
+    def arrays(self):
+        """The sampled pairs, shuffled."""
+        size = min(self.seen, self.capacity)
+        return self.pairs[:size][self._rng.permutation(size)]
+
+
+def train_embeddings(num_items, pairs, labels, embedding_dim=16, epochs=5, batch_size=256, sampler=None, neg_ratio=0.0,
+                     trainer=None):
+    """
+    Shared-embedding cosine/sigmoid model fit on (pairs, labels). With a
+    NegativeSampler, negatives are drawn per batch on top of the given pairs.
+
+    `trainer` (default Config.EMBEDDING_TRAINER) picks the implementation:
+    "numpy" needs nothing beyond NumPy; "tensorflow" is the original Keras
+    model, and TensorFlow is only imported when it is chosen.
+    """
+    trainer = trainer or Config.EMBEDDING_TRAINER
+    if trainer == "numpy":
+        return train_embeddings_numpy(num_items, pairs, labels, embedding_dim, epochs, batch_size, sampler, neg_ratio)
+    if trainer == "tensorflow":
+        return train_embeddings_tf(num_items, pairs, labels, embedding_dim, epochs, batch_size, sampler, neg_ratio)
+    raise ValueError(f"Unknown EMBEDDING_TRAINER {trainer!r}; expected 'numpy' or 'tensorflow'")
+
+
+def train_embeddings_numpy(num_items, pairs, labels, embedding_dim=16, epochs=5, batch_size=256, sampler=None,
+                           neg_ratio=0.0, learning_rate=0.001, seed=None):
+    """
+    The Keras model written out in NumPy: one embedding table, prediction
+    sigmoid(cos(E[left], E[right])), binary cross-entropy, Adam. Gradients
+    are applied only to the rows a batch touches (lazy Adam), so a step
+    costs O(batch) rather than O(catalog).
+    """
+    rng = np.random.default_rng(seed)
+    # Keras' Embedding default initializer
+    emb = rng.uniform(-0.05, 0.05, size=(num_items, embedding_dim)).astype(np.float32)
+    m = np.zeros_like(emb)
+    v = np.zeros_like(emb)
+    beta1, beta2, eps = 0.9, 0.999, 1e-7
+    step = 0
+
+    for _ in range(epochs):
+        for batch_pairs, batch_labels in iter_pair_batches(pairs, labels, batch_size, sampler, neg_ratio, seed=rng):
+            left, right = batch_pairs[:, 0], batch_pairs[:, 1]
+            u, w = emb[left], emb[right]
+            nu = np.linalg.norm(u, axis=1, keepdims=True) + 1e-12
+            nw = np.linalg.norm(w, axis=1, keepdims=True) + 1e-12
+            cos = np.sum(u * w, axis=1, keepdims=True) / (nu * nw)
+            pred = 1.0 / (1.0 + np.exp(-cos))
+            # d(mean BCE)/d(cos), then the cosine's gradient w.r.t. each side
+            dcos = (pred - batch_labels[:, None]) / len(batch_labels)
+            grad_u = dcos * (w / (nu * nw) - cos * u / nu ** 2)
+            grad_w = dcos * (u / (nu * nw) - cos * w / nw ** 2)
+
+            rows, inverse = np.unique(np.concatenate([left, right]), return_inverse=True)
+            grad = np.zeros((len(rows), embedding_dim), dtype=np.float32)
+            np.add.at(grad, inverse, np.concatenate([grad_u, grad_w]))
+
+            step += 1
+            m[rows] = beta1 * m[rows] + (1 - beta1) * grad
+            v[rows] = beta2 * v[rows] + (1 - beta2) * grad ** 2
+            lr = learning_rate * np.sqrt(1 - beta2 ** step) / (1 - beta1 ** step)
+            emb[rows] -= lr * m[rows] / (np.sqrt(v[rows]) + eps)
+    return emb
+
+
+def train_embeddings_tf(num_items, pairs, labels, embedding_dim=16, epochs=5, batch_size=256, sampler=None,
+                        neg_ratio=0.0):
     import tensorflow as tf
 
     # Inputs are scalar indices, shape: (batch,)
@@ -123,28 +556,169 @@ def train_embeddings(num_items, pairs, labels, embedding_dim=16, epochs=5, batch
 
     model = tf.keras.Model([left_input, right_input], output)
     model.compile(optimizer="adam", loss="binary_crossentropy")
-    model.fit([pairs[:, 0], pairs[:, 1]], labels, epochs=epochs, batch_size=batch_size, verbose=0)
+    model.fit(pair_dataset(pairs, labels, batch_size, sampler, neg_ratio), epochs=epochs, verbose=0)
 
     # Pull trained embeddings
     embeddings = model.get_layer("item_emb").get_weights()[0]
     return embeddings
 
 
-def save_artifacts(assoc_rules, embeddings, data_dir):
-    (data_dir / "assoc_rules.json").write_text(json.dumps(assoc_rules))
-    np.save(data_dir / "embeddings.npy", embeddings)
-    print("Saved assoc_rules.json and embeddings.npy")
+def build_ann_index(embeddings):
+    """
+    IVF index over the normalized embeddings for catalogs of at least
+    Config.ANN_MIN_ITEMS items; None below that, where exact search is cheap.
+    """
+    if len(embeddings) < Config.ANN_MIN_ITEMS:
+        return None
+    vectors = SimilarityEngine(embeddings, dtype="float32").vectors
+    index = IVFIndex.build(vectors, nlist=Config.ANN_NLIST or None, nprobe=Config.ANN_NPROBE)
+    print(f"[train] ANN index: {index.nlist} lists over {len(index)} items")
+    return index
+
 
-def main():
-    purchases, invoices, invoice_items, complements, item_to_index, index_to_item, data_dir = load_data()
-    baskets = baskets_by_order(purchases, invoices, invoice_items)
+def build_suggestion_index(assoc_rules, embeddings, complements, main_products, item_to_index, top_n=20,
+                           ann_index=None):
+    """
+    Rank suggestions for every catalog item with the serving-time scorer and
+    keep the best top_n, so /api/suggest is a dict lookup plus a slice.
+    """
+    from recommend import rank_suggestions
 
-    assoc_rules = build_association_rules(baskets, min_support=0.015, min_conf=0.08)
-    assoc_rules = {a: {b: v for b, v in d.items()} for a, d in assoc_rules.items()}
-    assoc_rules = apply_defaults_for_complements(assoc_rules, complements, 0.25, 0.05)
+    main_products = set(main_products)
+    index_to_item = {i: item for item, i in item_to_index.items()}
+    similarity = SimilarityEngine(embeddings, dtype="float32")
+    similarity.index = ann_index
+    items = {
+        item: rank_suggestions(
+            item, item_to_index, assoc_rules, similarity, complements, main_products, index_to_item=index_to_item
+        )[:top_n]
+        for item in item_to_index
+    }
+    return {"top_n": top_n, "items": items}
 
-    pairs, labels = make_training_pairs(baskets, item_to_index, max_pairs_per_basket=24)
+
+def save_artifacts(assoc_rules, embeddings, data_dir, suggest_index=None, ann_index=None):
+    """
+    Store a new model version through the configured storage backend and
+    atomically make it the live one (a versioned bundle under data_dir for
+    the file backend). Running workers pick it up on their next check.
+    """
+    backend = get_backend(data_dir)
+    version = backend.save_model(assoc_rules, embeddings, suggest_index=suggest_index, ann_index=ann_index)
+    print(f"Saved assoc rules and embeddings as model {version} ({backend.describe()})")
+    return version
+
+def main(chunksize=None):
+    """
+    Train from a single streaming pass over the transaction files: each
+    chunk of baskets feeds the co-occurrence counts and the training-pair
+    reservoir, so peak memory depends on the chunk size and the catalog,
+    not on how long the history is.
+    """
+    data_dir = Config.DATA_DIR
+    with stage("train.load_catalog"):
+        complements, item_to_index, index_to_item = load_catalog(data_dir)
     num_items = len(item_to_index)
-    embeddings = train_embeddings(num_items, pairs, labels, embedding_dim=16, epochs=6, batch_size=256)
 
-    save_artifacts(assoc_rules, embeddings, data_dir)
+    counter = CooccurrenceCounter(num_items)
+    reservoir = PairReservoir(Config.TRAIN_MAX_PAIRS)
+    watermark = {}
+    with stage("train.stream_baskets"):
+        for indptr, indices in iter_basket_chunks(data_dir, item_to_index, chunksize, watermark):
+            counter.add(indptr, indices)
+            reservoir.add(positive_pairs(indptr, indices, max_pairs_per_basket=24))
+
+    with stage("train.rules"):
+        assoc_rules = counter.rules(index_to_item, min_support=0.015, min_conf=0.08)
+        assoc_rules = apply_defaults_for_complements(assoc_rules, complements, 0.25, 0.05)
+
+    # negatives follow the popularity of the whole history, known only now
+    with stage("train.embeddings"):
+        pairs = reservoir.arrays()
+        embeddings = train_embeddings(
+            num_items, pairs, np.ones(len(pairs), dtype=np.float32), embedding_dim=16, epochs=6, batch_size=256,
+            sampler=NegativeSampler(counter.item_counts), neg_ratio=Config.TRAIN_NEG_RATIO,
+        )
+
+    with stage("train.ann_index"):
+        ann_index = build_ann_index(embeddings)
+
+    with stage("train.suggest_index"):
+        main_products = json.loads((data_dir / "main_products.json").read_text())
+        suggest_index = build_suggestion_index(
+            assoc_rules, embeddings, complements, main_products, item_to_index, top_n=20, ann_index=ann_index
+        )
+
+    with stage("train.save"):
+        version = save_artifacts(assoc_rules, embeddings, data_dir, suggest_index=suggest_index, ann_index=ann_index)
+        counter.save(data_dir / COUNTS_FILE, watermark)
+    print(f"[train] stages: {stage_summary('train.')}")
+    return version
+
+
+def update(chunksize=None):
+    """
+    Fold the transaction rows appended since the last run into the saved
+    counts and publish refreshed rules, keeping the live embeddings. Only
+    the new rows are read; rules are re-derived from the counts (support
+    depends on the basket total, so every rule can move) and complement
+    defaults are re-applied. Appended rows must start new baskets.
+
+    Falls back to a full main() when there are no saved counts or the
+    catalog has outgrown the live embeddings.
+    """
+    data_dir = Config.DATA_DIR
+    state_path = data_dir / COUNTS_FILE
+    if not state_path.exists():
+        print(f"No {COUNTS_FILE} yet -> running a full training")
+        return main(chunksize)
+
+    complements, item_to_index, index_to_item = load_catalog(data_dir)
+    backend = get_backend(data_dir)
+    model = backend.load_model(backend.model_version())
+    embeddings = np.asarray(model["embeddings"])
+    if len(embeddings) < len(item_to_index):
+        print("Catalog has items without embeddings -> running a full training")
+        return main(chunksize)
+
+    counter, watermark = CooccurrenceCounter.load(state_path)
+    counter.resize(len(item_to_index))
+    seen = counter.total_baskets
+    with stage("update.stream_baskets"):
+        for indptr, indices in iter_basket_chunks(data_dir, item_to_index, chunksize, watermark, hold_partial=True):
+            counter.add(indptr, indices)
+    if counter.total_baskets == seen:
+        print("No new baskets since the last run")
+        return None
+    print(f"Folding {counter.total_baskets - seen} new baskets into {seen} counted")
+    # the embeddings are kept and so is their index; bundles without one get it built here
+    ann_index = model.get("ann_index")
+    if ann_index is None:
+        ann_index = build_ann_index(embeddings)
+
+    with stage("update.rules"):
+        assoc_rules = counter.rules(index_to_item, min_support=0.015, min_conf=0.08)
+        assoc_rules = apply_defaults_for_complements(assoc_rules, complements, 0.25, 0.05)
+    with stage("update.suggest_index"):
+        main_products = json.loads((data_dir / "main_products.json").read_text())
+        suggest_index = build_suggestion_index(
+            assoc_rules, embeddings, complements, main_products, item_to_index, top_n=20, ann_index=ann_index
+        )
+    with stage("update.save"):
+        version = save_artifacts(assoc_rules, embeddings, data_dir, suggest_index=suggest_index, ann_index=ann_index)
+        # only advance the watermark once the refreshed model is live
+        counter.save(state_path, watermark)
+    print(f"[train] stages: {stage_summary('update.')}")
+    return version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the cross-sell model")
+    parser.add_argument("command", nargs="?", default="train", choices=["train", "update"],
+                        help="train: full retrain; update: fold in rows appended since the last run")
+    parser.add_argument("--chunksize", type=int, default=None)
+    args = parser.parse_args()
+    if args.command == "update":
+        update(args.chunksize)
+    else:
+        main(args.chunksize)
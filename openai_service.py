@@ -1,17 +1,138 @@
 import openai
 from config import Config
+import hashlib
 import json
 import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from llm_cache import LatencyWindow, LLMCache
+from metrics import LLM_CALLS, LLM_TOKENS, STAGE_SECONDS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+INSIGHTS_SYSTEM = "You are a retail analytics expert specializing in home improvement products. Provide concise, actionable insights about customer behavior and preferences."
+EXPLANATION_SYSTEM = "You are a helpful home improvement retail assistant. Explain why certain products complement each other in a friendly, informative way."
+
+
+def prompt_fingerprint(model, system, prompt):
+    """Content address of one chat request: identical inputs, identical key."""
+    return hashlib.sha256("\x00".join([model or "", system, prompt]).encode("utf-8")).hexdigest()
+
+
+class FakeChatCompletion:
+    """
+    Offline stand-in for openai.ChatCompletion with the same create() call
+    and response shape. Selected with OPENAI_CLIENT=fake; replies are
+    canned, after OPENAI_FAKE_LATENCY seconds, and every call is counted.
+    """
+
+    def __init__(self, latency=None):
+        self.latency = Config.OPENAI_FAKE_LATENCY if latency is None else latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create(self, model, messages, max_tokens=None, temperature=None, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if stream:
+            return self._stream(model, self.reply(messages))
+        time.sleep(self.latency)
+        text = self.reply(messages)
+        usage = {
+            "prompt_tokens": sum(len(m["content"].split()) for m in messages),
+            "completion_tokens": len(text.split()),
+        }
+        return {"choices": [{"message": {"role": "assistant", "content": text}}], "model": model, "usage": usage}
+
+    def _stream(self, model, text):
+        # first token after the usual latency, then one word every OPENAI_FAKE_TOKEN_DELAY
+        time.sleep(self.latency)
+        for i, word in enumerate(text.split(" ")):
+            if i:
+                time.sleep(Config.OPENAI_FAKE_TOKEN_DELAY)
+            yield {"choices": [{"delta": {"content": word if i == 0 else " " + word}}], "model": model}
+        yield {"choices": [{"delta": {}, "finish_reason": "stop"}], "model": model}
+
+    def reply(self, messages):
+        if messages[0]["content"] == INSIGHTS_SYSTEM:
+            return (
+                "1. **Product Preferences:** Buys mostly core appliances with their matching accessories.\n"
+                "2. **Potential Needs:** Filters, warranties and installation kits for recent purchases.\n"
+                "3. **Buying Patterns:** Project-based baskets bought together on the same day."
+            )
+        return (
+            "- An extended warranty avoids paying for out-of-pocket repairs.\n"
+            "- The right accessories keep the appliance running and extend its life."
+        )
+
+
+class _Job:
+    """One upstream call, shared by every request with the same fingerprint."""
+
+    def __init__(self, key, future):
+        self.key = key
+        self.id = key[:16]
+        self.future = future
+        self.finished_at = None
+        future.add_done_callback(self._finished)
+
+    @classmethod
+    def completed(cls, key, result):
+        future = Future()
+        future.set_result(result)
+        return cls(key, future)
+
+    def _finished(self, _future):
+        self.finished_at = time.monotonic()
+
+    def failed(self):
+        return self.future.done() and "error" in self.future.result()
+
+
 class OpenAIService:
-    """Service class for OpenAI integration."""
+    """
+    Service class for OpenAI integration.
+
+    Calls run on a bounded thread pool (LLM_MAX_CONCURRENCY) so a slow
+    completion never holds a web worker longer than LLM_TIMEOUT, and
+    identical concurrent requests (same model, system message and prompt)
+    share one upstream call. With wait=False the generate_* methods return
+    at once with {"status": "pending", "job_id"}; repeating the same
+    request picks up the result when it is ready.
+
+    Before any network call the prompt fingerprint is looked up in the
+    persistent LLMCache, so a repeated prompt is answered from disk.
+    """
     
-    def __init__(self):
+    def __init__(self, client=None):
         """Initialize OpenAI client with API key from config."""
+        self.timeout = Config.LLM_TIMEOUT
+        self._executor = ThreadPoolExecutor(max_workers=Config.LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+        self._jobs = {}
+        self._jobs_lock = threading.Lock()
+        self.stats = {"upstream_calls": 0, "coalesced": 0, "rejected": 0, "timeouts": 0}
+        self.latency = {"cache_hit": LatencyWindow(), "upstream": LatencyWindow(), "first_token": LatencyWindow()}
+        # streams run on the request thread; this bounds how many talk upstream at once
+        self._stream_slots = threading.BoundedSemaphore(Config.LLM_MAX_CONCURRENCY)
+        self.cache = None
+        if Config.LLM_CACHE_TTL > 0:
+            try:
+                self.cache = LLMCache()
+            except Exception as cache_error:
+                logger.warning(f"LLM response cache disabled: {cache_error}")
+
+        if client is None and Config.OPENAI_CLIENT == "fake":
+            client = FakeChatCompletion()
+        if client is not None:
+            self.client = client
+            self.model = Config.OPENAI_MODEL
+            logger.info(f"OpenAI service using {type(client).__name__} with model: {self.model}")
+            return
         try:
             Config.validate_openai_config()
             # Set the API key and organization globally for the older openai library
@@ -20,7 +141,7 @@ class OpenAIService:
                 openai.organization = Config.OPENAI_ORG_ID
                 logger.info(f"OpenAI organization ID set: {Config.OPENAI_ORG_ID}")
             self.model = Config.OPENAI_MODEL
-            self.client = True  # Flag to indicate initialization success
+            self.client = openai.ChatCompletion
             logger.info(f"OpenAI service initialized with model: {self.model}")
         except ValueError as e:
             logger.warning(f"OpenAI not configured: {e}")
@@ -35,7 +156,7 @@ class OpenAIService:
         """Check if OpenAI service is available."""
         return self.client is not None
     
-    def generate_customer_insights(self, customer_data, purchase_history, recent_invoices):
+    def generate_customer_insights(self, customer_data, purchase_history, recent_invoices, wait=True):
         """
         Generate customer insights using OpenAI.
         
@@ -43,6 +164,7 @@ class OpenAIService:
             customer_data: Dict containing customer information
             purchase_history: List of historical purchases
             recent_invoices: List of recent invoice data
+            wait: Block (up to LLM_TIMEOUT) for the result; False returns a pending job handle
             
         Returns:
             Dict containing AI-generated insights
@@ -50,59 +172,47 @@ class OpenAIService:
         if not self.is_available():
             return {"error": "OpenAI service not available"}
         
-        try:
-            # Prepare data for the prompt
-            context = {
-                "customer": customer_data,
-                "history": purchase_history[-10:] if purchase_history else [],  # Last 10 items
-                "recent_invoices": recent_invoices
-            }
-            
-            prompt = self._build_customer_insights_prompt(context)
-            
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a retail analytics expert specializing in home improvement products. Provide concise, actionable insights about customer behavior and preferences."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=300,
-                temperature=0.7
-            )
-            
-            insight_text = response.choices[0].message.content.strip()
-            
-            return {
-                "success": True,
-                "insights": insight_text,
-                "model_used": self.model
-            }
-            
-        except Exception as e:
-            error_msg = str(e)
-            if "insufficient_quota" in error_msg or "exceeded your current quota" in error_msg:
-                logger.error(f"OpenAI quota exceeded: {e}")
-                return {
-                    "error": "OpenAI quota exceeded. Please check your billing and plan details."
-                }
-            elif "invalid_api_key" in error_msg:
-                logger.error(f"Invalid OpenAI API key: {e}")
-                return {
-                    "error": "Invalid OpenAI API key. Please check your configuration."
-                }
-            else:
-                logger.error(f"Error generating customer insights: {e}")
-                return {
-                    "error": f"Failed to generate insights: {str(e)}"
-                }
-    
-    def generate_product_recommendations_explanation(self, selected_products, recommendations):
+        prompt = self._insights_prompt(customer_data, purchase_history, recent_invoices)
+        job = self._submit(INSIGHTS_SYSTEM, prompt, 300, "insights")
+        return self._respond(job, wait, "insights")
+    
+    def stream_customer_insights(self, customer_data, purchase_history, recent_invoices):
+        """
+        Streaming variant of generate_customer_insights. Yields (event, data)
+        pairs: ("token", {"text"}) as text arrives, then ("done", result) or
+        ("error", {"error"}).
+        """
+        if not self.is_available():
+            yield "error", {"error": "OpenAI service not available"}
+            return
+        prompt = self._insights_prompt(customer_data, purchase_history, recent_invoices)
+        yield from self._stream(INSIGHTS_SYSTEM, prompt, 300, "insights")
+    
+    def insights_fingerprint(self, customer_data, purchase_history, recent_invoices):
+        """
+        Fingerprint of the insights request for this customer: changes when
+        their history, recent invoices, the prompt or the model change.
+        """
+        prompt = self._insights_prompt(customer_data, purchase_history, recent_invoices)
+        return prompt_fingerprint(self.model, INSIGHTS_SYSTEM, prompt)
+    
+    def _insights_prompt(self, customer_data, purchase_history, recent_invoices):
+        # Prepare data for the prompt
+        context = {
+            "customer": customer_data,
+            "history": purchase_history[-10:] if purchase_history else [],  # Last 10 items
+            "recent_invoices": recent_invoices
+        }
+        return self._build_customer_insights_prompt(context)
+    
+    def generate_product_recommendations_explanation(self, selected_products, recommendations, wait=True):
         """
         Generate explanations for product recommendations using OpenAI.
         
         Args:
             selected_products: List of products customer is buying
             recommendations: List of recommended products with scores
+            wait: Block (up to LLM_TIMEOUT) for the result; False returns a pending job handle
             
         Returns:
             Dict containing AI-generated explanations
@@ -110,44 +220,217 @@ class OpenAIService:
         if not self.is_available():
             return {"error": "OpenAI service not available"}
         
+        prompt = self._build_recommendations_prompt(selected_products, recommendations)
+        job = self._submit(EXPLANATION_SYSTEM, prompt, 200, "explanation")
+        return self._respond(job, wait, "explanation")
+    
+    def stream_product_recommendations_explanation(self, selected_products, recommendations):
+        """Streaming variant of generate_product_recommendations_explanation; see stream_customer_insights."""
+        if not self.is_available():
+            yield "error", {"error": "OpenAI service not available"}
+            return
+        prompt = self._build_recommendations_prompt(selected_products, recommendations)
+        yield from self._stream(EXPLANATION_SYSTEM, prompt, 200, "explanation")
+    
+    def _submit(self, system, prompt, max_tokens, result_key):
+        """Start the upstream call, or join the one already running for this prompt."""
+        key = prompt_fingerprint(self.model, system, prompt)
+        if self.cache is not None:
+            started = time.perf_counter()
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.latency["cache_hit"].add(time.perf_counter() - started)
+                LLM_CALLS.inc(kind=result_key, outcome="cache_hit")
+                return _Job.completed(key, {**cached, "cached": True})
+        with self._jobs_lock:
+            self._expire_jobs()
+            job = self._jobs.get(key)
+            if job is not None:
+                self.stats["coalesced"] += 1
+                LLM_CALLS.inc(kind=result_key, outcome="coalesced")
+                return job
+            pending = sum(1 for j in self._jobs.values() if not j.future.done())
+            if pending >= Config.LLM_MAX_PENDING:
+                self.stats["rejected"] += 1
+                LLM_CALLS.inc(kind=result_key, outcome="rejected")
+                return None
+            self.stats["upstream_calls"] += 1
+            future = self._executor.submit(self._call, key, system, prompt, max_tokens, result_key)
+            job = self._jobs[key] = _Job(key, future)
+            return job
+    
+    def _expire_jobs(self):
+        # finished jobs stay around long enough for the polling client to collect them
+        cutoff = time.monotonic() - Config.LLM_JOB_TTL
+        for key in [k for k, j in self._jobs.items() if j.finished_at is not None and j.finished_at < cutoff]:
+            del self._jobs[key]
+    
+    def _forget(self, job):
+        # a failed call is reported to the requests that joined it, then
+        # dropped so the next request for the same prompt tries again
+        with self._jobs_lock:
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+    
+    def _respond(self, job, wait, kind):
+        if job is None:
+            return {"error": "AI service is busy, please try again shortly", "reason": "busy"}
+        if wait:
+            try:
+                result = job.future.result(timeout=self.timeout)
+            except FutureTimeout:
+                self.stats["timeouts"] += 1
+                LLM_CALLS.inc(kind=kind, outcome="timeout")
+                return {"error": f"AI request timed out after {self.timeout:g}s", "reason": "timeout"}
+            if job.failed():
+                self._forget(job)
+            return result
+        if not job.future.done():
+            return {"status": "pending", "job_id": job.id}
+        if job.failed():
+            self._forget(job)
+        return {"status": "done", "job_id": job.id, **job.future.result()}
+    
+    def _call(self, key, system, prompt, max_tokens, result_key):
+        """Runs on the pool: one chat completion, errors mapped to the API's error dicts."""
         try:
-            prompt = self._build_recommendations_prompt(selected_products, recommendations)
-            
-            response = openai.ChatCompletion.create(
+            started = time.perf_counter()
+            response = self.client.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": "You are a helpful home improvement retail assistant. Explain why certain products complement each other in a friendly, informative way."},
+                    {"role": "system", "content": system},
                     {"role": "user", "content": prompt}
                 ],
-                max_tokens=200,
-                temperature=0.7
+                max_tokens=max_tokens,
+                temperature=0.7,
+                request_timeout=self.timeout
             )
             
-            explanation = response.choices[0].message.content.strip()
+            text = response["choices"][0]["message"]["content"].strip()
+            self.latency["upstream"].add(time.perf_counter() - started)
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage=f"llm.{result_key}")
+            LLM_CALLS.inc(kind=result_key, outcome="success")
+            usage = response.get("usage") or {}
+            for kind in ("prompt_tokens", "completion_tokens"):
+                if usage.get(kind):
+                    LLM_TOKENS.inc(usage[kind], kind=result_key, type=kind.split("_")[0])
             
-            return {
+            result = {
                 "success": True,
-                "explanation": explanation,
+                result_key: text,
                 "model_used": self.model
             }
             
         except Exception as e:
-            error_msg = str(e)
-            if "insufficient_quota" in error_msg or "exceeded your current quota" in error_msg:
-                logger.error(f"OpenAI quota exceeded: {e}")
-                return {
-                    "error": "OpenAI quota exceeded. Please check your billing and plan details."
-                }
-            elif "invalid_api_key" in error_msg:
-                logger.error(f"Invalid OpenAI API key: {e}")
-                return {
-                    "error": "Invalid OpenAI API key. Please check your configuration."
-                }
-            else:
-                logger.error(f"Error generating recommendation explanation: {e}")
-                return {
-                    "error": f"Failed to generate explanation: {str(e)}"
-                }
+            LLM_CALLS.inc(kind=result_key, outcome="error")
+            return self._error_result(e, result_key)
+        self._cache_result(key, result)
+        return result
+    
+    def _cache_result(self, key, result):
+        """Store a successful completion; a cache failure must not turn it into an error."""
+        if self.cache is None:
+            return
+        try:
+            self.cache.set(key, self.model, result)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache write failed: {e}")
+    
+    def _stream(self, system, prompt, max_tokens, result_key):
+        """
+        One streamed completion (stream=True), relayed chunk by chunk. A
+        cached prompt is replayed as a single token; a finished stream is
+        cached like a regular call.
+        """
+        key = prompt_fingerprint(self.model, system, prompt)
+        started = time.perf_counter()
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.latency["cache_hit"].add(time.perf_counter() - started)
+                LLM_CALLS.inc(kind=result_key, outcome="cache_hit")
+                yield "token", {"text": cached[result_key]}
+                yield "done", {**cached, "cached": True}
+                return
+        
+        if not self._stream_slots.acquire(timeout=self.timeout):
+            self.stats["rejected"] += 1
+            LLM_CALLS.inc(kind=result_key, outcome="rejected")
+            yield "error", {"error": "AI service is busy, please try again shortly", "reason": "busy"}
+            return
+        try:
+            self.stats["upstream_calls"] += 1
+            parts = []
+            try:
+                chunks = self.client.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": system},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=max_tokens,
+                    temperature=0.7,
+                    stream=True,
+                    request_timeout=self.timeout
+                )
+                for chunk in chunks:
+                    text = chunk["choices"][0].get("delta", {}).get("content")
+                    if not text:
+                        continue
+                    if not parts:
+                        self.latency["first_token"].add(time.perf_counter() - started)
+                    parts.append(text)
+                    yield "token", {"text": text}
+            except Exception as e:
+                LLM_CALLS.inc(kind=result_key, outcome="error")
+                yield "error", self._error_result(e, result_key)
+                return
+            self.latency["upstream"].add(time.perf_counter() - started)
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage=f"llm.{result_key}")
+            LLM_CALLS.inc(kind=result_key, outcome="success")
+            # streamed completions carry no usage block; one chunk is roughly one token
+            LLM_TOKENS.inc(len(parts), kind=result_key, type="completion")
+            
+            result = {
+                "success": True,
+                result_key: "".join(parts).strip(),
+                "model_used": self.model
+            }
+            self._cache_result(key, result)
+            yield "done", result
+        finally:
+            self._stream_slots.release()
+    
+    def report(self):
+        """Call counters, cache hit rate and latency percentiles for /api/openai_status."""
+        return {
+            "calls": dict(self.stats),
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "latency_ms": {name: window.summary() for name, window in self.latency.items()},
+        }
+    
+    def _error_result(self, e, result_key):
+        error_msg = str(e)
+        if "insufficient_quota" in error_msg or "exceeded your current quota" in error_msg:
+            logger.error(f"OpenAI quota exceeded: {e}")
+            return {
+                "error": "OpenAI quota exceeded. Please check your billing and plan details."
+            }
+        elif "invalid_api_key" in error_msg:
+            logger.error(f"Invalid OpenAI API key: {e}")
+            return {
+                "error": "Invalid OpenAI API key. Please check your configuration."
+            }
+        elif result_key == "insights":
+            logger.error(f"Error generating customer insights: {e}")
+            return {
+                "error": f"Failed to generate insights: {str(e)}"
+            }
+        else:
+            logger.error(f"Error generating recommendation explanation: {e}")
+            return {
+                "error": f"Failed to generate explanation: {str(e)}"
+            }
     
     def _build_customer_insights_prompt(self, context):
         """Build prompt for customer insights."""
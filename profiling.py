@@ -0,0 +1,208 @@
+"""
+Opt-in profiling of individual requests, for finding out why one call is
+slow in production without reproducing it locally.
+
+A request is profiled when it carries the admin token (PROFILE_TOKEN) in an
+`X-Profile` header, or, for continuous profiling, when it is picked by
+PROFILE_SAMPLE_RATE (a fraction of live traffic). The token is only read
+from the header so it stays out of access logs, browser history and
+response-cache keys. `X-Profile-Mode` chooses the profiler:
+
+    cprofile   deterministic (cProfile); stored as a pstats dump (.prof)
+    sampling   a thread snapshots the request's stack every
+               PROFILE_SAMPLE_INTERVAL seconds; stored as collapsed stacks
+               (.collapsed, one "frame;frame;frame count" per line) for
+               flamegraph.pl / speedscope
+
+Both cover everything under the view, including pandas and NumPy frames
+called from recommend.py. Profiles are written to PROFILE_DIR (newest
+PROFILE_KEEP kept); an on-demand request gets its id back in the
+`X-Profile-Id` header, and /api/admin/profiles serves them to token
+holders. Streamed responses (the SSE routes) are profiled until the body
+has been sent, not just until the view returns. Without PROFILE_TOKEN on-demand profiling and the admin routes
+are disabled.
+"""
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from config import Config
+
+MODES = ("cprofile", "sampling")
+# never profiled: the admin routes themselves, the scrape endpoint and static files
+SKIP_ENDPOINTS = {"api_admin_profiles", "api_admin_profile", "metrics_endpoint", "static"}
+EXTENSIONS = {"cprofile": ".prof", "sampling": ".collapsed"}
+_NAME = re.compile(r"^(?P<stamp>\d{8}-\d{6})-(?P<id>[0-9a-f]{12})-(?P<endpoint>[\w.]+)\.(?P<ext>prof|collapsed)$")
+
+
+def _frame_label(code):
+    # last two path parts keep it readable: "pandas/frame.py:take", "package/recommend.py:suggest_for_item"
+    return f"{'/'.join(Path(code.co_filename).parts[-2:])}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """Counts the stacks one thread is in, sampled from a background thread."""
+
+    def __init__(self, thread_id, interval=None):
+        self.thread_id = thread_id
+        self.interval = interval or Config.PROFILE_SAMPLE_INTERVAL
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfile:
+    """One profiled request: start/stop around the view, then save()."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.id = uuid.uuid4().hex[:12]
+        if mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._profiler = SamplingProfiler(threading.get_ident())
+            self._profiler.start()
+
+    def stop(self):
+        if self.mode == "cprofile":
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+
+    def save(self, endpoint):
+        directory = Path(Config.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.id}-{endpoint or 'unmatched'}{EXTENSIONS[self.mode]}"
+        path = directory / name
+        if self.mode == "cprofile":
+            self._profiler.dump_stats(path)
+        else:
+            path.write_text(self._profiler.collapsed())
+        _prune(directory)
+        return path
+
+
+def _prune(directory):
+    files = sorted(p for p in directory.iterdir() if _NAME.match(p.name))
+    for old in files[: max(len(files) - Config.PROFILE_KEEP, 0)]:
+        old.unlink(missing_ok=True)
+
+
+def authorized(request):
+    """True when the request carries the admin profiling token."""
+    token = Config.PROFILE_TOKEN
+    if not token:
+        return False
+    given = request.headers.get("X-Profile", "")
+    return hmac.compare_digest(given.encode(), token.encode())
+
+
+def list_profiles():
+    """Stored profiles, newest first."""
+    directory = Path(Config.PROFILE_DIR)
+    if not directory.exists():
+        return []
+    out = []
+    for path in sorted(directory.iterdir(), reverse=True):
+        match = _NAME.match(path.name)
+        if match:
+            out.append({
+                "id": match["id"],
+                "created": match["stamp"],
+                "endpoint": match["endpoint"],
+                "mode": "cprofile" if match["ext"] == "prof" else "sampling",
+                "bytes": path.stat().st_size,
+            })
+    return out
+
+
+def find_profile(profile_id):
+    directory = Path(Config.PROFILE_DIR)
+    if not re.fullmatch(r"[0-9a-f]{12}", profile_id or "") or not directory.exists():
+        return None
+    for path in directory.iterdir():
+        match = _NAME.match(path.name)
+        if match and match["id"] == profile_id:
+            return path
+    return None
+
+
+def pstats_text(path, sort="cumulative", limit=60):
+    """Human-readable top functions of a .prof dump."""
+    if sort not in ("cumulative", "tottime", "calls", "ncalls"):
+        sort = "cumulative"
+    out = io.StringIO()
+    pstats.Stats(str(path), stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def init_app(app):
+    """Profile requests that ask for it (with the token) or that PROFILE_SAMPLE_RATE picks."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_profile():
+        if request.endpoint in SKIP_ENDPOINTS:
+            return
+        requested = authorized(request)
+        if not requested and not (Config.PROFILE_SAMPLE_RATE > 0 and random.random() < Config.PROFILE_SAMPLE_RATE):
+            return
+        mode = request.headers.get("X-Profile-Mode") or ("cprofile" if requested else Config.PROFILE_SAMPLE_MODE)
+        g.profile = RequestProfile(mode if mode in MODES else "cprofile")
+        g.profile_requested = requested
+
+    def _save(profile, endpoint, url_path):
+        profile.stop()
+        try:
+            path = profile.save(endpoint)
+        except OSError as e:
+            print(f"[profile] could not save profile {profile.id}: {e}")
+            return
+        print(f"[profile] {url_path} -> {path.name} (pid {os.getpid()})")
+
+    @app.after_request
+    def _finish_profile(response):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return response
+        if g.pop("profile_requested", False):
+            response.headers["X-Profile-Id"] = profile.id
+            response.headers["X-Profile-Mode"] = profile.mode
+        if response.is_streamed:
+            # the body is generated after this hook; stop once it has been sent
+            endpoint, url_path = request.endpoint, request.path
+            response.call_on_close(lambda: _save(profile, endpoint, url_path))
+        else:
+            _save(profile, request.endpoint, request.path)
+        return response
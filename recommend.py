@@ -1,131 +1,131 @@
-import json
 import numpy as np
-import pandas as pd
-from pathlib import Path
-import os
-import threading
 
-# ---- bootstrap guards to avoid multiple concurrent trainings ----
-_bootstrap_lock = threading.Lock()
-_bootstrap_running = False
-_bootstrapped = False
+from artifacts import get_store
+from config import Config
+from metrics import timed
 
 
 def ensure_artifacts():
     """
-    Generate synthetic data and train artifacts if missing.
-    Guarded so concurrent requests don't trigger duplicate work.
+    Generate data and train a model if storage lacks them. Offline helper
+    for scripts and the dev server; request handlers never call it.
     """
-    global _bootstrap_running, _bootstrapped
-    with _bootstrap_lock:
-        if _bootstrapped or _bootstrap_running:
-            return
-        _bootstrap_running = True
-
-    try:
-        data_dir = Path(__file__).parent / "data"
-
-        need_core = any(
-            not (data_dir / f).exists()
-            for f in [
-                "customers.csv",
-                "purchases.csv",
-                "products.csv",
-                "item_to_index.json",
-                "index_to_item.json",
-                "complements.json",
-                "main_products.json",
-                "invoices.csv",
-                "invoice_items.csv",
-                "prices.json",
-                "rooms.json",
-            ]
-        )
-        need_assoc = not (data_dir / "assoc_rules.json").exists()
-        need_emb = not (data_dir / "embeddings.npy").exists()
+    import bootstrap
+    bootstrap.bootstrap()
 
-        if need_core:
-            import data_generation
-            print("[bootstrap] Generating synthetic data…")
-            data_generation.main()
 
-        if need_assoc or need_emb:
-            import model_train
-            print("[bootstrap] Training model artifacts…")
-            model_train.main()
-    finally:
-        with _bootstrap_lock:
-            _bootstrapped = True
-            _bootstrap_running = False
+def artifact_store():
+    """
+    Return the process-wide ArtifactStore. Raises
+    artifacts.ArtifactsUnavailable while storage has no data or model.
+    """
+    return get_store()
 
 
 def load_artifacts():
     """
-    Load all on-disk artifacts, ensuring they exist first.
+    Tuple view over the shared ArtifactStore (kept for existing callers).
     """
-    ensure_artifacts()
-
-    data_dir = Path(__file__).parent / "data"
+    store = artifact_store()
+    return (
+        store.item_to_index,
+        store.index_to_item,
+        store.assoc_rules,
+        store.embeddings,
+        store.complements,
+        store.main_product_set,
+        store.prices,
+        store.rooms,
+        store.purchases,
+        store.invoices,
+        store.invoice_items,
+    )
 
-    with open(data_dir / "item_to_index.json", "r") as f:
-        item_to_index = json.load(f)
-    with open(data_dir / "index_to_item.json", "r") as f:
-        index_to_item = {int(k): v for k, v in json.load(f).items()}
-    with open(data_dir / "assoc_rules.json", "r") as f:
-        assoc_rules = json.load(f)
 
-    embeddings = np.load(data_dir / "embeddings.npy")
+@timed("recommend.suggest_for_item")
+def suggest_for_item(target_item, top_k=5, store=None):
+    """
+    Per-item suggestions. Served from the training-time suggestion index
+    when the live bundle has one and covers the item; otherwise scored on
+    the fly with rank_suggestions(). `store` skips the lookup when the
+    caller already holds a snapshot.
+    """
+    store = store or artifact_store()
+    index = store.suggest_index
+    if index is not None and top_k <= index["top_n"]:
+        ranked = index["items"].get(target_item)
+        if ranked is not None:
+            return ranked[:top_k]
+
+    return rank_suggestions(
+        target_item,
+        store.item_to_index,
+        store.assoc_rules,
+        store.similarity,
+        store.complements,
+        store.main_product_set,
+        index_to_item=store.index_to_item,
+    )[:top_k]
+
+
+@timed("recommend.suggest_batch")
+def suggest_batch(items, top_k=5, merged_k=None):
+    """
+    Suggestions for a whole cart in one call: each item's top_k list (as
+    from suggest_for_item) plus a merged basket-level ranking of their
+    candidates, all read from one store snapshot. Returns
+    {"items": [{"item", "suggestions"}], "merged": [...]}.
+    """
+    store = artifact_store()
+    per_item = [{"item": item, "suggestions": suggest_for_item(item, top_k=top_k, store=store)} for item in items]
+    merged = merge_suggestions(per_item, exclude=items)
+    return {"items": per_item, "merged": merged[: merged_k or top_k]}
 
-    with open(data_dir / "complements.json", "r") as f:
-        complements = json.load(f)
 
-    import json as _json
-    main_products = _json.loads((data_dir / "main_products.json").read_text())
-    prices = _json.loads((data_dir / "prices.json").read_text())
-    rooms = _json.loads((data_dir / "rooms.json").read_text())
+def merge_suggestions(per_item, exclude=()):
+    """
+    De-duplicate per-item suggestion lists into one ranking. Each candidate
+    keeps its highest-scoring entry and lists the cart items that suggested
+    it under "sources"; items already in the cart are dropped.
+    """
+    exclude = set(exclude)
+    entries = [
+        (group["item"], rec) for group in per_item for rec in group["suggestions"] if rec["item"] not in exclude
+    ]
+    if not entries:
+        return []
 
-    purchases = pd.read_csv(data_dir / "purchases.csv")
-    invoices = pd.read_csv(data_dir / "invoices.csv")
-    invoice_items = pd.read_csv(data_dir / "invoice_items.csv")
+    names = np.array([rec["item"] for _, rec in entries], dtype=object)
+    scores = np.array([rec.get("score", 0.0) for _, rec in entries], dtype=np.float64)
+    # best entry per name = its first position in a stable score-descending order
+    order = np.argsort(-scores, kind="stable")
+    _, first = np.unique(names[order], return_index=True)
+    best = order[np.sort(first)]
 
-    return (
-        item_to_index,
-        index_to_item,
-        assoc_rules,
-        embeddings,
-        complements,
-        set(main_products),
-        prices,
-        rooms,
-        purchases,
-        invoices,
-        invoice_items,
-    )
+    sources = {}
+    for src, rec in entries:
+        sources.setdefault(rec["item"], [])
+        if src not in sources[rec["item"]]:
+            sources[rec["item"]].append(src)
+    return [{**entries[i][1], "sources": sources[names[i]]} for i in best.tolist()]
 
 
-def suggest_for_item(target_item, top_k=5):
+@timed("recommend.rank_suggestions")
+def rank_suggestions(target_item, item_to_index, assoc_rules, similarity, complements, main_products,
+                     index_to_item=None):
     """
-    Locked-down per-item suggestions:
+    Locked-down per-item suggestions, fully ranked:
       - Allow explicit complements for the item.
       - Allow strong co-purchase candidates (min support/confidence).
+      - With Config.EMBEDDING_CANDIDATES and `index_to_item`, allow that many
+        nearest embedding neighbours (similarity.nearest, approximate when
+        the model has an ANN index).
       - Disallow other main products unless explicitly whitelisted.
-      - Use embedding similarity only for RANKING within the allowed set.
-      - Fill in sane floors so UI never shows 0s.
+      - Use embedding similarity for RANKING within the allowed set.
+      - Fill in sane floors so UI never shows 0s for whitelisted items.
+    Takes the artifacts explicitly so training can build the index with it;
+    `similarity` is a similarity.SimilarityEngine over the item embeddings.
     """
-    (
-        item_to_index,
-        index_to_item,
-        assoc_rules,
-        embeddings,
-        complements,
-        main_products,
-        prices,
-        rooms,
-        purchases,
-        invoices,
-        invoice_items,
-    ) = load_artifacts()
-
     if target_item not in item_to_index:
         return []
 
@@ -143,6 +143,10 @@ def suggest_for_item(target_item, top_k=5):
             if conf >= strong_conf_min and sup >= strong_sup_min:
                 assoc_candidates.add(other)
 
+    if Config.EMBEDDING_CANDIDATES > 0 and index_to_item is not None:
+        neighbours, _ = similarity.nearest(item_to_index[target_item], Config.EMBEDDING_CANDIDATES)
+        assoc_candidates.update(index_to_item[i] for i in neighbours.tolist() if i in index_to_item)
+
     candidates = set()
     for c in whitelist.union(assoc_candidates):
         if c in whitelist:
@@ -154,30 +158,23 @@ def suggest_for_item(target_item, top_k=5):
     candidates.discard(target_item)
     if not candidates:
         return []
+    candidates = sorted(candidates)
 
-    # Ranking
+    # Ranking: similarity decides the order; only complements, rules and (opt-in) neighbours admit
     src_idx = item_to_index[target_item]
-    src_vec = embeddings[src_idx]
+    known = [c for c in candidates if c in item_to_index]
+    sims = dict(zip(known, similarity.one_to_many(src_idx, [item_to_index[c] for c in known]).tolist()))
 
-    confs = [
-        float(assoc_rules.get(target_item, {}).get(c, {}).get("confidence", 0.0))
-        for c in candidates
-    ]
+    rules_from = assoc_rules.get(target_item, {})
+    confs = [float(rules_from.get(c, {}).get("confidence", 0.0)) for c in candidates]
     max_conf = max(confs) if confs else 1.0
 
     results = []
     for c in candidates:
-        stats = assoc_rules.get(target_item, {}).get(c, {})
+        stats = rules_from.get(c, {})
         conf = float(stats.get("confidence", 0.0))
         sup = float(stats.get("support", 0.0))
-
-        # Similarity only used for ranking—never to admit
-        c_idx = item_to_index.get(c)
-        sim = 0.0
-        if c_idx is not None:
-            c_vec = embeddings[c_idx]
-            denom = (np.linalg.norm(src_vec) * np.linalg.norm(c_vec)) + 1e-8
-            sim = float(np.dot(src_vec, c_vec) / denom)
+        sim = sims.get(c, 0.0)
 
         # Normalize and score
         conf_norm = conf / max_conf if max_conf > 0 else 0.0
@@ -185,7 +182,7 @@ def suggest_for_item(target_item, top_k=5):
         score = 0.7 * conf_norm + 0.3 * sim_norm
 
         # Floors so the UI never shows 0/0 for whitelisted-but-rare pairs
-        if conf == 0.0 and sup == 0.0:
+        if conf == 0.0 and sup == 0.0 and c in whitelist:
             conf = 0.22
             sup = 0.04
 
@@ -200,86 +197,101 @@ def suggest_for_item(target_item, top_k=5):
         )
 
     results.sort(key=lambda x: x["score"], reverse=True)
-    return results[:top_k]
+    return results
 
 
-def recent_purchase_for_customer(customer_id):
-    data_dir = Path(__file__).parent / "data"
-    purchases = pd.read_csv(data_dir / "purchases.csv")
-    df = purchases[purchases["customer_id"] == customer_id].sort_values("date")
-    if df.empty:
+PROFILE_FIELDS = ("details", "invoices", "history", "additional_recs")
+DETAIL_KEYS = ("customer_id", "name", "address", "phone", "email")
+
+
+@timed("recommend.customer_profile")
+def customer_profile(customer_id, fields=PROFILE_FIELDS, invoice_limit=2, recs_k=8):
+    """
+    The customer panel in one call: details, recent invoices, purchase
+    history and additional recommendations, read from a single store
+    snapshot. Only the requested `fields` are computed, and the invoices
+    are fetched once even when additional_recs needs them too. Returns None
+    for an unknown customer.
+    """
+    store = artifact_store()
+    repo = store.customer_repo
+    row = repo.details(customer_id)
+    if row is None:
         return None
-    return df.iloc[-1]["item"]
+
+    profile = {"customer_id": customer_id}
+    if "details" in fields:
+        profile["details"] = {k: row[k] for k in DETAIL_KEYS}
+    invoices = None
+    if "invoices" in fields or "additional_recs" in fields:
+        invoices = repo.recent_invoices(customer_id, limit=max(invoice_limit, 2))
+    if "invoices" in fields:
+        profile["invoices"] = invoices[:invoice_limit]
+    if "history" in fields:
+        profile["history"] = repo.history(customer_id)
+    if "additional_recs" in fields:
+        profile["additional_recs"] = additional_recommendations(customer_id, recs_k, invoices=invoices, store=store)
+    return profile
+
+
+def recent_purchase_for_customer(customer_id):
+    return artifact_store().customer_repo.recent_purchase(customer_id)
 
 
 def list_customers():
-    data_dir = Path(__file__).parent / "data"
-    customers = pd.read_csv(data_dir / "customers.csv")
-    return customers["customer_id"].tolist(), customers["name"].tolist()
+    return artifact_store().customer_repo.list_customers()
 
 
-def additional_recommendations(customer_id, top_k=8):
+@timed("recommend.additional_recommendations")
+def additional_recommendations(customer_id, top_k=8, invoices=None, store=None):
     """
     Recommend additional MAIN products for rooms already represented
     in the customer's last two invoices. Uses:
       - room overlap
       - max confidence against any bought item (with floors)
       - embedding similarity as a tie-breaker
+    `invoices` (newest first) and `store` skip the lookups when the caller
+    already has them.
     """
-    (
-        item_to_index,
-        index_to_item,
-        assoc_rules,
-        embeddings,
-        complements,
-        main_products,
-        prices,
-        rooms,
-        purchases,
-        invoices,
-        invoice_items,
-    ) = load_artifacts()
+    store = store or artifact_store()
+    item_to_index = store.item_to_index
+    assoc_rules = store.assoc_rules
+    rooms = store.rooms
 
     # last two invoices
-    invs = (
-        invoices[invoices["customer_id"] == customer_id]
-        .sort_values("date", ascending=False)
-        .head(2)
-    )
-    inv_ids = invs["invoice_id"].tolist()
-    bought = set(
-        invoice_items[invoice_items["invoice_id"].isin(inv_ids)]["item"].tolist()
-    )
+    invs = invoices[:2] if invoices is not None else store.customer_repo.recent_invoices(customer_id, limit=2)
+    bought = sorted(set(item for inv in invs for item in inv["items"]))
 
     # rooms represented in bought items
     used_rooms = set(rooms.get(i, None) for i in bought if rooms.get(i))
 
     # candidate mains in those rooms that customer hasn't bought yet
+    bought_set = set(bought)
     candidate_mains = [
-        m for m in main_products if m not in bought and rooms.get(m) in used_rooms
+        m for m in store.main_products if m not in bought_set and rooms.get(m) in used_rooms
     ]
+    if not candidate_mains:
+        return []
+
+    # similarity(b, c) for every candidate x bought pair in one multiply
+    known_bought = [item_to_index[b] for b in bought if b in item_to_index]
+    known_mains = [c for c in candidate_mains if c in item_to_index]
+    avg_sims = {}
+    if known_bought and known_mains:
+        sim_matrix = store.similarity.many_to_many(
+            [item_to_index[c] for c in known_mains], known_bought
+        )
+        avg_sims = dict(zip(known_mains, sim_matrix.mean(axis=1).tolist()))
 
     results = []
     for c in candidate_mains:
-        confs = []
-        sims = []
-        sups = []
-        for b in bought:
-            # confidence/support for (b -> c)
-            stats = assoc_rules.get(b, {}).get(c, {})
-            confs.append(float(stats.get("confidence", 0.0)))
-            sups.append(float(stats.get("support", 0.0)))
-
-            # similarity(b, c)
-            if b in item_to_index and c in item_to_index:
-                b_vec = embeddings[item_to_index[b]]
-                c_vec = embeddings[item_to_index[c]]
-                denom = (np.linalg.norm(b_vec) * np.linalg.norm(c_vec)) + 1e-8
-                sims.append(float(np.dot(b_vec, c_vec) / denom))
+        # confidence/support for (b -> c)
+        confs = [float(assoc_rules.get(b, {}).get(c, {}).get("confidence", 0.0)) for b in bought]
+        sups = [float(assoc_rules.get(b, {}).get(c, {}).get("support", 0.0)) for b in bought]
 
         max_conf = max(confs) if confs else 0.0
         max_sup = max(sups) if sups else 0.0
-        avg_sim = (sum(sims) / len(sims)) if sims else 0.0
+        avg_sim = avg_sims.get(c, 0.0)
 
         # floors so UI never shows zeros
         if max_conf == 0.0:
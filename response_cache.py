@@ -0,0 +1,242 @@
+"""
+Response cache for the read-only recommendation routes.
+
+Entries are keyed by route, query string and the live model version, so a
+retrain (a new version) invalidates every entry without any purge step.
+Each worker keeps an in-process LRU bounded by entry count and bytes, with
+a TTL; RESPONSE_CACHE_SHARED optionally adds a second tier shared by all
+workers: "disk" (a SQLite file) or a redis:// URL (needs the `redis`
+package). Cached responses carry an ETag and Cache-Control (private for
+per-customer routes), and a matching If-None-Match gets a 304 without
+touching the view.
+"""
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import urlencode
+
+from flask import current_app, g, request
+
+from config import Config
+from storage import sqlite_connection
+
+
+class LRUTier:
+    """In-process LRU with a TTL, bounded by entry count and total bytes."""
+
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.nbytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self.nbytes += len(value)
+            while self._entries and (len(self._entries) > self.max_entries or self.nbytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, value = self._entries.pop(key)
+        self.nbytes -= len(value)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskTier:
+    """Shared tier in a SQLite file (WAL), one connection per thread."""
+
+    PRUNE_EVERY = 200
+
+    def __init__(self, path, ttl):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value BLOB, expires REAL)"
+        )
+
+    def _connect(self):
+        return sqlite_connection(self._local, self.path)
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM responses WHERE key = ? AND expires >= ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, value, time.time() + self.ttl))
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            conn.execute("DELETE FROM responses WHERE expires < ?", (time.time(),))
+
+
+class RedisTier:
+    """Shared tier in Redis (or anything speaking its protocol); keys expire server-side."""
+
+    def __init__(self, url, ttl):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RESPONSE_CACHE_SHARED is a redis:// URL but the redis package is not installed") from e
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value):
+        self._client.setex(key, max(int(self.ttl), 1), value)
+
+
+class ResponseCache:
+    """
+    Two-tier cache of serialized responses. A value is the ETag, a newline
+    and the JSON body, so either tier can store it as plain bytes.
+    """
+
+    def __init__(self, ttl=None, max_entries=None, max_bytes=None, shared=None):
+        self.ttl = Config.RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.local = LRUTier(
+            max_entries or Config.RESPONSE_CACHE_MAX_ENTRIES,
+            max_bytes or Config.RESPONSE_CACHE_MAX_BYTES,
+            self.ttl,
+        )
+        self.shared = _shared_tier(Config.RESPONSE_CACHE_SHARED if shared is None else shared, self.ttl)
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def get(self, key):
+        """(value, tier) where tier is "local", "shared" or None on a miss."""
+        value = self.local.get(key)
+        if value is not None:
+            return value, "local"
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:  # a broken shared tier must not take the route down
+                print(f"[cache] shared tier read failed: {e}")
+                value = None
+            if value is not None:
+                self.local.set(key, value)
+                return value, "shared"
+        return None, None
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value)
+            except Exception as e:
+                print(f"[cache] shared tier write failed: {e}")
+
+    def count(self, route, outcome):
+        with self._stats_lock:
+            counts = self._stats.setdefault(route, {"hits": 0, "shared_hits": 0, "misses": 0, "not_modified": 0})
+            counts[outcome] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            routes = {route: dict(counts) for route, counts in self._stats.items()}
+        hits = sum(c["hits"] + c["shared_hits"] for c in routes.values())
+        lookups = hits + sum(c["misses"] for c in routes.values())
+        return {
+            "enabled": self.enabled,
+            "shared": type(self.shared).__name__ if self.shared is not None else None,
+            "ttl_seconds": self.ttl,
+            "entries": len(self.local),
+            "bytes": self.local.nbytes,
+            "evictions": self.local.evictions,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "routes": routes,
+        }
+
+
+def _shared_tier(spec, ttl):
+    if not spec:
+        return None
+    if spec == "disk":
+        return DiskTier(Config.RESPONSE_CACHE_PATH, ttl)
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisTier(spec, ttl)
+    raise ValueError(f"Unknown RESPONSE_CACHE_SHARED {spec!r}; expected 'disk' or a redis:// URL")
+
+
+def cache_key(route, version, args):
+    # urlencode escapes "&" and "=" inside values, so no two queries share a key
+    query = urlencode(sorted(args.items(multi=True)))
+    return f"resp:{route}:{version}:{query}"
+
+
+def cached(cache, route, version_fn, cache_control="public"):
+    """
+    Cache a GET view's 200 responses under (route, query, version_fn()).
+    Hits skip the view entirely; a matching If-None-Match gets a 304.
+    `cache_control` is "public" for responses any proxy may store, or
+    "private" for per-customer ones only the browser should keep.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # an on-demand profile (profiling.py) wants the real work, not a cache hit
+            if not cache.enabled or g.get("profile_requested"):
+                return view(*args, **kwargs)
+            key = cache_key(route, version_fn(), request.args)
+            value, tier = cache.get(key)
+            if value is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                value = hashlib.sha1(body).hexdigest()[:20].encode() + b"\n" + body
+                cache.set(key, value)
+                cache.count(route, "misses")
+            else:
+                cache.count(route, "hits" if tier == "local" else "shared_hits")
+
+            etag, _, body = value.partition(b"\n")
+            etag = etag.decode()
+            if request.if_none_match.contains(etag):
+                cache.count(route, "not_modified")
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.response_class(body, mimetype="application/json")
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = f"{cache_control}, max-age={Config.RESPONSE_CACHE_MAX_AGE}"
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,84 @@
+import numpy as np
+
+COMPACT_DTYPES = {
+    "float64": np.float64,
+    "float32": np.float32,
+    "float16": np.float16,
+}
+
+
+class SimilarityEngine:
+    """
+    Cosine similarity over an embedding matrix that is L2-normalized once,
+    so every query is a single gather plus matrix multiply.
+
+    `dtype` controls how the normalized matrix is stored. float16 halves the
+    footprint of float32 but can move the third decimal the API reports, so
+    it is meant for very large catalogs. Products are always accumulated in
+    float32 or wider.
+
+    `index` is an optional ann_index.IVFIndex over the same rows; nearest()
+    uses it when set and scans the whole matrix otherwise.
+    """
+
+    index = None
+
+    def __init__(self, embeddings, dtype="float32"):
+        if isinstance(dtype, str):
+            dtype = COMPACT_DTYPES[dtype]
+        vectors = np.asarray(embeddings, dtype=np.float64)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        # zero vectors stay zero and so have similarity 0 with everything
+        normed = vectors / np.maximum(norms, 1e-12)
+        self.vectors = np.ascontiguousarray(normed.astype(dtype))
+        self._compute_dtype = np.promote_types(self.vectors.dtype, np.float32)
+
+    @classmethod
+    def from_normalized(cls, vectors):
+        """
+        Wrap rows that are already unit-length (e.g. a memory-mapped
+        embeddings_normed.npy) without copying them.
+        """
+        engine = cls.__new__(cls)
+        engine.vectors = vectors
+        engine._compute_dtype = np.promote_types(vectors.dtype, np.float32)
+        return engine
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def nbytes(self):
+        return int(self.vectors.nbytes)
+
+    def _rows(self, idxs):
+        return self.vectors[np.asarray(idxs, dtype=np.intp)].astype(self._compute_dtype, copy=False)
+
+    def one_to_many(self, src_idx, idxs):
+        """Similarity of one item against each of `idxs`; shape (len(idxs),)."""
+        return self._rows(idxs) @ self._rows([src_idx])[0]
+
+    def many_to_many(self, left_idxs, right_idxs):
+        """Similarity matrix of shape (len(left_idxs), len(right_idxs))."""
+        return self._rows(left_idxs) @ self._rows(right_idxs).T
+
+    def one_to_all(self, src_idx):
+        """Similarity of one item against the whole catalog; shape (n_items,)."""
+        return self.vectors.astype(self._compute_dtype, copy=False) @ self._rows([src_idx])[0]
+
+    def nearest(self, src_idx, k, nprobe=None, exact=False):
+        """
+        (indices, similarities) of the `k` items most similar to `src_idx`,
+        best first, excluding the item itself. Approximate when an index is
+        attached (`nprobe` overrides its probe count) unless `exact`.
+        """
+        if self.index is not None and not exact:
+            return self.index.search(self._rows([src_idx])[0], k, nprobe=nprobe, exclude=src_idx)
+        sims = self.one_to_all(src_idx)
+        sims[src_idx] = -np.inf
+        k = min(k, len(sims) - 1)
+        if k <= 0:
+            return np.empty(0, dtype=np.intp), sims[:0]
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top], kind="stable")]
+        return top, sims[top]
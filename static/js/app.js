@@ -1,4 +1,34 @@
 async function getJSON(url) { const r = await fetch(url); return r.json(); }
+// LLM routes answer 202 {status: "pending"} until the job finishes; repeat the request to poll
+async function pollJSON(url, { intervalMs = 1000, maxTries = 60 } = {}) {
+  for (let i = 0; i < maxTries; i++) {
+    const d = await getJSON(url);
+    if (d.status !== "pending") return d;
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+  }
+  return { error: "Timed out waiting for AI response" };
+}
+// Server-Sent Events from the /stream routes: "token" events, then "done" or "error"
+function streamEvents(url, { onToken, onDone, onError }) {
+  const source = new EventSource(url);
+  source.addEventListener("token", e => onToken(JSON.parse(e.data).text));
+  source.addEventListener("done", e => { source.close(); onDone(JSON.parse(e.data)); });
+  source.addEventListener("error", e => {
+    source.close();
+    onError(e.data ? JSON.parse(e.data) : { error: "Connection lost" });
+  });
+}
+function renderStreamingText(el, text) {
+  el.innerHTML = "";
+  const div = document.createElement("div");
+  div.className = "ai-streaming";
+  div.textContent = text;
+  el.appendChild(div);
+}
+async function postJSON(url, body) {
+  const r = await fetch(url, { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify(body) });
+  return r.json();
+}
 
 function renderHistory(rows, invoices = []) {
   const wrap = document.getElementById("history"); wrap.innerHTML = "";
@@ -150,11 +180,10 @@ async function onCustomerChange() {
     document.getElementById("history").innerHTML=""; 
     return; 
   }
-  const [details, invoices, hist] = await Promise.all([
-    getJSON(`/api/customer_details?customer_id=${encodeURIComponent(id)}`),
-    getJSON(`/api/customer_invoices?customer_id=${encodeURIComponent(id)}&limit=2`),
-    getJSON(`/api/customer_history?customer_id=${encodeURIComponent(id)}`)
-  ]);
+  const profile = await getJSON(`/api/customer_profile?customer_id=${encodeURIComponent(id)}&fields=details,invoices,history&limit=2`);
+  const details = profile.details || {};
+  const invoices = profile.invoices || [];
+  const hist = profile.history || [];
   renderCustomerDetails(details);
   renderInvoices(invoices);
   renderHistory(hist, invoices);
@@ -193,16 +222,12 @@ async function getSuggestions() {
     // Clear previous suggestions (now that section is visible)
     clearSuggestionColumns();
 
-    // fetch suggestions per selected product
-    const promises = items.map((item, index) =>
-      getJSON(`/api/suggest?item=${encodeURIComponent(item)}&k=5`)
-        .then(d => ({ item, list: d.suggestions || [], index }))
-    );
-    const results = await Promise.all(promises);
+    // one request for every selected product
+    const batch = await postJSON("/api/suggest_batch", { items, k: 5 });
     
     // Render suggestions in columns
-    results.forEach(({ item, list, index }) => {
-      renderSuggestionInColumn(item, list, index + 1);
+    (batch.items || []).forEach(({ item, suggestions }, index) => {
+      renderSuggestionInColumn(item, suggestions || [], index + 1);
     });
 
     // Load AI explanation for recommendations (works with or without customer)
@@ -211,11 +236,11 @@ async function getSuggestions() {
     // additional recs based on previous invoices (only if customer is selected)
     const cid = document.getElementById("customerSelect").value;
     if (cid) {
-      const extra = await getJSON(`/api/additional_recs?customer_id=${encodeURIComponent(cid)}`);
+      const extra = await getJSON(`/api/customer_profile?customer_id=${encodeURIComponent(cid)}&fields=additional_recs`);
       const extraGrid = document.getElementById("additionalGrid");
       extraGrid.innerHTML = "";
       extraGrid.appendChild(
-        renderSuggestionColumn("For their rooms", (extra && extra.suggestions) ? extra.suggestions : [])
+        renderSuggestionColumn("For their rooms", (extra && extra.additional_recs) ? extra.additional_recs : [])
       );
     } else {
       // Clear additional recommendations if no customer selected
@@ -235,13 +260,7 @@ async function loadCustomerInsights(customerId) {
   const section = document.getElementById("aiInsightsSection");
   const content = document.getElementById("aiInsightsContent");
   
-  try {
-    // Show loading state
-    section.style.display = "block";
-    content.innerHTML = '<div class="ai-loading">Loading AI insights...</div>';
-    
-    const insights = await getJSON(`/api/customer_insights?customer_id=${encodeURIComponent(customerId)}`);
-    
+  const show = insights => {
     if (insights.success && insights.insights) {
       content.innerHTML = formatInsightsForSales(insights.insights);
     } else if (insights.error) {
@@ -251,6 +270,25 @@ async function loadCustomerInsights(customerId) {
         content.innerHTML = `<div class="ai-error">Unable to generate insights: ${insights.error}</div>`;
       }
     }
+  };
+  
+  try {
+    // Show loading state
+    section.style.display = "block";
+    content.innerHTML = '<div class="ai-loading">Loading AI insights...</div>';
+    
+    const query = `customer_id=${encodeURIComponent(customerId)}`;
+    if (window.EventSource) {
+      // render tokens as they arrive, then the formatted cards
+      let text = "";
+      streamEvents(`/api/customer_insights/stream?${query}`, {
+        onToken: t => { text += t; renderStreamingText(content, text); },
+        onDone: show,
+        onError: show
+      });
+    } else {
+      show(await pollJSON(`/api/customer_insights?${query}&async=1`));
+    }
   } catch (err) {
     console.warn("AI insights not available:", err);
     section.style.display = "none"; // Hide on error
@@ -324,14 +362,7 @@ async function loadRecommendationExplanation(selectedProducts) {
   const container = document.getElementById("aiExplanation");
   const content = document.getElementById("aiExplanationContent");
   
-  try {
-    // Show loading state
-    container.style.display = "block";
-    content.innerHTML = '<div class="ai-loading">Analyzing recommendations...</div>';
-    
-    const params = selectedProducts.map(p => `products=${encodeURIComponent(p)}`).join('&');
-    const explanation = await getJSON(`/api/recommendation_explanation?${params}`);
-    
+  const show = explanation => {
     if (explanation.success && explanation.explanation) {
       content.innerHTML = formatRecommendationCards(explanation.explanation, explanation.recommendations || []);
     } else if (explanation.error) {
@@ -341,6 +372,24 @@ async function loadRecommendationExplanation(selectedProducts) {
         content.innerHTML = `<div class="ai-error">Unable to generate explanation: ${explanation.error}</div>`;
       }
     }
+  };
+  
+  try {
+    // Show loading state
+    container.style.display = "block";
+    content.innerHTML = '<div class="ai-loading">Analyzing recommendations...</div>';
+    
+    const params = selectedProducts.map(p => `products=${encodeURIComponent(p)}`).join('&');
+    if (window.EventSource) {
+      let text = "";
+      streamEvents(`/api/recommendation_explanation/stream?${params}`, {
+        onToken: t => { text += t; renderStreamingText(content, text); },
+        onDone: show,
+        onError: show
+      });
+    } else {
+      show(await pollJSON(`/api/recommendation_explanation?${params}&async=1`));
+    }
   } catch (err) {
     console.warn("AI explanation not available:", err);
     container.style.display = "none"; // Hide on error
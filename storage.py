@@ -0,0 +1,509 @@
+"""
+Storage backends for the catalog, transactional tables and model artifacts.
+
+FileBackend reads the CSV/JSON data directory written by data_generation and
+the versioned model bundles written by model_train; it is what the demo uses.
+SQLiteBackend keeps the same data in indexed tables of one SQLite database
+(WAL mode, so readers never block the trainer's writes). Everything that
+reads data goes through get_backend(), selected by Config.STORAGE_BACKEND.
+
+One-shot migration from the files:
+
+    python storage.py migrate [--data-dir data] [--db data/crosssell.db]
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ann_index import IVFIndex
+from assoc_matrix import AssocMatrix
+from config import Config
+from customer_repo import CustomerRepository, SQLiteCustomerRepository
+from similarity import SimilarityEngine
+
+LEGACY_VERSION = "legacy"
+KEEP_MODELS = 3
+
+CORE_FILES = [
+    "customers.csv",
+    "purchases.csv",
+    "products.csv",
+    "item_to_index.json",
+    "index_to_item.json",
+    "complements.json",
+    "main_products.json",
+    "invoices.csv",
+    "invoice_items.csv",
+    "prices.json",
+    "rooms.json",
+]
+
+
+def sqlite_connection(local, path, timeout=5, isolation_level=None, row_factory=None):
+    """
+    This thread's connection to the SQLite file at `path`, opened on first
+    use in WAL mode with synchronous=NORMAL and kept on `local` (a
+    threading.local owned by the caller). The defaults (autocommit, short
+    busy timeout) suit the caches and stores; SQLiteBackend passes its own.
+    """
+    conn = getattr(local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=timeout, isolation_level=isolation_level)
+        if row_factory is not None:
+            conn.row_factory = row_factory
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        local.conn = conn
+    return conn
+
+
+def new_model_version():
+    return time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() % 10**9:09d}"
+
+
+class StorageBackend:
+    """
+    What the ArtifactStore and model_train need from a data source.
+
+    load_catalog() returns a dict with item_to_index, index_to_item,
+    complements, main_products, prices, rooms and products (DataFrame).
+    load_model(version) returns a dict with assoc_rules (nested dict or
+    AssocMatrix), embeddings, normalized_embeddings, suggest_index and
+    ann_index (an ann_index.IVFIndex; the last three None if the model has
+    none).
+    """
+
+    def describe(self):
+        raise NotImplementedError
+
+    def has_data(self):
+        raise NotImplementedError
+
+    def has_model(self):
+        raise NotImplementedError
+
+    def load_catalog(self):
+        raise NotImplementedError
+
+    def customer_repository(self):
+        raise NotImplementedError
+
+    def model_stamp(self):
+        """Cheap token that changes whenever the live model may have changed."""
+        raise NotImplementedError
+
+    def model_version(self):
+        raise NotImplementedError
+
+    def load_model(self, version):
+        raise NotImplementedError
+
+    def save_model(self, assoc_rules, embeddings, suggest_index=None, ann_index=None):
+        """Store a model and atomically make it the live one; returns its version."""
+        raise NotImplementedError
+
+
+class FileBackend(StorageBackend):
+    """
+    CSV/JSON data directory. Trained models live in versioned bundles under
+    data/artifacts/<version>/; CURRENT names the live bundle and is only ever
+    replaced atomically, so a reader sees either the old bundle or the new
+    one, never a half-written file.
+    """
+
+    BUNDLES_DIRNAME = "artifacts"
+    POINTER_FILENAME = "CURRENT"
+
+    def __init__(self, data_dir):
+        self.data_dir = Path(data_dir)
+
+    def describe(self):
+        return f"files:{self.data_dir}"
+
+    @property
+    def bundles_dir(self):
+        return self.data_dir / self.BUNDLES_DIRNAME
+
+    def _read_json(self, name):
+        with open(self.data_dir / name, "r") as f:
+            return json.load(f)
+
+    def has_data(self):
+        return all((self.data_dir / f).exists() for f in CORE_FILES)
+
+    def has_model(self):
+        model_dir = self.model_dir(self.model_version())
+        return (model_dir / "assoc_rules.json").exists() and (model_dir / "embeddings.npy").exists()
+
+    def load_catalog(self):
+        return {
+            "item_to_index": self._read_json("item_to_index.json"),
+            "index_to_item": {int(k): v for k, v in self._read_json("index_to_item.json").items()},
+            "complements": self._read_json("complements.json"),
+            "main_products": self._read_json("main_products.json"),
+            "prices": self._read_json("prices.json"),
+            "rooms": self._read_json("rooms.json"),
+            "products": pd.read_csv(self.data_dir / "products.csv"),
+        }
+
+    def customer_repository(self):
+        return CustomerRepository(
+            pd.read_csv(self.data_dir / "customers.csv"),
+            pd.read_csv(self.data_dir / "purchases.csv"),
+            pd.read_csv(self.data_dir / "invoices.csv"),
+            pd.read_csv(self.data_dir / "invoice_items.csv"),
+        )
+
+    # ---- model bundles ----
+    def model_stamp(self):
+        """mtime of the CURRENT pointer in ns, or None if there is no pointer."""
+        try:
+            return os.stat(self.bundles_dir / self.POINTER_FILENAME).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def model_version(self):
+        try:
+            return (self.bundles_dir / self.POINTER_FILENAME).read_text().strip()
+        except FileNotFoundError:
+            return LEGACY_VERSION
+
+    def model_dir(self, version):
+        """
+        Bundle directory for a version. The legacy version is the unversioned
+        assoc_rules.json/embeddings.npy at the data root, used until the
+        first bundle is published.
+        """
+        if version == LEGACY_VERSION:
+            return self.data_dir
+        return self.bundles_dir / version
+
+    def load_model(self, version):
+        """
+        Bundles written since the columnar format existed are memory-mapped
+        (Config.ARTIFACT_MMAP): the CSR assoc matrix and the pre-normalized
+        embeddings stay in the page cache, shared by all workers. Older
+        bundles fall back to parsing assoc_rules.json.
+        """
+        model_dir = self.model_dir(version)
+        mmap = Config.ARTIFACT_MMAP
+        if AssocMatrix.exists(model_dir):
+            assoc_rules = AssocMatrix.load(model_dir, mmap=mmap)
+        else:
+            with open(model_dir / "assoc_rules.json", "r") as f:
+                assoc_rules = json.load(f)
+        suggest_index = None
+        if (model_dir / "suggest_index.json").exists():
+            with open(model_dir / "suggest_index.json", "r") as f:
+                suggest_index = json.load(f)
+        normalized = None
+        if (model_dir / "embeddings_normed.npy").exists():
+            normalized = np.load(model_dir / "embeddings_normed.npy", mmap_mode="r" if mmap else None)
+        ann_index = None
+        if IVFIndex.exists(model_dir):
+            ann_index = IVFIndex.load(model_dir, mmap=mmap, nprobe=Config.ANN_NPROBE)
+        return {
+            "assoc_rules": assoc_rules,
+            "embeddings": np.load(model_dir / "embeddings.npy", mmap_mode="r" if mmap else None),
+            "normalized_embeddings": normalized,
+            "suggest_index": suggest_index,
+            "ann_index": ann_index,
+        }
+
+    def new_bundle(self):
+        """
+        Create an empty staging directory for a training run.
+        Returns (version, staging_dir); fill it, then call publish_bundle().
+        """
+        version = new_model_version()
+        staging = self.bundles_dir / f".staging-{version}"
+        staging.mkdir(parents=True)
+        return version, staging
+
+    def publish_bundle(self, version, staging):
+        """
+        Move a fully written staging directory into place and atomically point
+        CURRENT at it. Older bundles beyond KEEP_MODELS are removed.
+        """
+        root = self.bundles_dir
+        final = root / version
+        os.replace(staging, final)
+
+        tmp = root / f".{self.POINTER_FILENAME}.{version}"
+        with open(tmp, "w") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, root / self.POINTER_FILENAME)
+
+        published = sorted(p for p in root.iterdir() if p.is_dir() and not p.name.startswith("."))
+        for old in published[:-KEEP_MODELS]:
+            shutil.rmtree(old, ignore_errors=True)
+        return final
+
+    def save_model(self, assoc_rules, embeddings, suggest_index=None, ann_index=None):
+        version, staging = self.new_bundle()
+        (staging / "assoc_rules.json").write_text(json.dumps(assoc_rules))
+        AssocMatrix.from_rules(assoc_rules, self._read_json("item_to_index.json")).save(staging)
+        np.save(staging / "embeddings.npy", embeddings)
+        np.save(staging / "embeddings_normed.npy", SimilarityEngine(embeddings, dtype="float32").vectors)
+        if suggest_index is not None:
+            (staging / "suggest_index.json").write_text(json.dumps(suggest_index))
+        if ann_index is not None:
+            ann_index.save(staging)
+        self.publish_bundle(version, staging)
+        return version
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+
+CREATE TABLE IF NOT EXISTS customers (
+    customer_id TEXT PRIMARY KEY, name TEXT, address TEXT, phone TEXT, email TEXT
+);
+CREATE TABLE IF NOT EXISTS purchases (customer_id TEXT, date TEXT, item TEXT);
+CREATE INDEX IF NOT EXISTS ix_purchases_customer ON purchases (customer_id, date);
+CREATE TABLE IF NOT EXISTS invoices (invoice_id TEXT PRIMARY KEY, customer_id TEXT, date TEXT, total NUMERIC);
+CREATE INDEX IF NOT EXISTS ix_invoices_customer ON invoices (customer_id, date);
+CREATE TABLE IF NOT EXISTS invoice_items (invoice_id TEXT, item TEXT);
+CREATE INDEX IF NOT EXISTS ix_invoice_items_invoice ON invoice_items (invoice_id);
+
+CREATE TABLE IF NOT EXISTS products (item TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS item_index (item TEXT PRIMARY KEY, idx INTEGER UNIQUE);
+CREATE TABLE IF NOT EXISTS main_products (position INTEGER PRIMARY KEY, item TEXT);
+CREATE TABLE IF NOT EXISTS prices (item TEXT PRIMARY KEY, price NUMERIC);
+CREATE TABLE IF NOT EXISTS rooms (item TEXT PRIMARY KEY, room TEXT);
+CREATE TABLE IF NOT EXISTS complements (item TEXT, position INTEGER, complement TEXT, PRIMARY KEY (item, position));
+
+CREATE TABLE IF NOT EXISTS models (
+    version TEXT PRIMARY KEY,
+    created_at REAL,
+    embeddings BLOB,
+    embeddings_dtype TEXT,
+    embeddings_rows INTEGER,
+    embeddings_cols INTEGER,
+    suggest_index TEXT
+);
+CREATE TABLE IF NOT EXISTS assoc_rules (
+    version TEXT, src TEXT, dst TEXT, support REAL, confidence REAL,
+    PRIMARY KEY (version, src, dst)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    One SQLite database in WAL mode. Each thread gets its own connection;
+    customer lookups are indexed queries rather than in-memory tables.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+
+    def describe(self):
+        return f"sqlite:{self.db_path}"
+
+    def connect(self):
+        # implicit transactions (model saves and the migration run in `with conn:`)
+        # and a longer busy timeout, since the trainer holds the write lock a while
+        return sqlite_connection(self._local, self.db_path, timeout=30, isolation_level="", row_factory=sqlite3.Row)
+
+    def create_schema(self):
+        conn = self.connect()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _meta(self, key):
+        row = self.connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def has_data(self):
+        if not self.db_path.exists():
+            return False
+        try:
+            return self.connect().execute("SELECT 1 FROM item_index LIMIT 1").fetchone() is not None
+        except sqlite3.OperationalError:
+            return False
+
+    def has_model(self):
+        if not self.db_path.exists():
+            return False
+        try:
+            return self.model_version() is not None
+        except sqlite3.OperationalError:
+            return False
+
+    def load_catalog(self):
+        conn = self.connect()
+        item_to_index = {r["item"]: r["idx"] for r in conn.execute("SELECT item, idx FROM item_index ORDER BY idx")}
+        complements = {}
+        for r in conn.execute("SELECT item, complement FROM complements ORDER BY rowid"):
+            complements.setdefault(r["item"], []).append(r["complement"])
+        return {
+            "item_to_index": item_to_index,
+            "index_to_item": {i: item for item, i in item_to_index.items()},
+            "complements": complements,
+            "main_products": [r[0] for r in conn.execute("SELECT item FROM main_products ORDER BY position")],
+            "prices": {r[0]: r[1] for r in conn.execute("SELECT item, price FROM prices ORDER BY rowid")},
+            "rooms": {r[0]: r[1] for r in conn.execute("SELECT item, room FROM rooms ORDER BY rowid")},
+            "products": pd.read_sql_query("SELECT item FROM products ORDER BY rowid", conn),
+        }
+
+    def customer_repository(self):
+        return SQLiteCustomerRepository(self.connect)
+
+    def model_stamp(self):
+        return self.model_version()
+
+    def model_version(self):
+        return self._meta("current_model")
+
+    def load_model(self, version):
+        conn = self.connect()
+        row = conn.execute("SELECT * FROM models WHERE version = ?", (version,)).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown model version {version}")
+        embeddings = np.frombuffer(row["embeddings"], dtype=row["embeddings_dtype"]).reshape(
+            row["embeddings_rows"], row["embeddings_cols"]
+        )
+        assoc_rules = {}
+        for r in conn.execute(
+            "SELECT src, dst, support, confidence FROM assoc_rules WHERE version = ?", (version,)
+        ):
+            assoc_rules.setdefault(r[0], {})[r[1]] = {"support": r[2], "confidence": r[3]}
+        suggest_index = json.loads(row["suggest_index"]) if row["suggest_index"] else None
+        return {
+            "assoc_rules": assoc_rules,
+            "embeddings": embeddings,
+            "normalized_embeddings": None,
+            "suggest_index": suggest_index,
+            "ann_index": None,
+        }
+
+    def save_model(self, assoc_rules, embeddings, suggest_index=None, ann_index=None, version=None):
+        # the ANN index is not stored in SQLite; workers fall back to exact search
+        version = version or new_model_version()
+        embeddings = np.ascontiguousarray(embeddings)
+        conn = self.connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO models VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    version,
+                    time.time(),
+                    embeddings.tobytes(),
+                    embeddings.dtype.str,
+                    embeddings.shape[0],
+                    embeddings.shape[1],
+                    json.dumps(suggest_index) if suggest_index is not None else None,
+                ),
+            )
+            conn.executemany(
+                "INSERT INTO assoc_rules VALUES (?, ?, ?, ?, ?)",
+                (
+                    (version, a, b, stats.get("support", 0.0), stats.get("confidence", 0.0))
+                    for a, row in assoc_rules.items()
+                    for b, stats in row.items()
+                ),
+            )
+            # the pointer moves in the same transaction the model lands in
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('current_model', ?)", (version,))
+
+            stale = [
+                r[0]
+                for r in conn.execute("SELECT version FROM models ORDER BY created_at DESC").fetchall()[KEEP_MODELS:]
+            ]
+            for old in stale:
+                conn.execute("DELETE FROM assoc_rules WHERE version = ?", (old,))
+                conn.execute("DELETE FROM models WHERE version = ?", (old,))
+        return version
+
+
+def get_backend(data_dir=None):
+    """
+    Backend selected by Config.STORAGE_BACKEND ("files" or "sqlite").
+    `data_dir` overrides Config.DATA_DIR for the file backend.
+    """
+    kind = Config.STORAGE_BACKEND
+    if kind == "files":
+        return FileBackend(data_dir or Config.DATA_DIR)
+    if kind == "sqlite":
+        return SQLiteBackend(Config.SQLITE_PATH)
+    raise ValueError(f"Unknown STORAGE_BACKEND {kind!r}; expected 'files' or 'sqlite'")
+
+
+def migrate_files_to_sqlite(data_dir, db_path, chunksize=200_000):
+    """
+    Copy a CSV/JSON data directory and its live model into a fresh SQLite
+    database. Large CSVs are streamed in chunks.
+    """
+    source = FileBackend(data_dir)
+    db_path = Path(db_path)
+    if db_path.exists():
+        raise FileExistsError(f"{db_path} already exists; remove it or choose another path")
+
+    target = SQLiteBackend(db_path)
+    target.create_schema()
+    conn = target.connect()
+
+    columns = {
+        "customers": ["customer_id", "name", "address", "phone", "email"],
+        "purchases": ["customer_id", "date", "item"],
+        "invoices": ["invoice_id", "customer_id", "date", "total"],
+        "invoice_items": ["invoice_id", "item"],
+    }
+    with conn:
+        for table, cols in columns.items():
+            placeholders = ", ".join("?" for _ in cols)
+            for chunk in pd.read_csv(source.data_dir / f"{table}.csv", chunksize=chunksize):
+                conn.executemany(
+                    f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({placeholders})",
+                    chunk[cols].itertuples(index=False, name=None),
+                )
+
+        catalog = source.load_catalog()
+        conn.executemany("INSERT INTO products VALUES (?)", ((i,) for i in catalog["products"]["item"]))
+        conn.executemany("INSERT INTO item_index VALUES (?, ?)", catalog["item_to_index"].items())
+        conn.executemany("INSERT INTO main_products VALUES (?, ?)", enumerate(catalog["main_products"]))
+        conn.executemany("INSERT INTO prices VALUES (?, ?)", catalog["prices"].items())
+        conn.executemany("INSERT INTO rooms VALUES (?, ?)", catalog["rooms"].items())
+        conn.executemany(
+            "INSERT INTO complements VALUES (?, ?, ?)",
+            ((item, pos, comp) for item, comps in catalog["complements"].items() for pos, comp in enumerate(comps)),
+        )
+
+    if source.has_model():
+        version = source.model_version()
+        model = source.load_model(version)
+        if isinstance(model["assoc_rules"], AssocMatrix):
+            model["assoc_rules"] = model["assoc_rules"].to_dict()
+        target.save_model(model["assoc_rules"], model["embeddings"], model["suggest_index"], version=version)
+    conn.execute("ANALYZE")
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Storage backend utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="copy the CSV/JSON data directory into SQLite")
+    migrate.add_argument("--data-dir", default=str(Config.DATA_DIR))
+    migrate.add_argument("--db", default=str(Config.SQLITE_PATH))
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        started = time.perf_counter()
+        migrate_files_to_sqlite(args.data_dir, args.db)
+        print(f"Migrated {args.data_dir} -> {args.db} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()